@@ -167,7 +167,7 @@ def mypy(session: Session) -> None:
 def tests(session: Session) -> None:
     """Run the test suite."""
     session.install(".")
-    session.install("coverage[toml]", "pytest", "pygments")
+    session.install("coverage[toml]", "pytest", "pygments", "httpx")
     try:
         session.run("coverage", "run", "--parallel", "-m", "pytest", *session.posargs)
     finally:
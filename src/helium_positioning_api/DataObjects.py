@@ -13,6 +13,19 @@ from typing import Optional
 from pydantic import BaseModel
 
 
+class Observation(BaseModel):
+    """Class to describe a hotspot that witnessed an uplink of a device."""
+
+    lat: float
+    lng: float
+    rssi: float
+    snr: float
+    datarate: str
+    frequency: float
+    # hotspot address, used by the fingerprinting model
+    address: str = ""
+
+
 class Prediction(BaseModel):
     """Class to describe a Prediction Object."""
 
@@ -21,10 +34,12 @@ class Prediction(BaseModel):
     lng: Optional[float] = None
     # timestamp: int
     conf: Optional[float] = None
+    # name of the model that produced the prediction
+    model: Optional[str] = None
 
     def __str__(self) -> str:
         """Return a string representation of the object."""
         if self.lat is None or self.lng is None:
             return f"\nuuid: {self.uuid}\nprediction not successful"
         else:
-            return f"\nuuid: {self.uuid}\nlat: {self.lat}\nlng: {self.lng}\nconfidence: {self.conf}"
+            return f"\nuuid: {self.uuid}\nlat: {self.lat}\nlng: {self.lng}\nconfidence: {self.conf}\nmodel: {self.model}"
@@ -8,12 +8,32 @@
 
 """
 
+from typing import List
+from typing import Optional
+from typing import Tuple
+
 import click
+import numpy as np
 import uvicorn
 
-from helium_positioning_api.midpoint import midpoint
-from helium_positioning_api.nearest_neighbor import nearest_neighbor
-from helium_positioning_api.trilateration import trilateration
+from helium_positioning_api.deadline import Deadline
+from helium_positioning_api.deadline import predict_within
+from helium_positioning_api.distance_prediction import build_lookup_table
+from helium_positioning_api.distance_prediction import load_available_models
+from helium_positioning_api.distance_prediction import lookup_table_path
+from helium_positioning_api.evaluation import evaluate as evaluate_models
+from helium_positioning_api.evaluation import format_report
+from helium_positioning_api.fingerprinting import FingerprintIndex
+from helium_positioning_api.fingerprinting import read_fingerprints
+from helium_positioning_api.hotspot_store import HotspotStore
+from helium_positioning_api.models import MODELS
+from helium_positioning_api.server import serve_production
+from helium_positioning_api.synthetic import PathLossModel
+from helium_positioning_api.synthetic import SyntheticNetwork
+from helium_positioning_api.synthetic import generate_uplinks
+from helium_positioning_api.synthetic import write_events
+from helium_positioning_api.training import read_paths
+from helium_positioning_api.training import train as train_models
 
 
 @click.command()
@@ -28,48 +48,290 @@ from helium_positioning_api.trilateration import trilateration
             "midpoint",
             "linear_regression",
             "gradient_boosting",
+            "gradient_boosting_lut",
+            "fingerprinting",
+            "weighted_centroid",
+            "auto",
         ]
     ),
     help="Model to be used to predict the position of the device.",
 )
+@click.option(
+    "--deadline",
+    type=float,
+    help="Latency budget in milliseconds, cheaper models are used to meet it.",
+)
 @click.version_option(version="0.1")
-def predict(uuid: str, model: str) -> None:
+def predict(uuid: str, model: str, deadline: Optional[float]) -> None:
     """Predict the position (lng,lat) of a device with the given uuid.
 
     :param uuid: device id
     :param model: prediction model
+    :param deadline: latency budget in milliseconds
     """
-    if model == "nearest_neighbor":
-        prediction = nearest_neighbor(uuid)
-        print(prediction)
-    elif model == "midpoint":
-        prediction = midpoint(uuid)
-        print(prediction)
-    elif model == "linear_regression":
-        prediction = trilateration(uuid, model="linear_regression")
-        print(prediction)
-    elif model == "gradient_boosting":
-        prediction = trilateration(uuid, model="gradient_boosting")
-        print(prediction)
-    else:
+    if model not in MODELS:
         raise Exception(f"Model {model} not implemented.")
+    if model == "auto":
+        # routing only chooses trilateration with a loaded distance model
+        load_available_models()
+    prediction = predict_within(uuid, model, Deadline(deadline))
+    print(prediction)
 
 
 @click.command()
+@click.option("--host", default="0.0.0.0", type=str)
 @click.option("--port", default=8000, type=int)
+@click.option(
+    "--production",
+    is_flag=True,
+    help="Serve with pre-forked worker processes instead of the reloading development server.",
+)
+@click.option(
+    "--workers",
+    default=1,
+    type=click.IntRange(min=1),
+    envvar="WEB_CONCURRENCY",
+    help="Number of worker processes in production mode.",
+)
+@click.option(
+    "--drain-delay",
+    default=5.0,
+    type=float,
+    help="Seconds to fail the readiness probe before shutting down in production mode.",
+)
 @click.version_option(version="0.1")
-def serve(port: int) -> None:
+def serve(
+    host: str, port: int, production: bool, workers: int, drain_delay: float
+) -> None:
     """Serve a prediction service for the prediction of the position of a device in the Helium network."""
+    if production:
+        try:
+            serve_production(
+                host=host, port=port, workers=workers, drain_delay=drain_delay
+            )
+        except ValueError as exception:
+            raise click.BadParameter(str(exception), param_hint="--workers")
+        return
     uvicorn.run(
         "helium_positioning_api.api:app",
-        host="0.0.0.0",
-        port=8000,
+        host=host,
+        port=port,
         log_level="debug",
         proxy_headers=True,
         reload=True,
     )
 
 
+@click.command(name="build-lut")
+@click.option(
+    "--model",
+    default="gradient_boosting",
+    type=click.Choice(["linear_regression", "gradient_boosting"]),
+    help="Distance model to evaluate.",
+)
+@click.option(
+    "--output",
+    type=click.Path(dir_okay=False),
+    help="File of the lookup table, defaults to <model>_lut.npz in the model path.",
+)
+@click.option(
+    "--samples",
+    default=10000,
+    type=int,
+    help="Random samples to measure the error of the table against the model.",
+)
+def build_lut(model: str, output: Optional[str], samples: int) -> None:
+    """Build a lookup table of a distance model for fast trilateration."""
+    table = build_lookup_table(model, n_samples=samples)
+    path = output or lookup_table_path(model)
+    table.save(path)
+    print(
+        f"Saved lookup table of {model} to {path}\n"
+        f"max error: {table.max_error:.1f} m\n"
+        f"p99 error: {table.p99_error:.1f} m"
+    )
+
+
+@click.command(name="build-fingerprints")
+@click.option(
+    "--input",
+    "input_path",
+    required=True,
+    type=click.Path(exists=True, dir_okay=False),
+    help="JSON lines file of labelled uplinks.",
+)
+@click.option(
+    "--output",
+    required=True,
+    envvar="FINGERPRINT_PATH",
+    type=click.Path(dir_okay=False),
+    help="File of the fingerprint index.",
+)
+def build_fingerprints(input_path: str, output: str) -> None:
+    """Build the fingerprint index of the fingerprinting model."""
+    index = FingerprintIndex.build(read_fingerprints(input_path))
+    index.save(output)
+    print(
+        f"Saved {len(index)} fingerprints of {len(index.hotspots)} hotspots to {output}"
+    )
+
+
+@click.command(name="import-hotspots")
+@click.argument("dumps", nargs=-1, required=True, type=click.Path(exists=True))
+@click.option(
+    "--store",
+    required=True,
+    envvar="HOTSPOT_STORE_PATH",
+    type=click.Path(dir_okay=False),
+    help="Database file of the hotspot store.",
+)
+def import_hotspots(dumps: List[str], store: str) -> None:
+    """Import dumps of hotspots (JSON lines, JSON array or CSV) into the hotspot store."""
+    hotspot_store = HotspotStore(store)
+    for dump in dumps:
+        print(f"Imported {hotspot_store.import_file(dump)} hotspots from {dump}")
+    print(f"{len(hotspot_store)} hotspots in {store}")
+    hotspot_store.close()
+
+
+@click.command()
+@click.argument("inputs", nargs=-1, required=True, type=click.Path(exists=True))
+@click.option(
+    "--output",
+    required=True,
+    type=click.Path(file_okay=False),
+    help="Directory of the trained models and the training report, use a new one to keep the shipped models.",
+)
+@click.option("--chunk-size", default=100000, type=int, help="Records per chunk.")
+@click.option(
+    "--jobs",
+    default=1,
+    type=click.IntRange(min=1),
+    help="Feature extraction processes.",
+)
+@click.option(
+    "--sample-size",
+    default=1000000,
+    type=int,
+    help="Rows the gradient boosted regression is fitted on.",
+)
+@click.option("--epochs", default=1, type=int, help="Passes of the linear regression.")
+def train(
+    inputs: List[str],
+    output: str,
+    chunk_size: int,
+    jobs: int,
+    sample_size: int,
+    epochs: int,
+) -> None:
+    """Train the distance models on labelled uplinks in JSON lines or Parquet files."""
+    report = train_models(
+        read_paths(inputs),
+        output,
+        chunk_size=chunk_size,
+        n_jobs=jobs,
+        sample_size=sample_size,
+        epochs=epochs,
+    )
+    print(f"Trained on {report['rows']} rows, models saved to {output}")
+    for stage, seconds in report["training_seconds"].items():
+        print(f"{stage}: {seconds:.1f} s")
+    for name, metrics in report["models"].items():
+        print(
+            f"{name}: rmse {metrics.get('rmse', float('nan')):.1f} m, "
+            f"p50 latency {metrics['latency_p50_ms']:.2f} ms, "
+            f"p99 latency {metrics['latency_p99_ms']:.2f} ms"
+        )
+
+
+@click.command()
+@click.argument("inputs", nargs=-1, required=True, type=click.Path(exists=True))
+@click.option(
+    "--output",
+    default="evaluation",
+    type=click.Path(file_okay=False),
+    help="Directory of the evaluation report.",
+)
+@click.option(
+    "--model",
+    "models",
+    multiple=True,
+    type=click.Choice(list(MODELS)),
+    help="Model to evaluate, can be repeated. All models by default.",
+)
+@click.option("--chunk-size", default=1000, type=int, help="Events per chunk.")
+@click.option(
+    "--jobs",
+    default=1,
+    type=click.IntRange(min=1),
+    help="Evaluation processes.",
+)
+@click.option("--limit", type=int, help="Maximum number of events to evaluate.")
+def evaluate(
+    inputs: List[str],
+    output: str,
+    models: Tuple[str, ...],
+    chunk_size: int,
+    jobs: int,
+    limit: Optional[int],
+) -> None:
+    """Evaluate the error and the cost of the models on labelled integration events."""
+    report = evaluate_models(
+        read_paths(inputs),
+        output,
+        models=models or None,
+        chunk_size=chunk_size,
+        n_jobs=jobs,
+        limit=limit,
+    )
+    print(format_report(report))
+    print(f"Report saved to {output}")
+
+
+@click.command()
+@click.option(
+    "--output",
+    required=True,
+    type=click.Path(dir_okay=False),
+    help="JSON lines file of the generated integration events.",
+)
+@click.option("--hotspots", default=1000, type=int, help="Number of hotspots.")
+@click.option("--devices", default=10000, type=int, help="Number of devices.")
+@click.option("--uplinks", default=1, type=int, help="Uplinks per device.")
+@click.option(
+    "--region",
+    default=(47.0, 11.8, 47.5, 12.5),
+    type=(float, float, float, float),
+    help="Bounding box MIN_LAT MIN_LNG MAX_LAT MAX_LNG of hotspots and devices.",
+)
+@click.option("--exponent", default=2.7, type=float, help="Path-loss exponent.")
+@click.option(
+    "--shadowing",
+    default=6.0,
+    type=float,
+    help="Standard deviation of the shadowing in dB.",
+)
+@click.option("--seed", default=0, type=int, help="Seed of the random generator.")
+def generate(
+    output: str,
+    hotspots: int,
+    devices: int,
+    uplinks: int,
+    region: Tuple[float, float, float, float],
+    exponent: float,
+    shadowing: float,
+    seed: int,
+) -> None:
+    """Generate synthetic integration events with the true device positions."""
+    rng = np.random.default_rng(seed)
+    network = SyntheticNetwork.generate(hotspots, region, rng)
+    path_loss = PathLossModel(exponent=exponent, shadowing=shadowing)
+    events = generate_uplinks(
+        network, devices, region, rng, path_loss, uplinks_per_device=uplinks
+    )
+    print(f"Wrote {write_events(output, events)} events to {output}")
+
+
 @click.group(
     help="CLI tool to predict the position of a LoraWan device in the Helium network."
 )
@@ -80,6 +342,12 @@ def cli() -> None:
 
 cli.add_command(predict)
 cli.add_command(serve)
+cli.add_command(build_lut)
+cli.add_command(build_fingerprints)
+cli.add_command(import_hotspots)
+cli.add_command(train)
+cli.add_command(evaluate)
+cli.add_command(generate)
 
 if __name__ == "__main__":
     cli()
@@ -0,0 +1,225 @@
+"""Admission module.
+
+.. module:: admission
+
+:synopsis: Admission control and load shedding for the REST api.
+
+.. moduleauthor:: DSIA21
+
+Requests are admitted per class (cheap models, expensive models, batches),
+every class with its own in-flight limit and a short wait queue. Capacity
+of one class cannot be used by another, so cheap requests are served while
+the expensive ones are saturated. Requests that find the queue full are
+rejected right away, requests that wait longer than the queue timeout are
+rejected after it; both with an estimate of when to retry.
+"""
+
+import asyncio
+import logging
+import math
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from functools import partial
+from typing import AsyncIterator
+from typing import Deque
+from typing import Dict
+from typing import Tuple
+
+from helium_positioning_api.deadline import MAX_WORKERS
+from helium_positioning_api.metrics import gauge
+
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+CHEAP = "cheap"
+EXPENSIVE = "expensive"
+BATCH = "batch"
+CHEAP_MODELS = ("nearest_neighbor", "midpoint", "weighted_centroid")
+
+BATCH_CONCURRENCY = 4  # predictions of one batch running at the same time
+
+# (in-flight limit, queue size, queue timeout in seconds) per class; the
+# threads of the deadline pool are split between the classes, a batch uses
+# BATCH_CONCURRENCY of them, so admitted predictions never wait for a thread
+LIMITS: Dict[str, Tuple[int, int, float]] = {
+    CHEAP: (MAX_WORKERS // 2, 64, 0.5),
+    EXPENSIVE: (MAX_WORKERS // 4, 16, 1.0),
+    BATCH: (MAX_WORKERS // 4 // BATCH_CONCURRENCY, 4, 2.0),
+}
+SERVICE_TIME_SMOOTHING = 0.1  # weight of a new observation in the service time
+
+
+class Overloaded(Exception):
+    """Raised when a request is not admitted."""
+
+    def __init__(self, status_code: int, detail: str, retry_after: int) -> None:
+        """Create the exception.
+
+        :param status_code: 429 if the queue was full, 503 if the wait timed out
+        :param detail: reason
+        :param retry_after: seconds after which the client should retry
+        """
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = retry_after
+
+
+class AdmissionClass:
+    """In-flight limit with a bounded first-come first-served wait queue."""
+
+    def __init__(self, name: str, limit: int, queue_size: int, timeout: float) -> None:
+        """Create an idle class.
+
+        :param name: name of the class
+        :param limit: maximum number of requests in flight
+        :param queue_size: maximum number of waiting requests
+        :param timeout: seconds a request waits at most
+        """
+        self.name = name
+        self.limit = limit
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.in_flight = 0
+        self.rejected = 0
+        self.service_time = 0.1
+        self._waiters: Deque["asyncio.Future[None]"] = deque()
+
+    @property
+    def queued(self) -> int:
+        """Return the number of waiting requests."""
+        return len(self._waiters)
+
+    async def acquire(self) -> None:
+        """Wait for a free slot.
+
+        :raises Overloaded: if the queue is full or the wait times out
+        """
+        if self.in_flight < self.limit and not self._waiters:
+            self.in_flight += 1
+            return
+        if len(self._waiters) >= self.queue_size:
+            self.rejected += 1
+            logger.warning(
+                f"Rejected a request of class {self.name}, the queue is full."
+            )
+            raise Overloaded(429, f"Too many {self.name} requests.", self.retry_after())
+        waiter = asyncio.get_event_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            # a released slot is handed over to the waiter, see release
+            await asyncio.wait_for(waiter, self.timeout)
+        except asyncio.TimeoutError:
+            self._discard(waiter)
+            self.rejected += 1
+            logger.warning(
+                f"Rejected a request of class {self.name} after {self.timeout} s."
+            )
+            raise Overloaded(
+                503,
+                f"{self.name.capitalize()} requests overloaded.",
+                self.retry_after(),
+            ) from None
+        except asyncio.CancelledError:
+            self._discard(waiter)
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            raise
+
+    def release(self) -> None:
+        """Hand the slot over to the next waiter or free it."""
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.in_flight -= 1
+
+    def observe(self, seconds: float) -> None:
+        """Update the average service time with a finished request.
+
+        :param seconds: time the request held its slot
+        """
+        self.service_time += SERVICE_TIME_SMOOTHING * (seconds - self.service_time)
+
+    def retry_after(self) -> int:
+        """Return the seconds until the queue in front of a new request is served."""
+        backlog = (len(self._waiters) + 1) * self.service_time / self.limit
+        return max(math.ceil(backlog), 1)
+
+    def _discard(self, waiter: "asyncio.Future[None]") -> None:
+        """Remove a waiter from the queue."""
+        try:
+            self._waiters.remove(waiter)
+        except ValueError:
+            pass
+
+
+class AdmissionController:
+    """Admission classes of the REST api."""
+
+    def __init__(self, limits: Dict[str, Tuple[int, int, float]] = LIMITS) -> None:
+        """Create the classes.
+
+        :param limits: (in-flight limit, queue size, queue timeout) per class
+        """
+        self.classes = {
+            name: AdmissionClass(name, *limit) for name, limit in limits.items()
+        }
+
+    @asynccontextmanager
+    async def admit(self, name: str) -> AsyncIterator[None]:
+        """Hold a slot of a class while the context is active.
+
+        :param name: name of the class
+        :raises Overloaded: if the request is not admitted
+        :return: context holding the slot
+        """
+        admission_class = self.classes[name]
+        await admission_class.acquire()
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            admission_class.observe(time.monotonic() - start)
+            admission_class.release()
+
+    def export_metrics(self) -> None:
+        """Publish the counters of the classes as gauges labelled by class."""
+        for counter in ("in_flight", "queued", "rejected"):
+            gauge(
+                f"admission_{counter}",
+                f"Prediction requests {counter.replace('_', ' ')} per admission class.",
+                ("admission_class",),
+            ).set_function(partial(self._counter, counter))
+
+    def _counter(self, counter: str) -> Dict[Tuple[str, ...], float]:
+        """Return one counter of every class."""
+        return {
+            (name,): float(counts[counter]) for name, counts in self.stats().items()
+        }
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """Return in-flight, queued and rejected requests per class.
+
+        :return: counters by class name
+        """
+        return {
+            name: {
+                "in_flight": admission_class.in_flight,
+                "queued": admission_class.queued,
+                "rejected": admission_class.rejected,
+            }
+            for name, admission_class in self.classes.items()
+        }
+
+
+def model_class(model: str) -> str:
+    """Return the admission class of a model.
+
+    :param model: name of the model
+    :return: name of the class
+    """
+    return CHEAP if model in CHEAP_MODELS else EXPENSIVE
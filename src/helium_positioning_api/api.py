@@ -8,76 +8,1077 @@
 
 """
 
+import asyncio
+import logging
+import math
+from contextlib import asynccontextmanager
+from dataclasses import asdict
+from typing import Any
+from typing import AsyncIterator
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Tuple
+from typing import Type
+from typing import Union
+
+from fastapi import Depends
 from fastapi import FastAPI
 from fastapi import HTTPException
+from fastapi import Query
+from fastapi import Request
+from fastapi import Response
+from fastapi.responses import JSONResponse
+from fastapi.responses import PlainTextResponse
+from fastapi.responses import RedirectResponse
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
+from pydantic import ValidationError
+from starlette.concurrency import run_in_threadpool
 
+from helium_positioning_api.admission import BATCH
+from helium_positioning_api.admission import BATCH_CONCURRENCY
+from helium_positioning_api.admission import AdmissionController
+from helium_positioning_api.admission import Overloaded
+from helium_positioning_api.admission import model_class
+from helium_positioning_api.auxilary import get_setting
+from helium_positioning_api.binary_protocol import MEDIA_TYPE
+from helium_positioning_api.binary_protocol import decode_request
+from helium_positioning_api.binary_protocol import encode_prediction
+from helium_positioning_api.binary_protocol import encode_predictions
+from helium_positioning_api.binary_protocol import is_msgpack
+from helium_positioning_api.DataObjects import Observation
 from helium_positioning_api.DataObjects import Prediction
-from helium_positioning_api.midpoint import midpoint
-from helium_positioning_api.nearest_neighbor import nearest_neighbor
-from helium_positioning_api.trilateration import trilateration
+from helium_positioning_api.deadline import Deadline
+from helium_positioning_api.deadline import DeadlineExceeded
+from helium_positioning_api.deadline import predict_within
+from helium_positioning_api.distance_prediction import disable_batching
+from helium_positioning_api.distance_prediction import enable_batching
+from helium_positioning_api.distance_prediction import load_available_models
+from helium_positioning_api.distance_prediction import models_loaded
+from helium_positioning_api.fingerprinting import load_index
+from helium_positioning_api.geofence import GeofenceEngine
+from helium_positioning_api.history import PositionHistory
+from helium_positioning_api.listeners import add_listener
+from helium_positioning_api.metrics import render
+from helium_positioning_api.models import MODELS
+from helium_positioning_api.models import to_hotspots
+from helium_positioning_api.prefetch import PredictionCache
+from helium_positioning_api.prefetch import Prefetcher
+from helium_positioning_api.prefetch import configured_prefetcher
+from helium_positioning_api.prefetch import configured_ttl
+from helium_positioning_api.registry import PositionRegistry
+from helium_positioning_api.server import worker_count
+from helium_positioning_api.sharding import FORWARDED_HEADER
+from helium_positioning_api.sharding import REDIRECT
+from helium_positioning_api.sharding import Cluster
+from helium_positioning_api.sharding import NotOwner
+from helium_positioning_api.sharding import configured_cluster
+from helium_positioning_api.spatial_index import GridIndex
+from helium_positioning_api.streaming import PositionBroker
+from helium_positioning_api.streaming import event_stream
+from helium_positioning_api.tiles import TileAggregates
+
 
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
 
 app = FastAPI(title="Helium Positioning API")
+app.state.started = False
+app.state.draining = False
+
+broker = PositionBroker()
+history: Optional[PositionHistory] = None
+# latest position of every device, persisted if REGISTRY_PATH is set
+registry: Optional[PositionRegistry] = None
+# latest position of every device predicted by this process
+device_index = GridIndex()
+add_listener(device_index.update_prediction)
+# enter and exit events of the predicted devices
+geofences = GeofenceEngine()
+add_listener(geofences.update_prediction)
+# device density of the map tiles
+tile_aggregates = TileAggregates()
+add_listener(tile_aggregates.update_prediction)
+# in-flight limits of the prediction endpoints
+admission = AdmissionController()
+admission.export_metrics()
+# media type of request bodies that are not MessagePack
+JSON = "application/json"
+# predictions served until PREDICTION_TTL ends, refreshed if PREFETCH_BUDGET is set
+prediction_cache = PredictionCache()
+prediction_cache.export_metrics()
+prefetcher: Optional[Prefetcher] = None
+# members of the cluster the devices are sharded across if SHARD_SELF is set
+cluster: Optional[Cluster] = None
+
+
+def single_worker() -> None:
+    """Fail requests for state that every worker process keeps on its own.
+
+    The latest positions, geofences, tiles and subscriptions of a worker
+    only know the predictions made by that worker.
+    """
+    if worker_count() > 1:
+        raise HTTPException(
+            status_code=503,
+            detail="Only available with a single worker process.",
+        )
+
+
+# dependencies of the endpoints serving per-process state
+PER_PROCESS = [Depends(single_worker)]
 
 
 class Device(BaseModel):
     """Class for device object."""
 
     uuid: str
+    # latency budget of the request, cheaper models are used to meet it
+    deadline_ms: Optional[float] = None
+
+
+class DeviceBatch(BaseModel):
+    """Class for a batch of devices predicted with the same model."""
+
+    model: str = "nearest_neighbor"
+    uuids: List[str]
+    # latency budget of the whole batch
+    deadline_ms: Optional[float] = None
+
+
+class Observations(BaseModel):
+    """Class for the hotspots that witnessed an uplink of a device."""
+
+    model: str = "nearest_neighbor"
+    observations: List[Observation]
+    # predictions with a device id are recorded like the other predictions
+    uuid: Optional[str] = None
+    deadline_ms: Optional[float] = None
+
+
+class Fence(BaseModel):
+    """Class for a geofence polygon."""
+
+    id: str
+    # (lat, lng) vertices
+    polygon: List[Tuple[float, float]]
+
+
+class Member(BaseModel):
+    """Class for a member of the cluster."""
+
+    # base url of the instance
+    member: str
+
+
+class Position(BaseModel):
+    """Class for the latest position of a device handed over to its new owner."""
+
+    uuid: str
+    lat: float
+    lng: float
+    conf: Optional[float] = None
+    model: Optional[str] = None
+    timestamp: Optional[int] = None
+
+
+def request_body(schema: Type[BaseModel]) -> Dict[str, Any]:
+    """Return the OpenAPI request body of an endpoint accepting JSON and MessagePack.
+
+    :param schema: pydantic model of the body
+    :return: OpenAPI extra for the path operation
+    """
+    content = {"schema": schema.schema()}
+    return {
+        "requestBody": {
+            "required": True,
+            "content": {JSON: content, MEDIA_TYPE: content},
+        }
+    }
+
+
+async def read_msgpack_body(request: Request) -> Optional[Dict[str, Any]]:
+    """Return the decoded body of a MessagePack request.
+
+    MessagePack bodies are not validated by pydantic, the endpoints only
+    check the fields they use. Bodies that are neither JSON nor MessagePack
+    are rejected.
+
+    :param request: Request
+    :return: decoded body or None if the body is JSON
+    """
+    content_type = request.headers.get("content-type")
+    if not is_msgpack(content_type):
+        media_type = (content_type or JSON).split(";")[0].strip().lower()
+        if media_type != JSON:
+            raise HTTPException(status_code=415, detail="Unsupported media type.")
+        return None
+    try:
+        data = decode_request(await request.body())
+    except ValueError as exception:
+        raise HTTPException(status_code=400, detail=str(exception))
+    if not isinstance(data, dict):
+        raise HTTPException(status_code=422, detail="Body must be a map.")
+    return data
+
+
+def read_deadline(value: Any) -> Optional[float]:
+    """Return the deadline of a MessagePack body.
+
+    :param value: ``deadline_ms`` field of the body
+    :return: deadline in milliseconds or None
+    """
+    if value is not None and (
+        isinstance(value, bool) or not isinstance(value, (int, float))
+    ):
+        raise HTTPException(status_code=422, detail="deadline_ms must be a number.")
+    return value
+
+
+async def read_device(request: Request) -> Device:
+    """Return the device of a JSON or MessagePack request.
+
+    Requests for devices owned by a peer are sent to it.
+
+    :param request: Request
+    :return: Device
+    """
+    data = await read_msgpack_body(request)
+    if data is not None:
+        if not isinstance(data.get("uuid"), str):
+            raise HTTPException(status_code=422, detail="uuid must be a string.")
+        device = Device.construct(
+            uuid=data["uuid"], deadline_ms=read_deadline(data.get("deadline_ms"))
+        )
+    else:
+        try:
+            device = Device.parse_raw(await request.body())
+        except ValidationError as exception:
+            raise HTTPException(status_code=422, detail=exception.errors())
+    await route_device(request, device.uuid)
+    return device
+
+
+async def route_device(request: Request, uuid: str) -> None:
+    """Serve a device request locally unless the device is owned by a peer.
+
+    :param request: Request
+    :param uuid: Device id
+    :raises NotOwner: if a peer owns the device
+    """
+    if cluster is not None and (owner := cluster.route(uuid, request.headers)):
+        raise NotOwner(owner, await request.body())
+
+
+@app.exception_handler(NotOwner)
+async def send_to_owner(request: Request, exception: NotOwner) -> Response:
+    """Forward a request to the owner of its device or redirect the client.
+
+    :param request: Request for a device owned by a peer
+    :param exception: NotOwner naming the peer
+    :return: response of the owner or a redirect to it
+    """
+    path = request.url.path
+    if request.url.query:
+        path += f"?{request.url.query}"
+    if cluster is None or cluster.mode == REDIRECT:
+        return RedirectResponse(exception.owner + path, status_code=307)
+    try:
+        status, headers, content = await run_in_threadpool(
+            cluster.forward,
+            exception.owner,
+            request.method,
+            path,
+            exception.body,
+            request.headers,
+        )
+    except ConnectionError as error:
+        return JSONResponse({"detail": str(error)}, status_code=502)
+    return Response(content, status_code=status, media_type=headers.get("content-type"))
+
+
+async def read_device_batch(request: Request) -> DeviceBatch:
+    """Return the device batch of a JSON or MessagePack request.
+
+    :param request: Request
+    :return: DeviceBatch
+    """
+    data = await read_msgpack_body(request)
+    if data is not None:
+        uuids = data.get("uuids")
+        if not isinstance(uuids, list) or not all(isinstance(u, str) for u in uuids):
+            raise HTTPException(status_code=422, detail="uuids must be strings.")
+        model = data.get("model", "nearest_neighbor")
+        deadline_ms = read_deadline(data.get("deadline_ms"))
+        return DeviceBatch.construct(model=model, uuids=uuids, deadline_ms=deadline_ms)
+    try:
+        return DeviceBatch.parse_raw(await request.body())
+    except ValidationError as exception:
+        raise HTTPException(status_code=422, detail=exception.errors())
+
+
+@asynccontextmanager
+async def admitted(name: str) -> AsyncIterator[None]:
+    """Hold a slot of an admission class or reject the request.
+
+    :param name: name of the admission class
+    :return: context holding the slot
+    """
+    try:
+        async with admission.admit(name):
+            yield
+    except Overloaded as exception:
+        raise HTTPException(
+            status_code=exception.status_code,
+            detail=exception.detail,
+            headers={"Retry-After": str(exception.retry_after)},
+        )
+
+
+async def predict_device(uuid: str, model: str, deadline: Deadline) -> Prediction:
+    """Predict the position of a device in a worker thread within a deadline.
+
+    Cached predictions are served right away. Predictions of a fallback
+    model are not cached.
+
+    :param uuid: Device id
+    :param model: name of the requested model
+    :param deadline: remaining budget of the request
+    :return: Prediction naming the model that produced it
+    """
+    cached = prediction_cache.get(uuid, model)
+    if cached is not None:
+        return cached
+    async with admitted(model_class(model)):
+        try:
+            prediction = await run_in_threadpool(predict_within, uuid, model, deadline)
+        except DeadlineExceeded as exception:
+            raise HTTPException(status_code=504, detail=str(exception))
+    if deadline.budget_ms is None or prediction.model == model:
+        prediction_cache.put(uuid, model, prediction)
+    return prediction
+
+
+async def read_observations(request: Request) -> Observations:
+    """Return the observations of a JSON or MessagePack request.
+
+    :param request: Request
+    :return: Observations
+    """
+    data = await read_msgpack_body(request)
+    try:
+        if data is not None:
+            return Observations.parse_obj(data)
+        return Observations.parse_raw(await request.body())
+    except ValidationError as exception:
+        raise HTTPException(status_code=422, detail=exception.errors())
+
+
+def respond(request: Request, prediction: Prediction) -> Union[Prediction, Response]:
+    """Return the prediction in the media type accepted by the client.
+
+    :param request: Request
+    :param prediction: Prediction
+    :return: MessagePack response or the prediction for JSON encoding
+    """
+    if is_msgpack(request.headers.get("accept")):
+        return Response(
+            content=encode_prediction(prediction),
+            media_type=MEDIA_TYPE,
+            headers={"X-Model": prediction.model or ""},
+        )
+    return prediction
+
+
+def respond_batch(
+    request: Request, predictions: List[Prediction]
+) -> Union[List[Prediction], Response]:
+    """Return the predictions in the media type accepted by the client.
+
+    :param request: Request
+    :param predictions: Predictions
+    :return: MessagePack response or the predictions for JSON encoding
+    """
+    if is_msgpack(request.headers.get("accept")):
+        return Response(content=encode_predictions(predictions), media_type=MEDIA_TYPE)
+    return predictions
+
+
+@app.on_event("startup")
+def startup() -> None:
+    """Load the distance models unless they were preloaded by the server.
+
+    Predictions are recorded in the position history if ``HISTORY_PATH`` is set,
+    the latest positions are persisted if ``REGISTRY_PATH`` is set, distance
+    predictions of concurrent requests are batched if
+    ``BATCH_WINDOW_MS`` is set. The tile aggregates start from the latest
+    positions in the registry. The instance joins the cluster if
+    ``SHARD_SELF`` is set. Predictions are cached if ``PREDICTION_TTL`` is
+    set and refreshed in the background if ``PREFETCH_BUDGET`` is set.
+    """
+    if batch_window := get_setting("BATCH_WINDOW_MS"):
+        enable_batching(float(batch_window), int(get_setting("BATCH_MAX_ROWS") or 256))
+    load_artifacts()
+    global history
+    if history is None and (history_path := get_setting("HISTORY_PATH")):
+        history = PositionHistory(history_path)
+        add_listener(history.append_prediction)
+    global registry
+    if registry is None:
+        registry = PositionRegistry(get_setting("REGISTRY_PATH"))
+        add_listener(registry.update_prediction)
+        latest = registry.snapshot()
+        tile_aggregates.load(
+            latest["uuid"], latest["lat"], latest["lng"], latest["timestamp"]
+        )
+    join_cluster()
+    start_prefetching()
+    app.state.started = True
+
+
+def load_artifacts() -> None:
+    """Load the distance models, the lookup table and the fingerprint index."""
+    load_available_models()
+    if get_setting("FINGERPRINT_PATH"):
+        try:
+            load_index()
+        except FileNotFoundError as exception:
+            logger.warning(f"Fingerprint index could not be loaded: {exception}")
+
+
+def start_prefetching() -> None:
+    """Cache predictions and start refreshing the hot devices as configured."""
+    global prefetcher
+    prediction_cache.ttl = configured_ttl()
+    if prefetcher is None:
+        prefetcher = configured_prefetcher(prediction_cache)
+    if prefetcher is not None:
+        prefetcher.start()
+
+
+def join_cluster() -> None:
+    """Join the configured cluster and take over the positions of its devices."""
+    global cluster
+    if cluster is None and (cluster := configured_cluster()) is not None:
+        received = receive_positions(cluster.announce())
+        logger.info(f"Joined {cluster.peers} as {cluster.url}, received {received}.")
+
+
+def registry_positions(member: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Return the latest positions of the registry.
+
+    :param member: only the devices owned by this member if set
+    :return: positions as handed over to other members
+    """
+    if registry is None:
+        return []
+    latest = registry.snapshot()
+    if member is None or cluster is None:
+        slots: Any = range(len(latest["uuid"]))
+    else:
+        slots = cluster.owned_by(latest["uuid"], member)
+    return [
+        {
+            "uuid": latest["uuid"][slot],
+            "lat": float(latest["lat"][slot]),
+            "lng": float(latest["lng"][slot]),
+            "conf": None
+            if math.isnan(latest["conf"][slot])
+            else float(latest["conf"][slot]),
+            "model": latest["model"][slot],
+            "timestamp": int(latest["timestamp"][slot]),
+        }
+        for slot in slots
+    ]
+
+
+def receive_positions(positions: List[Dict[str, Any]]) -> int:
+    """Take over the latest positions of devices handed over by a member.
+
+    Positions older than the one already known for a device are ignored.
+
+    :param positions: positions as returned by :func:`registry_positions`
+    :return: number of positions taken over
+    """
+    received = 0
+    for position in positions:
+        uuid, lat, lng = position["uuid"], position["lat"], position["lng"]
+        timestamp = position.get("timestamp")
+        known = None if registry is None else registry.timestamp(uuid)
+        if known is not None and (timestamp is None or known >= timestamp):
+            continue
+        if registry is not None:
+            registry.update(
+                uuid, lat, lng, position.get("conf"), position.get("model"), timestamp
+            )
+        device_index.update(uuid, lat, lng)
+        tile_aggregates.update(uuid, lat, lng, timestamp)
+        received += 1
+    return received
+
+
+@app.on_event("shutdown")
+def shutdown() -> None:
+    """Stop pushing predictions and batching, leave the cluster, write the stores."""
+    broker.stop()
+    disable_batching()
+    if prefetcher is not None:
+        prefetcher.stop()
+    if cluster is not None:
+        cluster.withdraw(registry_positions())
+    if history is not None:
+        history.flush()
+    if registry is not None:
+        registry.close()
+
+
+@app.get("/healthz", status_code=200)
+async def healthz() -> Dict[str, str]:
+    """Liveness probe.
+
+    :return: status of the process
+    """
+    return {"status": "alive"}
+
+
+@app.get("/readyz", status_code=200)
+async def readyz(response: Response) -> Dict[str, Any]:
+    """Readiness probe, fails while starting up and while draining on shutdown.
+
+    :param response: response to set the status code on
+    :return: readiness of the process
+    """
+    ready = app.state.started and not app.state.draining
+    if not ready:
+        response.status_code = 503
+    return {
+        "ready": ready,
+        "draining": app.state.draining,
+        "models_loaded": models_loaded(),
+    }
+
+
+@app.get("/metrics", status_code=200, response_class=PlainTextResponse)
+async def metrics() -> str:
+    """Return the metrics of the process in the Prometheus text format.
+
+    :return: metrics
+    """
+    return render()
 
 
 # nearest neighbor model
-@app.post("/predict_tf/", status_code=200)
-async def predict_tf(request: Device) -> Prediction:
+@app.post("/predict_tf/", status_code=200, openapi_extra=request_body(Device))
+async def predict_tf(request: Request) -> Union[Prediction, Response]:
     """Create a prediction with Nearest Neighbor model.
 
-    :param request: Device
+    :param request: Request with a Device body
     :return: predicted coordinates
     """
-    prediction = nearest_neighbor(uuid=request.uuid)
+    device = await read_device(request)
+    prediction = await predict_device(
+        device.uuid, "nearest_neighbor", Deadline(device.deadline_ms)
+    )
     if not prediction:
         raise HTTPException(status_code=404, detail="Device not found.")
-    return prediction
+    return respond(request, prediction)
 
 
 # midpoint model
-@app.post("/predict_mp/", status_code=200)
-async def predict_mp(request: Device) -> Prediction:
+@app.post("/predict_mp/", status_code=200, openapi_extra=request_body(Device))
+async def predict_mp(request: Request) -> Union[Prediction, Response]:
     """Create a prediction with the Midpoint model.
 
-    :param request: Device
+    :param request: Request with a Device body
     :return: predicted coordinates
     """
-    prediction = midpoint(uuid=request.uuid)
+    device = await read_device(request)
+    prediction = await predict_device(
+        device.uuid, "midpoint", Deadline(device.deadline_ms)
+    )
     if not prediction:
         raise HTTPException(status_code=404, detail="Device not found.")
-    return prediction
+    return respond(request, prediction)
 
 
 # trilateration with linear regression
-@app.post("/predict_tl_lin/", status_code=200)
-async def predict_tl_lin(request: Device) -> Prediction:
+@app.post("/predict_tl_lin/", status_code=200, openapi_extra=request_body(Device))
+async def predict_tl_lin(request: Request) -> Union[Prediction, Response]:
     """Create a prediction with the Trialteratioin model, using a linear regression distance estimator.
 
-    :param request: Device
+    :param request: Request with a Device body
     :return: predicted coordinates
     """
-    prediction = trilateration(uuid=request.uuid, model="linear_regression")
+    device = await read_device(request)
+    prediction = await predict_device(
+        device.uuid, "linear_regression", Deadline(device.deadline_ms)
+    )
     if not prediction:
         raise HTTPException(status_code=404, detail="Device not found.")
-    return prediction
+    return respond(request, prediction)
 
 
 # trilateration with gradient boost
-@app.post("/predict_tl_grad/", status_code=200)
-async def predict_tl_grad(request: Device) -> Prediction:
+@app.post("/predict_tl_grad/", status_code=200, openapi_extra=request_body(Device))
+async def predict_tl_grad(request: Request) -> Union[Prediction, Response]:
     """Create a prediction with the Midpoint model, using a gradient boosted regression for distance estimaton.
 
-    :param request: Device
+    :param request: Request with a Device body
     :return: predicted coordinates
     """
-    prediction = trilateration(uuid=request.uuid, model="gradient_boosting")
+    device = await read_device(request)
+    prediction = await predict_device(
+        device.uuid, "gradient_boosting", Deadline(device.deadline_ms)
+    )
     if not prediction:
         raise HTTPException(status_code=404, detail="Device not found.")
+    return respond(request, prediction)
+
+
+# trilateration with a gradient boost lookup table
+@app.post("/predict_tl_lut/", status_code=200, openapi_extra=request_body(Device))
+async def predict_tl_lut(request: Request) -> Union[Prediction, Response]:
+    """Create a prediction with the Trilateration model, using a lookup table of the gradient boosted regression.
+
+    :param request: Request with a Device body
+    :return: predicted coordinates
+    """
+    device = await read_device(request)
+    prediction = await predict_device(
+        device.uuid, "gradient_boosting_lut", Deadline(device.deadline_ms)
+    )
+    if not prediction:
+        raise HTTPException(status_code=404, detail="Device not found.")
+    return respond(request, prediction)
+
+
+# fingerprinting
+@app.post("/predict_fp/", status_code=200, openapi_extra=request_body(Device))
+async def predict_fp(request: Request) -> Union[Prediction, Response]:
+    """Create a prediction with the Fingerprinting model.
+
+    Fails with 503 if no fingerprint index is configured or it cannot be loaded.
+
+    :param request: Request with a Device body
+    :return: predicted coordinates
+    """
+    device = await read_device(request)
+    try:
+        await run_in_threadpool(load_index)
+    except (ValueError, OSError) as exception:
+        raise HTTPException(status_code=503, detail=str(exception))
+    prediction = await predict_device(
+        device.uuid, "fingerprinting", Deadline(device.deadline_ms)
+    )
+    if not prediction:
+        raise HTTPException(status_code=404, detail="Device not found.")
+    return respond(request, prediction)
+
+
+# weighted centroid model
+@app.post("/predict_wc/", status_code=200, openapi_extra=request_body(Device))
+async def predict_wc(request: Request) -> Union[Prediction, Response]:
+    """Create a prediction with the Weighted Centroid model over all witnesses.
+
+    :param request: Request with a Device body
+    :return: predicted coordinates
+    """
+    device = await read_device(request)
+    prediction = await predict_device(
+        device.uuid, "weighted_centroid", Deadline(device.deadline_ms)
+    )
+    if not prediction:
+        raise HTTPException(status_code=404, detail="Device not found.")
+    return respond(request, prediction)
+
+
+# cheapest model for the witness geometry
+@app.post("/predict_auto/", status_code=200, openapi_extra=request_body(Device))
+async def predict_auto(request: Request) -> Union[Prediction, Response]:
+    """Create a prediction with the cheapest model expected to be accurate enough.
+
+    :param request: Request with a Device body
+    :return: predicted coordinates and the model that produced them
+    """
+    device = await read_device(request)
+    prediction = await predict_device(device.uuid, "auto", Deadline(device.deadline_ms))
+    if not prediction:
+        raise HTTPException(status_code=404, detail="Device not found.")
+    return respond(request, prediction)
+
+
+# any model on hotspot observations, without contacting the Console
+@app.post(
+    "/predict_observations/",
+    status_code=200,
+    openapi_extra=request_body(Observations),
+)
+async def predict_observations(request: Request) -> Union[Prediction, Response]:
+    """Create a prediction from the hotspots that witnessed an uplink.
+
+    :param request: Request with an Observations body
+    :return: predicted coordinates
+    """
+    body = await read_observations(request)
+    if body.model not in MODELS:
+        raise HTTPException(status_code=404, detail="Model not found.")
+    if not body.observations:
+        raise HTTPException(status_code=422, detail="No hotspot observations given.")
+    async with admitted(model_class(body.model)):
+        try:
+            prediction = await run_in_threadpool(
+                predict_within,
+                body.uuid or "",
+                body.model,
+                Deadline(body.deadline_ms),
+                to_hotspots(body.observations),
+                body.uuid is not None,
+            )
+        except DeadlineExceeded as exception:
+            raise HTTPException(status_code=504, detail=str(exception))
+        except ValueError as exception:
+            raise HTTPException(status_code=422, detail=str(exception))
+    return respond(request, prediction)
+
+
+# many devices with one model
+@app.post("/predict_batch/", status_code=200, openapi_extra=request_body(DeviceBatch))
+async def predict_batch(request: Request) -> Union[List[Prediction], Response]:
+    """Create predictions for many devices with the same model.
+
+    Devices that cannot be predicted are returned without coordinates.
+
+    :param request: Request with a DeviceBatch body
+    :return: predicted coordinates in the order of the uuids
+    """
+    batch = await read_device_batch(request)
+    if batch.model not in MODELS:
+        raise HTTPException(status_code=404, detail="Model not found.")
+    deadline = Deadline(batch.deadline_ms)
+    semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+    async def predict_one(uuid: str) -> Prediction:
+        async with semaphore:
+            try:
+                return await run_in_threadpool(
+                    predict_within, uuid, batch.model, deadline
+                )
+            except (ValueError, DeadlineExceeded) as exception:
+                logger.warning(f"Prediction of device {uuid} failed: {exception}")
+                return Prediction(uuid=uuid)
+
+    async with admitted(BATCH):
+        predictions = await asyncio.gather(*map(predict_one, batch.uuids))
+    return respond_batch(request, list(predictions))
+
+
+# push of changed predictions
+@app.get("/subscribe/", status_code=200, dependencies=PER_PROCESS)
+async def subscribe(
+    uuids: List[str] = Query(...),  # noqa: B008
+    model: str = "nearest_neighbor",
+) -> StreamingResponse:
+    """Stream changed predictions of devices as Server-Sent Events.
+
+    The devices are polled for new integrations; a ``prediction`` event is
+    sent whenever a new integration changes the prediction of a device.
+
+    :param uuids: Device ids
+    :param model: name of the model
+    :return: stream of ``prediction`` events
+    """
+    if model not in MODELS:
+        raise HTTPException(status_code=404, detail="Model not found.")
+    queue = broker.subscribe(uuids, model)
+    return StreamingResponse(
+        event_stream(broker, queue),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache"},
+    )
+
+
+# position history
+@app.get("/history/{uuid}", status_code=200)
+async def get_history(
+    request: Request, uuid: str, start: int = 0, end: Optional[int] = None
+) -> List[Dict[str, Any]]:
+    """Return the recorded positions of a device in a time range.
+
+    :param request: Request
+    :param uuid: Device id
+    :param start: first timestamp in milliseconds
+    :param end: timestamp in milliseconds after the last one
+    :return: positions ordered by time
+    """
+    await route_device(request, uuid)
+    if history is None:
+        raise HTTPException(status_code=404, detail="Position history disabled.")
+    track = history.track(uuid, start, end)
+    return [
+        {
+            "timestamp": int(timestamp),
+            "lat": None if math.isnan(lat) else float(lat),
+            "lng": None if math.isnan(lng) else float(lng),
+            "conf": None if math.isnan(conf) else float(conf),
+            "model": model,
+        }
+        for timestamp, lat, lng, conf, model in zip(
+            track["timestamp"],
+            track["lat"],
+            track["lng"],
+            track["conf"],
+            track["model"],
+        )
+    ]
+
+
+# spatial queries over the latest positions
+@app.get("/devices/nearby", status_code=200, dependencies=PER_PROCESS)
+async def devices_nearby(lat: float, lng: float, radius: float) -> List[Dict[str, Any]]:
+    """Return the devices within a radius around a position, nearest first.
+
+    :param lat: latitude of the centre
+    :param lng: longitude of the centre
+    :param radius: radius in meters
+    :return: devices with their latest position and distance in meters
+    """
+    return [
+        {"uuid": uuid, "lat": d_lat, "lng": d_lng, "distance": distance}
+        for uuid, d_lat, d_lng, distance in device_index.within_radius(lat, lng, radius)
+    ]
+
+
+@app.get("/devices/within", status_code=200, dependencies=PER_PROCESS)
+async def devices_within(
+    min_lat: float, min_lng: float, max_lat: float, max_lng: float
+) -> List[Dict[str, Any]]:
+    """Return the devices inside a bounding box.
+
+    :param min_lat: southern edge
+    :param min_lng: western edge
+    :param max_lat: northern edge
+    :param max_lng: eastern edge
+    :return: devices with their latest position
+    """
+    return [
+        {"uuid": uuid, "lat": d_lat, "lng": d_lng}
+        for uuid, d_lat, d_lng in device_index.within_bbox(
+            min_lat, min_lng, max_lat, max_lng
+        )
+    ]
+
+
+@app.get("/devices/nearest", status_code=200, dependencies=PER_PROCESS)
+async def devices_nearest(
+    lat: float, lng: float, k: int = Query(10, ge=1)  # noqa: B008
+) -> List[Dict[str, Any]]:
+    """Return the k devices nearest to a position, nearest first.
+
+    :param lat: latitude of the position
+    :param lng: longitude of the position
+    :param k: number of devices, at least 1
+    :return: devices with their latest position and distance in meters
+    """
+    nearest = await run_in_threadpool(device_index.nearest, lat, lng, k)
+    return [
+        {"uuid": uuid, "lat": d_lat, "lng": d_lng, "distance": distance}
+        for uuid, d_lat, d_lng, distance in nearest
+    ]
+
+
+# geofences over the predicted positions
+@app.post("/geofences/", status_code=201, dependencies=PER_PROCESS)
+async def add_geofence(fence: Fence) -> Fence:
+    """Register a geofence or replace the polygon of a registered one.
+
+    :param fence: id and polygon of the fence
+    :return: registered fence
+    """
+    try:
+        geofences.add(fence.id, fence.polygon)
+    except ValueError as exception:
+        raise HTTPException(status_code=422, detail=str(exception))
+    return fence
+
+
+@app.get("/geofences/", status_code=200, dependencies=PER_PROCESS)
+async def list_geofences() -> List[Fence]:
+    """Return the registered geofences.
+
+    :return: fences
+    """
+    return [Fence(id=fence.id, polygon=fence.polygon) for fence in geofences.fences()]
+
+
+@app.get("/geofences/events", status_code=200, dependencies=PER_PROCESS)
+async def geofence_events(since: int = 0, limit: int = 1000) -> List[Dict[str, Any]]:
+    """Return the recent enter and exit events, oldest first.
+
+    Clients poll with the ``sequence`` of the last event they have seen.
+
+    :param since: sequence number of the last seen event
+    :param limit: maximum number of events
+    :return: events
+    """
+    return [asdict(event) for event in geofences.events(since, limit)]
+
+
+@app.get("/geofences/devices/{uuid}", status_code=200, dependencies=PER_PROCESS)
+async def device_geofences(request: Request, uuid: str) -> List[str]:
+    """Return the geofences a device is inside of.
+
+    :param request: Request
+    :param uuid: Device id
+    :return: fence ids
+    """
+    await route_device(request, uuid)
+    return sorted(geofences.inside(uuid))
+
+
+@app.delete("/geofences/{fence_id}", status_code=204, dependencies=PER_PROCESS)
+async def remove_geofence(fence_id: str) -> Response:
+    """Unregister a geofence.
+
+    :param fence_id: id of the fence
+    :return: empty response
+    """
+    try:
+        geofences.remove(fence_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Geofence not found.")
+    return Response(status_code=204)
+
+
+@app.get("/tiles", status_code=200, dependencies=PER_PROCESS)
+async def get_tiles(
+    zoom: int, min_lat: float, min_lng: float, max_lat: float, max_lng: float
+) -> Dict[str, Any]:
+    """Return the device counts of the map tiles in a viewport.
+
+    :param zoom: zoom level of the tiles
+    :param min_lat: southern edge
+    :param min_lng: western edge, east of ``max_lng`` across the antimeridian
+    :param max_lat: northern edge
+    :param max_lng: eastern edge
+    :return: zoom level and the tiles with devices
+    """
+    try:
+        tiles = tile_aggregates.viewport(zoom, min_lat, min_lng, max_lat, max_lng)
+    except ValueError as exception:
+        raise HTTPException(status_code=422, detail=str(exception))
+    return {"zoom": zoom, "tiles": tiles}
+
+
+@app.get("/devices/{uuid}/latest", status_code=200, dependencies=PER_PROCESS)
+async def device_latest(request: Request, uuid: str) -> Prediction:
+    """Return the latest predicted position of a device.
+
+    :param request: Request
+    :param uuid: Device id
+    :return: latest Prediction
+    """
+    await route_device(request, uuid)
+    prediction = None if registry is None else registry.get(uuid)
+    if prediction is None:
+        raise HTTPException(status_code=404, detail="Device not found.")
     return prediction
+
+
+def sharded() -> Cluster:
+    """Return the cluster or fail if the devices are not sharded.
+
+    :return: Cluster
+    """
+    if cluster is None:
+        raise HTTPException(status_code=404, detail="Sharding disabled.")
+    return cluster
+
+
+def cluster_member(request: Request) -> None:
+    """Fail cluster requests that do not carry the secret of the members.
+
+    :param request: Request
+    """
+    if not sharded().authenticated(request.headers):
+        raise HTTPException(status_code=403, detail="Invalid shard token.")
+
+
+MEMBERS_ONLY = [Depends(cluster_member)]
+
+
+# membership of the cluster the devices are sharded across
+@app.get("/cluster/members", status_code=200, dependencies=MEMBERS_ONLY)
+async def cluster_members() -> Dict[str, Any]:
+    """Return the members of the cluster as seen by this instance.
+
+    :return: own url, members, sharding mode and version of the ring
+    """
+    members = sharded()
+    return {
+        "self": members.url,
+        "members": members.ring.members,
+        "mode": members.mode,
+        "version": members.ring.version,
+    }
+
+
+@app.post("/cluster/members", status_code=200, dependencies=MEMBERS_ONLY)
+async def join_member(request: Request, member: Member) -> Dict[str, Any]:
+    """Add a member to the cluster.
+
+    Changes not sent by a member are passed on to the other members.
+
+    :param request: Request
+    :param member: base url of the new member
+    :return: members of the cluster
+    """
+    if sharded().join(member.member) and FORWARDED_HEADER not in request.headers:
+        await run_in_threadpool(
+            sharded().broadcast, "POST", "/cluster/members", member.dict()
+        )
+    return await cluster_members()
+
+
+@app.delete("/cluster/members", status_code=204, dependencies=MEMBERS_ONLY)
+async def leave_member(request: Request, member: str) -> Response:
+    """Remove a member from the cluster.
+
+    Changes not sent by a member are passed on to the other members.
+
+    :param request: Request
+    :param member: base url of the member
+    :return: empty response
+    """
+    try:
+        removed = sharded().leave(member)
+    except ValueError as exception:
+        raise HTTPException(status_code=422, detail=str(exception))
+    if not removed:
+        raise HTTPException(status_code=404, detail="Member not found.")
+    if FORWARDED_HEADER not in request.headers:
+        await run_in_threadpool(
+            sharded().broadcast, "DELETE", f"/cluster/members?{request.url.query}"
+        )
+    return Response(status_code=204)
+
+
+@app.get("/cluster/handoff", status_code=200, dependencies=MEMBERS_ONLY)
+async def hand_off(member: str) -> List[Dict[str, Any]]:
+    """Return the latest positions of the devices owned by a member.
+
+    :param member: base url of the member
+    :return: positions
+    """
+    return await run_in_threadpool(registry_positions, member)
+
+
+@app.post("/cluster/handoff", status_code=200, dependencies=MEMBERS_ONLY)
+async def take_over(positions: List[Position]) -> Dict[str, int]:
+    """Take over the latest positions of devices handed over by a member.
+
+    :param positions: positions
+    :return: number of positions taken over
+    """
+    received = receive_positions([position.dict() for position in positions])
+    return {"received": received}
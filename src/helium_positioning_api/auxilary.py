@@ -1,4 +1,5 @@
 """Helper functions for the positioning API."""
+import os
 from math import atan2
 from math import cos
 from math import degrees
@@ -7,15 +8,33 @@ from math import sin
 from math import sqrt
 from typing import Iterable
 from typing import List
+from typing import Optional
 from typing import Tuple
 from typing import Union
 
+from dotenv import find_dotenv
+from dotenv import load_dotenv
 from helium_api_wrapper.DataObjects import IntegrationHotspot
 from helium_api_wrapper.devices import get_last_integration
 from utm import from_latlon
 from utm import to_latlon
 
 
+def get_setting(name: str, default: Optional[str] = None) -> Optional[str]:
+    """Return a setting from the environment or the ``.env`` file.
+
+    :param name: name of the environment variable
+    :param default: value if the variable is not set
+
+    :return: value of the setting
+    """
+    if not (dotenv_path := find_dotenv()):
+        dotenv_path = find_dotenv(usecwd=True)
+
+    load_dotenv(dotenv_path)
+    return os.getenv(name) or default
+
+
 def get_integration_hotspots(uuid: str) -> List[IntegrationHotspot]:
     """Load hotspots, which interacted with the given device from the last integration event."""
     integration = get_last_integration(uuid)
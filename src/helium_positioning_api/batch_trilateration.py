@@ -0,0 +1,367 @@
+"""Vectorized batch trilateration for the positioning API.
+
+Runs the same pipeline as :func:`helium_positioning_api.trilateration.trilateration`
+(``do_intersrect`` -> ``classify_intersects`` -> ``estimate_trilateration``) over
+many devices at once. Every device is described by a row of three hotspot
+centres and three predicted distances; all circle intersections, their
+classification and the handler rules are evaluated as masked NumPy operations.
+"""
+
+from typing import Tuple
+
+import numpy as np
+import numpy.typing as npt
+from haversine import Unit
+from haversine import haversine_vector
+from utm import from_latlon
+from utm import to_latlon
+
+
+FloatArray = npt.NDArray[np.float64]
+BoolArray = npt.NDArray[np.bool_]
+
+tol = 25  # tol in meters, same as trilateration.tol
+single_point_tol = 10  # intersections closer than this are merged into one point
+m = Unit.METERS
+
+# circle pairs in the order ``do_intersrect`` intersects them
+PAIRS = ((0, 1), (0, 2), (1, 2))
+
+
+def batch_trilateration(
+    latitudes: npt.ArrayLike,
+    longitudes: npt.ArrayLike,
+    distances: npt.ArrayLike,
+) -> FloatArray:
+    """Estimate the positions of many devices using trilateration.
+
+    Rows for which the scalar pipeline would raise (coincident circles,
+    intersections outside the UTM range, no usable intersection candidate)
+    are returned as ``nan``.
+
+    :param latitudes: latitudes of the three hotspots of every device
+    :type latitudes: array of shape (devices, 3)
+    :param longitudes: longitudes of the three hotspots of every device
+    :type longitudes: array of shape (devices, 3)
+    :param distances: predicted distances in meters to the three hotspots
+    :type distances: array of shape (devices, 3)
+
+    :return: estimated positions as (lat, lng) rows
+    :rtype: array of shape (devices, 2)
+    """
+    lat = np.asarray(latitudes, dtype=np.float64)
+    lng = np.asarray(longitudes, dtype=np.float64)
+    dist = np.asarray(distances, dtype=np.float64)
+    if lat.ndim != 2 or lat.shape[1] != 3 or not lat.shape == lng.shape == dist.shape:
+        raise ValueError("latitudes, longitudes and distances must be (devices, 3)")
+
+    first, second, single = batch_intersects(lat, lng, dist)
+    return batch_estimate(first, second, single, np.stack([lat, lng], axis=-1))
+
+
+def batch_intersects(
+    latitudes: FloatArray, longitudes: FloatArray, distances: FloatArray
+) -> Tuple[FloatArray, FloatArray, BoolArray]:
+    """Generate and classify the intersections of every circle pair.
+
+    Mirrors ``do_intersrect`` and ``classify_intersects``: a pair whose two
+    intersection points are closer than 10 meters collapses into their
+    midpoint (a singular point), every other pair keeps both points.
+
+    :param latitudes: latitudes of the hotspots, shape (devices, 3)
+    :param longitudes: longitudes of the hotspots, shape (devices, 3)
+    :param distances: distances to the hotspots, shape (devices, 3)
+
+    :return: first and second intersection point of every pair (devices, 3, 2)
+        and a mask of singular pairs (devices, 3); for singular pairs both
+        points hold the merged point
+    """
+    n = latitudes.shape[0]
+    first = np.full((n, 3, 2), np.nan)
+    second = np.full((n, 3, 2), np.nan)
+    for k, (i, j) in enumerate(PAIRS):
+        first[:, k], second[:, k] = circle_intersect(
+            latitudes[:, i],
+            longitudes[:, i],
+            distances[:, i],
+            latitudes[:, j],
+            longitudes[:, j],
+            distances[:, j],
+        )
+
+    single = _haversine(first, second) < single_point_tol
+    merged = _mid(first, second)
+    first = np.where(single[..., None], merged, first)
+    second = np.where(single[..., None], merged, second)
+    return first, second, single
+
+
+def circle_intersect(
+    lat_0: FloatArray,
+    long_0: FloatArray,
+    radius_0: FloatArray,
+    lat_1: FloatArray,
+    long_1: FloatArray,
+    radius_1: FloatArray,
+) -> Tuple[FloatArray, FloatArray]:
+    """Perform circle intersection for many circle pairs.
+
+    Vectorized counterpart of :func:`helium_positioning_api.auxilary.circle_intersect`;
+    both centres are projected into the UTM zone of the first centre.
+
+    :param lat_0: latitudes of the first centres
+    :param long_0: longitudes of the first centres
+    :param radius_0: radii of the first circles
+    :param lat_1: latitudes of the second centres
+    :param long_1: longitudes of the second centres
+    :param radius_1: radii of the second circles
+
+    :return: both intersection points as (lat, lng) rows, ``nan`` if undefined
+    """
+    zone = _zone_numbers(lat_0, long_0)
+    x_0, y_0 = _project(lat_0, long_0, zone)
+    x_1, y_1 = _project(lat_1, long_1, zone)
+
+    # calculating distance of the circle's centres
+    d = np.sqrt((x_1 - x_0) ** 2 + (y_1 - y_0) ** 2)
+    # non intersecting or one circle within the other, using midpoint
+    apart = (d > radius_0 + radius_1) | (d < np.abs(radius_0 - radius_1))
+    coincident = ~apart & (d == 0) & (radius_0 == radius_1)
+    crossing = ~apart & ~coincident
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        a = (radius_0**2 - radius_1**2 + d**2) / (2 * d)
+        h = np.sqrt(radius_0**2 - a**2)
+        x_2 = x_0 + a * (x_1 - x_0) / d
+        y_2 = y_0 + a * (y_1 - y_0) / d
+        x_3 = x_2 + h * (y_1 - y_0) / d
+        y_3 = y_2 - h * (x_1 - x_0) / d
+        x_4 = x_2 - h * (y_1 - y_0) / d
+        y_4 = y_2 + h * (x_1 - x_0) / d
+
+    x_mid, y_mid = (x_0 + x_1) / 2, (y_0 + y_1) / 2
+    x_3 = np.where(crossing, x_3, np.where(apart, x_mid, np.nan))
+    y_3 = np.where(crossing, y_3, np.where(apart, y_mid, np.nan))
+    x_4 = np.where(crossing, x_4, np.where(apart, x_mid, np.nan))
+    y_4 = np.where(crossing, y_4, np.where(apart, y_mid, np.nan))
+
+    northern = lat_0 >= 0
+    return _unproject(x_3, y_3, zone, northern), _unproject(x_4, y_4, zone, northern)
+
+
+def batch_estimate(
+    first: FloatArray, second: FloatArray, single: BoolArray, centres: FloatArray
+) -> FloatArray:
+    """Provide position estimates from classified intersections.
+
+    Applies the rules of ``estimate_trilateration``: three singular pairs go
+    to ``three_singular_handler``, two to ``two_singular_handler`` and every
+    other combination to ``multiple_two_int_handler``.
+
+    :param first: first intersection point of every pair, shape (devices, 3, 2)
+    :param second: second intersection point of every pair, shape (devices, 3, 2)
+    :param single: mask of pairs intersecting in a singular point, shape (devices, 3)
+    :param centres: hotspot locations, shape (devices, 3, 2)
+
+    :return: estimated positions, shape (devices, 2)
+    """
+    n = single.shape[0]
+    rows = np.arange(n)[:, None]
+    n_single = single.sum(axis=1)
+
+    # singular points first and pairs with two intersections first, both in
+    # the order ``classify_intersects`` collects them
+    singular_points = first[rows, np.argsort(~single, axis=1, kind="stable")]
+    two_order = np.argsort(single, axis=1, kind="stable")
+    two_points = np.stack([first[rows, two_order], second[rows, two_order]], axis=2)
+
+    estimated = np.full((n, 2), np.nan)
+    three = n_single == 3
+    estimated[three] = _three_singular(singular_points[three])
+    two = n_single == 2
+    estimated[two] = _two_singular(singular_points[two], two_points[two, 0])
+    multiple = n_single <= 1
+    estimated[multiple] = _multiple_two_int(
+        two_points[multiple], 3 - n_single[multiple]
+    )
+
+    undefined = np.isnan(first).any(axis=(1, 2)) | np.isnan(centres).any(axis=(1, 2))
+    estimated[undefined] = np.nan
+    return estimated
+
+
+def _three_singular(points: FloatArray) -> FloatArray:
+    """Vectorized ``three_singular_handler``."""
+    s_0, s_1, s_2 = points[:, 0], points[:, 1], points[:, 2]
+    close_01 = _haversine(s_0, s_1) < tol
+    close_02 = ~close_01 & (_haversine(s_0, s_2) < tol)
+    close_12 = ~close_01 & ~close_02 & (_haversine(s_1, s_2) < tol)
+
+    # first midpoint from the close pair, the remaining point is merged if close
+    a = s_0.copy()
+    b = np.where(close_02[:, None], s_2, s_1)
+    b = np.where(close_12[:, None], s_2, b)
+    a = np.where(close_12[:, None], s_1, a)
+    c = np.where(close_01[:, None], s_2, np.where(close_02[:, None], s_1, s_0))
+
+    first_mid = _mid(a, b)
+    any_close = close_01 | close_02 | close_12
+    merge = any_close & (_haversine(first_mid, c) < tol)
+    return np.where(merge[:, None], _mid(first_mid, c), first_mid)
+
+
+def _two_singular(singular: FloatArray, pair: FloatArray) -> FloatArray:
+    """Vectorized ``two_singular_handler``."""
+    s_0, s_1 = singular[:, 0], singular[:, 1]
+    estimated = _mid(s_0, s_1)
+    close = _haversine(s_0, s_1) < tol
+
+    # the scalar loop keeps the last (singular, intersection) combination
+    # with a non-zero distance
+    fallback = np.full_like(s_0, np.nan)
+    for s in (s_0, s_1):
+        for i in range(2):
+            nonzero = _haversine(s, pair[:, i]) != 0
+            fallback = np.where(nonzero[:, None], _mid(s, pair[:, i]), fallback)
+    return np.where(close[:, None], estimated, fallback)
+
+
+def _multiple_two_int(pairs: FloatArray, n_pairs: npt.NDArray[np.int_]) -> FloatArray:
+    """Vectorized ``multiple_two_int_handler`` and ``no_candidate_handler``.
+
+    :param pairs: pairs with two intersections, shape (devices, 3, 2, 2)
+    :param n_pairs: number of valid pairs per device (2 or 3)
+    """
+    n = pairs.shape[0]
+    # candidates in the order of the scalar loops over h, i and j
+    midpoints, valid = [], []
+    for h in range(2):
+        for i in range(2):
+            for j in range(2):
+                c_1, c_2 = pairs[:, 0, h], pairs[:, i + 1, j]
+                midpoints.append(_mid(c_1, c_2))
+                valid.append((i + 2 <= n_pairs) & (_haversine(c_1, c_2) < tol))
+    candidates = np.stack(midpoints, axis=1)
+    is_candidate = np.stack(valid, axis=1)
+
+    rows = np.arange(n)
+    count = np.cumsum(is_candidate, axis=1)
+    first_candidate = candidates[rows, np.argmax(count >= 1, axis=1)]
+    second_candidate = candidates[rows, np.argmax(count >= 2, axis=1)]
+    n_candidates = count[:, -1]
+
+    estimated = np.where(
+        (n_candidates > 1)[:, None],
+        _mid(first_candidate, second_candidate),
+        first_candidate,
+    )
+    no_candidate = n_candidates == 0
+    estimated[no_candidate] = _no_candidate(pairs[no_candidate], n_pairs[no_candidate])
+    return estimated
+
+
+def _no_candidate(pairs: FloatArray, n_pairs: npt.NDArray[np.int_]) -> FloatArray:
+    """Vectorized ``no_candidate_handler``: midpoint of the closest two intersections."""
+    points = pairs.reshape(pairs.shape[0], 6, 2)
+    i, j = np.triu_indices(6, k=1)
+    distance = _haversine(points[:, i], points[:, j])
+    distance[(j[None, :] >= 2 * n_pairs[:, None])] = np.inf
+    # argmin returns the first minimum, as the strict comparison of the scalar loop
+    closest = np.argmin(distance, axis=1)
+    rows = np.arange(points.shape[0])
+    return _mid(points[rows, i[closest]], points[rows, j[closest]])
+
+
+def _mid(point_1: FloatArray, point_2: FloatArray) -> FloatArray:
+    """Vectorized :func:`helium_positioning_api.auxilary.mid` on (..., 2) arrays."""
+    lat1, lon1 = np.radians(point_1[..., 0]), np.radians(point_1[..., 1])
+    lat2, lon2 = np.radians(point_2[..., 0]), np.radians(point_2[..., 1])
+
+    bx = np.cos(lat2) * np.cos(lon2 - lon1)
+    by = np.cos(lat2) * np.sin(lon2 - lon1)
+    lat3 = np.arctan2(
+        np.sin(lat1) + np.sin(lat2),
+        np.sqrt((np.cos(lat1) + bx) * (np.cos(lat1) + bx) + by**2),
+    )
+    lon3 = lon1 + np.arctan2(by, np.cos(lat1) + bx)
+
+    return np.stack([np.degrees(lat3), np.degrees(lon3)], axis=-1)
+
+
+def _haversine(point_1: FloatArray, point_2: FloatArray) -> FloatArray:
+    """Haversine distance in meters between (..., 2) arrays of points."""
+    shape = np.broadcast_shapes(point_1.shape, point_2.shape)[:-1]
+    point_1 = np.broadcast_to(point_1, shape + (2,)).reshape(-1, 2)
+    point_2 = np.broadcast_to(point_2, shape + (2,)).reshape(-1, 2)
+    if point_1.shape[0] == 0:
+        return np.zeros(shape)
+    with np.errstate(invalid="ignore"):
+        distance = haversine_vector(point_1, point_2, unit=m)
+    return np.asarray(distance, dtype=np.float64).reshape(shape)
+
+
+def _zone_numbers(latitude: FloatArray, longitude: FloatArray) -> npt.NDArray[np.int_]:
+    """Vectorized ``utm.latlon_to_zone_number``."""
+    zone = ((longitude + 180) / 6).astype(int) + 1
+    # Norway and Svalbard exceptions
+    zone = np.where(
+        (latitude >= 56) & (latitude < 64) & (longitude >= 3) & (longitude < 12),
+        32,
+        zone,
+    )
+    svalbard = (latitude >= 72) & (latitude <= 84) & (longitude >= 0)
+    for upper, number in ((9, 31), (21, 33), (33, 35), (42, 37)):
+        zone = np.where(svalbard & (longitude < upper), number, zone)
+        svalbard &= longitude >= upper
+    return zone
+
+
+def _project(
+    latitude: FloatArray, longitude: FloatArray, zone: npt.NDArray[np.int_]
+) -> Tuple[FloatArray, FloatArray]:
+    """Convert lat/lon to UTM coordinates in the given zones.
+
+    ``utm.from_latlon`` needs one zone and one hemisphere per call, so the
+    rows are grouped by both.
+    """
+    easting = np.full(latitude.shape, np.nan)
+    northing = np.full(latitude.shape, np.nan)
+    valid = ~(np.isnan(latitude) | np.isnan(longitude))
+    valid &= (latitude >= -80) & (latitude <= 84)
+    valid &= (longitude >= -180) & (longitude <= 180)
+    for number in np.unique(zone[valid]):
+        for hemisphere in (latitude < 0, latitude >= 0):
+            group = valid & hemisphere & (zone == number)
+            if group.any():
+                easting[group], northing[group], _, _ = from_latlon(
+                    latitude[group], longitude[group], force_zone_number=int(number)
+                )
+    return easting, northing
+
+
+def _unproject(
+    easting: FloatArray,
+    northing: FloatArray,
+    zone: npt.NDArray[np.int_],
+    northern: BoolArray,
+) -> FloatArray:
+    """Convert UTM coordinates back to (lat, lng) rows.
+
+    Coordinates ``utm.to_latlon`` would reject are returned as ``nan``.
+    """
+    points = np.full(easting.shape + (2,), np.nan)
+    valid = (easting >= 100000) & (easting < 1000000)
+    valid &= (northing >= 0) & (northing <= 10000000)
+    for number in np.unique(zone[valid]):
+        for hemisphere in (True, False):
+            group = valid & (zone == number) & (northern == hemisphere)
+            if group.any():
+                lat, lng = to_latlon(
+                    easting[group],
+                    northing[group],
+                    int(number),
+                    northern=hemisphere,
+                    strict=False,
+                )
+                points[group, 0], points[group, 1] = lat, lng
+    return points
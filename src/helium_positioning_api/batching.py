@@ -0,0 +1,204 @@
+"""Batching module.
+
+.. module:: batching
+
+:synopsis: Micro-batching of distance predictions across concurrent requests.
+
+.. moduleauthor:: DSIA21
+
+Every call of a scikit-learn pipeline has a fixed overhead that dominates
+the few rows of one trilateration. The batcher collects the distance jobs
+of all requests waiting at the same time: the first job of a model opens a
+window, and the batch is run as soon as the window closes or the batch
+holds ``max_rows`` rows. Every batch is one ``preprocessor.transform`` and
+one ``model.predict``; the rows are then handed back to the waiting jobs.
+"""
+
+import logging
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass
+from dataclasses import field
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import Optional
+
+import numpy as np
+import numpy.typing as npt
+import pandas as pd
+
+from helium_positioning_api.metrics import gauge
+from helium_positioning_api.metrics import histogram
+
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+FloatArray = npt.NDArray[np.float64]
+
+WINDOW = 0.002  # seconds the first job of a batch waits for others
+MAX_ROWS = 256  # rows after which a batch is run without waiting
+SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024)
+
+batch_rows = histogram(
+    "distance_batch_rows",
+    "Rows per distance prediction batch.",
+    ("model",),
+    SIZE_BUCKETS,
+)
+batch_jobs = histogram(
+    "distance_batch_jobs",
+    "Requests per distance prediction batch.",
+    ("model",),
+    SIZE_BUCKETS,
+)
+batch_wait = histogram(
+    "distance_batch_wait_seconds",
+    "Time a distance job waited for its batch to start.",
+    ("model",),
+)
+batch_compute = histogram(
+    "distance_batch_compute_seconds",
+    "Time to predict one distance batch.",
+    ("model",),
+)
+batch_window = gauge(
+    "distance_batch_window_seconds", "Collection window of distance batches."
+)
+batch_max_rows = gauge(
+    "distance_batch_max_rows", "Rows after which a distance batch is run."
+)
+
+# predicts the distances of a feature frame with a named model
+BatchPredict = Callable[[str, pd.DataFrame], Any]
+
+
+@dataclass
+class _Job:
+    """Features of one request waiting for their distances."""
+
+    features: Dict[str, List[Any]]
+    rows: int
+    submitted: float
+    future: "Future[FloatArray]" = field(default_factory=Future)
+
+
+class DistanceBatcher:
+    """Collects distance jobs of concurrent requests into batches per model."""
+
+    def __init__(
+        self, predict: BatchPredict, window: float = WINDOW, max_rows: int = MAX_ROWS
+    ) -> None:
+        """Create the batcher, its worker thread starts with the first job.
+
+        :param predict: function predicting the distances of a feature frame
+        :param window: seconds the first job of a batch waits for others
+        :param max_rows: rows after which a batch is run without waiting
+        """
+        self.predict = predict
+        self.window = window
+        self.max_rows = max_rows
+        self._pending: Dict[str, List[_Job]] = {}
+        self._rows: Dict[str, int] = {}
+        self._condition = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._closed = False
+        batch_window.set(window)
+        batch_max_rows.set(max_rows)
+
+    def submit(self, model: str, features: Dict[str, List[Any]]) -> FloatArray:
+        """Predict distances as part of the next batch of a model.
+
+        Blocks the calling thread until the batch was predicted.
+
+        :param model: name of the distance model
+        :param features: feature columns of the rows
+        :return: predicted distances of the rows
+        """
+        rows = len(next(iter(features.values()), []))
+        job = _Job(features, rows, time.monotonic())
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("The distance batcher is closed.")
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="distance-batcher", daemon=True
+                )
+                self._thread.start()
+            self._pending.setdefault(model, []).append(job)
+            self._rows[model] = self._rows.get(model, 0) + rows
+            self._condition.notify()
+        return job.future.result()
+
+    def close(self) -> None:
+        """Run the pending jobs and stop the worker thread."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+            thread = self._thread
+        if thread is not None:
+            thread.join()
+
+    def _run(self) -> None:
+        """Collect and predict batches until closed."""
+        while True:
+            with self._condition:
+                while not self._pending and not self._closed:
+                    self._condition.wait()
+                if not self._pending:
+                    return
+                # the model whose oldest job waits longest
+                model = min(self._pending, key=lambda m: self._pending[m][0].submitted)
+                end = self._pending[model][0].submitted + self.window
+                while not self._closed and self._rows[model] < self.max_rows:
+                    remaining = end - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+                jobs = self._take(model)
+            self._execute(model, jobs)
+
+    def _take(self, model: str) -> List[_Job]:
+        """Remove up to ``max_rows`` rows of jobs of a model from the queue."""
+        pending = self._pending[model]
+        count, rows = 0, 0
+        while count < len(pending) and (
+            count == 0 or rows + pending[count].rows <= self.max_rows
+        ):
+            rows += pending[count].rows
+            count += 1
+        jobs, rest = pending[:count], pending[count:]
+        if rest:
+            self._pending[model] = rest
+            self._rows[model] -= rows
+        else:
+            del self._pending[model]
+            del self._rows[model]
+        return jobs
+
+    def _execute(self, model: str, jobs: List[_Job]) -> None:
+        """Predict a batch and hand the distances to the jobs."""
+        start = time.monotonic()
+        for job in jobs:
+            batch_wait.observe(start - job.submitted, model=model)
+        data = {
+            column: [value for job in jobs for value in job.features[column]]
+            for column in jobs[0].features
+        }
+        try:
+            distances = np.asarray(self.predict(model, pd.DataFrame(data))).reshape(-1)
+        except Exception as exception:  # noqa: B902
+            logger.exception(f"Distance batch of model {model} failed")
+            for job in jobs:
+                job.future.set_exception(exception)
+            return
+        batch_compute.observe(time.monotonic() - start, model=model)
+        batch_rows.observe(len(distances), model=model)
+        batch_jobs.observe(len(jobs), model=model)
+        offset = 0
+        for job in jobs:
+            job.future.set_result(distances[offset : offset + job.rows])
+            offset += job.rows
@@ -0,0 +1,139 @@
+"""Binary protocol module.
+
+.. module:: binary_protocol
+
+:synopsis: Compact MessagePack encoding of devices and predictions.
+
+.. moduleauthor:: DSIA21
+
+Requests are MessagePack maps with the same keys as the JSON bodies. A
+prediction is encoded as ``[uuid, position, model]`` where ``position`` is a
+24 byte binary of the little-endian doubles lat, lng and conf (``nan`` if
+unset) and ``model`` the name of the model that produced it (``nil`` if
+unset). A batch of predictions is encoded as ``[uuids, positions, models]``
+where ``positions`` concatenates the 24 byte positions in the order of
+``uuids`` and ``models`` lists the model of every prediction.
+"""
+
+import math
+import struct
+from typing import Any
+from typing import List
+from typing import Optional
+from typing import Sequence
+from typing import Tuple
+
+import msgpack
+
+from helium_positioning_api.DataObjects import Prediction
+
+
+MEDIA_TYPE = "application/msgpack"
+MEDIA_TYPES = (MEDIA_TYPE, "application/x-msgpack")
+
+POSITION = struct.Struct("<ddd")
+
+
+def is_msgpack(media_type: Optional[str]) -> bool:
+    """Return whether a Content-Type or Accept header asks for MessagePack.
+
+    :param media_type: header value
+    :return: True if one of the MessagePack media types is listed
+    """
+    if not media_type:
+        return False
+    return any(
+        part.split(";")[0].strip().lower() in MEDIA_TYPES
+        for part in media_type.split(",")
+    )
+
+
+def decode_request(data: bytes) -> Any:
+    """Decode a MessagePack request body.
+
+    :param data: request body
+    :return: decoded object
+    """
+    try:
+        return msgpack.unpackb(data, raw=False)
+    except (ValueError, msgpack.ExtraData, msgpack.FormatError) as exception:
+        raise ValueError(f"Invalid MessagePack body: {exception}") from exception
+
+
+def encode_prediction(prediction: Prediction) -> bytes:
+    """Encode a prediction as ``[uuid, position, model]``.
+
+    :param prediction: Prediction
+    :return: MessagePack message
+    """
+    message: bytes = msgpack.packb(
+        [prediction.uuid, _pack_position(prediction), prediction.model]
+    )
+    return message
+
+
+def encode_predictions(predictions: Sequence[Prediction]) -> bytes:
+    """Encode many predictions in one ``[uuids, positions, models]`` message.
+
+    :param predictions: Predictions
+    :return: MessagePack message
+    """
+    uuids = [prediction.uuid for prediction in predictions]
+    positions = b"".join(_pack_position(prediction) for prediction in predictions)
+    models = [prediction.model for prediction in predictions]
+    message: bytes = msgpack.packb([uuids, positions, models])
+    return message
+
+
+def decode_prediction(data: bytes) -> Prediction:
+    """Decode a prediction encoded by :func:`encode_prediction`.
+
+    :param data: MessagePack message
+    :return: Prediction
+    """
+    uuid, position, model = msgpack.unpackb(data, raw=False)
+    return _unpack_position(uuid, position, model)
+
+
+def decode_predictions(data: bytes) -> List[Prediction]:
+    """Decode predictions encoded by :func:`encode_predictions`.
+
+    :param data: MessagePack message
+    :return: Predictions
+    """
+    uuids, positions, models = msgpack.unpackb(data, raw=False)
+    if len(positions) != len(uuids) * POSITION.size:
+        raise ValueError("Number of positions does not match the number of uuids")
+    if len(models) != len(uuids):
+        raise ValueError("Number of models does not match the number of uuids")
+    return [
+        _unpack_position(
+            uuid, positions[i * POSITION.size : (i + 1) * POSITION.size], model
+        )
+        for i, (uuid, model) in enumerate(zip(uuids, models))
+    ]
+
+
+def _pack_position(prediction: Prediction) -> bytes:
+    """Pack lat, lng and conf of a prediction into 24 bytes."""
+    return POSITION.pack(*(_nan_if_none(value) for value in _position(prediction)))
+
+
+def _unpack_position(uuid: str, position: bytes, model: Optional[str]) -> Prediction:
+    """Create a prediction from a uuid, a packed position and a model."""
+    lat, lng, conf = (
+        None if math.isnan(value) else value for value in POSITION.unpack(position)
+    )
+    return Prediction(uuid=uuid, lat=lat, lng=lng, conf=conf, model=model)
+
+
+def _position(
+    prediction: Prediction,
+) -> Tuple[Optional[float], Optional[float], Optional[float]]:
+    """Return lat, lng and conf of a prediction."""
+    return prediction.lat, prediction.lng, prediction.conf
+
+
+def _nan_if_none(value: Optional[float]) -> float:
+    """Replace a missing value by nan."""
+    return math.nan if value is None else float(value)
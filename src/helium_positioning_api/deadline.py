@@ -0,0 +1,182 @@
+"""Deadline module.
+
+.. module:: deadline
+
+:synopsis: Latency-budget-aware prediction with fallback to cheaper models.
+
+.. moduleauthor:: DSIA21
+
+A prediction runs in two stages: loading the hotspots of the last
+integration from the Console and computing the position. Both stages run
+in a worker thread and are waited for at most the remaining budget. A model
+is only started if its expected compute time fits into the remaining
+budget, otherwise the next cheaper model of its fallback chain is used.
+A model that overruns the budget is abandoned for the nearest neighbor
+model, which always fits.
+"""
+
+import logging
+import time
+from concurrent.futures import Future
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Any
+from typing import Dict
+from typing import List
+from typing import Optional
+
+from helium_api_wrapper.DataObjects import IntegrationHotspot
+
+from helium_positioning_api.auxilary import get_integration_hotspots
+from helium_positioning_api.DataObjects import Prediction
+from helium_positioning_api.listeners import notify
+from helium_positioning_api.models import MODELS
+from helium_positioning_api.models import predict
+
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# cheaper models tried in order when a model does not fit the budget
+FALLBACKS = ("midpoint", "nearest_neighbor")
+# initial estimates of the compute time of the models in seconds
+DEFAULT_COST = 0.05
+INITIAL_COSTS = {
+    "nearest_neighbor": 0.0001,
+    "midpoint": 0.0002,
+    "weighted_centroid": 0.0002,
+}
+COST_SMOOTHING = 0.2  # weight of a new observation in the cost estimate
+MAX_WORKERS = 32
+
+# stages abandoned after their deadline keep running in the pool
+_executor = ThreadPoolExecutor(MAX_WORKERS, thread_name_prefix="deadline")
+_costs: Dict[str, float] = dict(INITIAL_COSTS)
+
+
+class DeadlineExceeded(Exception):
+    """Raised when no prediction can be made within the deadline."""
+
+
+class Deadline:
+    """Remaining latency budget of a request."""
+
+    def __init__(self, budget_ms: Optional[float]) -> None:
+        """Start the budget.
+
+        :param budget_ms: budget in milliseconds, unlimited if None
+        """
+        self.budget_ms = budget_ms
+        self._end = None if budget_ms is None else time.monotonic() + budget_ms / 1000
+
+    def remaining(self) -> Optional[float]:
+        """Return the remaining budget in seconds, None if unlimited."""
+        if self._end is None:
+            return None
+        return max(self._end - time.monotonic(), 0.0)
+
+    def fits(self, seconds: float) -> bool:
+        """Return whether a stage of the given duration fits the remaining budget.
+
+        :param seconds: expected duration
+        :return: True if the budget is unlimited or large enough
+        """
+        remaining = self.remaining()
+        return remaining is None or seconds <= remaining
+
+
+def fallback_chain(model: str) -> List[str]:
+    """Return a model followed by the cheaper models to fall back to.
+
+    :param model: name of the requested model
+    :return: model names, most accurate first
+    """
+    if model in FALLBACKS:
+        return list(FALLBACKS[FALLBACKS.index(model) :])
+    return [model, *FALLBACKS]
+
+
+def expected_cost(model: str) -> float:
+    """Return the expected compute time of a model in seconds.
+
+    :param model: name of the model
+    :return: smoothed observed compute time
+    """
+    return _costs.get(model, DEFAULT_COST)
+
+
+def predict_within(
+    uuid: str,
+    model: str,
+    deadline: Deadline,
+    hotspots: Optional[List[IntegrationHotspot]] = None,
+    record: bool = True,
+) -> Prediction:
+    """Predict the position of a device within a deadline.
+
+    The ``model`` field of the prediction names the model that actually
+    produced it.
+
+    :param uuid: Device id
+    :param model: name of the requested model
+    :param deadline: remaining budget of the request
+    :param hotspots: hotspots of the last integration, loaded if not given
+    :param record: whether to notify the listeners of the returned prediction
+
+    :return: coordinates of predicted location
+    """
+    if model not in MODELS:
+        raise ValueError(f"Model {model} not implemented.")
+    if deadline.remaining() is None:
+        return _timed(uuid, model, hotspots, record)
+    if hotspots is None:
+        hotspots = _wait(
+            _executor.submit(get_integration_hotspots, uuid),
+            deadline,
+            f"Loading the hotspots of device {uuid}",
+        )
+
+    chain = fallback_chain(model)
+    for candidate in chain[:-1]:
+        if not deadline.fits(expected_cost(candidate)):
+            logger.info(f"Model {candidate} does not fit the deadline of {uuid}.")
+            continue
+        # an abandoned model must not notify the listeners when it finishes
+        future = _executor.submit(_timed, uuid, candidate, hotspots, False)
+        try:
+            prediction: Prediction = _wait(
+                future, deadline, f"Model {candidate} for device {uuid}"
+            )
+        except DeadlineExceeded as exception:
+            logger.warning(f"{exception}, falling back to {chain[-1]}.")
+            break
+        if record:
+            notify(prediction, candidate)
+        return prediction
+    # the cheapest model runs in the caller, it takes microseconds
+    return _timed(uuid, chain[-1], hotspots, record)
+
+
+def _timed(
+    uuid: str,
+    model: str,
+    hotspots: Optional[List[IntegrationHotspot]],
+    record: bool = True,
+) -> Prediction:
+    """Run a model and update its expected compute time."""
+    start = time.perf_counter()
+    prediction = predict(uuid, model, hotspots, record)
+    if hotspots is not None:
+        # durations including the Console call would overestimate the cost
+        duration = time.perf_counter() - start
+        cost = expected_cost(model)
+        _costs[model] = cost + COST_SMOOTHING * (duration - cost)
+    return prediction
+
+
+def _wait(future: "Future[Any]", deadline: Deadline, stage: str) -> Any:
+    """Return the result of a stage or raise if the deadline passes first."""
+    try:
+        return future.result(timeout=deadline.remaining())
+    except FutureTimeoutError:
+        raise DeadlineExceeded(f"{stage} exceeded the deadline") from None
@@ -1,28 +1,196 @@
 """Distance prediction module."""
+import logging
 import os
 from typing import Any
 from typing import Dict
+from typing import Iterable
 from typing import List
+from typing import Optional
 
 import joblib
+import numpy as np
+import numpy.typing as npt
 import pandas as pd
 from dotenv import find_dotenv
 from dotenv import load_dotenv
 
+from helium_positioning_api.batching import MAX_ROWS
+from helium_positioning_api.batching import DistanceBatcher
+from helium_positioning_api.lookup_table import DistanceLookupTable
 
-def predict_distance(model_selection: str, features: Dict[str, List[Any]]) -> float:
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DISTANCE_MODELS = ("linear_regression", "gradient_boosting")
+LOOKUP_TABLE_SUFFIX = "_lut"
+
+# loaded models by name, shared by all requests of a process
+_models: Dict[str, Any] = {}
+# batches the distance predictions of concurrent requests if enabled
+_batcher: Optional[DistanceBatcher] = None
+
+
+def predict_distance(
+    model_selection: str, features: Dict[str, List[Any]]
+) -> npt.NDArray[np.float64]:
     """Return the predicted distance from the model.
 
+    Model names ending with ``_lut`` are answered from a lookup table built
+    by :func:`build_lookup_table`.
+
     :param model_selection: The model object
     :param features: The features to predict the distance
-    :return: The predicted distance
-    """
-    path = __get_model_path()
-    preprocessor = joblib.load(path + "preprocessor.joblib")
-    model = joblib.load(path + model_selection + ".joblib")
-    data = pd.DataFrame(features)
-    y = preprocessor.transform(data)
-    return model.predict(y)
+    :return: The predicted distances
+    """
+    if model_selection.endswith(LOOKUP_TABLE_SUFFIX):
+        return load_lookup_table(model_selection).predict(features)
+    if _batcher is not None:
+        return _batcher.submit(model_selection, features)
+    return np.asarray(
+        predict_frame(model_selection, pd.DataFrame(features)), dtype=np.float64
+    )
+
+
+def predict_frame(model_selection: str, data: pd.DataFrame) -> Any:
+    """Return the distances a model predicts for a feature data frame.
+
+    :param model_selection: name of the distance model
+    :param data: features with one row per hotspot
+    :return: predicted distances
+    """
+    preprocessor = load_model("preprocessor")
+    model = load_model(model_selection)
+    return model.predict(preprocessor.transform(data))
+
+
+def enable_batching(window_ms: float = 2.0, max_rows: int = MAX_ROWS) -> None:
+    """Batch the distance predictions of concurrent requests.
+
+    :param window_ms: milliseconds the first job of a batch waits for others
+    :param max_rows: rows after which a batch is run without waiting
+    """
+    global _batcher
+    disable_batching()
+    _batcher = DistanceBatcher(predict_frame, window_ms / 1000, max_rows)
+
+
+def disable_batching() -> None:
+    """Predict distances in the calling thread again."""
+    global _batcher
+    if _batcher is not None:
+        batcher, _batcher = _batcher, None
+        batcher.close()
+
+
+def load_model(name: str) -> Any:
+    """Return a model from the model path, loading it on first use.
+
+    :param name: file name of the model without the ``.joblib`` suffix
+    :return: The model object
+    """
+    if name not in _models:
+        _models[name] = joblib.load(__get_model_path() + name + ".joblib")
+    return _models[name]
+
+
+def load_lookup_table(name: str) -> DistanceLookupTable:
+    """Return a lookup table from the model path, loading it on first use.
+
+    :param name: file name of the table without the ``.npz`` suffix
+    :return: DistanceLookupTable
+    """
+    if name not in _models:
+        _models[name] = DistanceLookupTable.load(__get_model_path() + name + ".npz")
+    table: DistanceLookupTable = _models[name]
+    return table
+
+
+def build_lookup_table(model_selection: str, **grid: Any) -> DistanceLookupTable:
+    """Evaluate a distance model on a feature grid and return it as lookup table.
+
+    :param model_selection: name of the distance model
+    :param grid: grid and error sampling arguments of
+        :meth:`helium_positioning_api.lookup_table.DistanceLookupTable.build`
+    :return: DistanceLookupTable with the measured maximum error
+    """
+
+    def predict(data: pd.DataFrame) -> Any:
+        return predict_frame(model_selection, data)
+
+    return DistanceLookupTable.build(predict, source_model=model_selection, **grid)
+
+
+def lookup_table_path(name: str) -> str:
+    """Return the path of a lookup table in the model path.
+
+    :param name: name of the distance model the table was built from
+    :return: file path
+    """
+    return __get_model_path() + name + LOOKUP_TABLE_SUFFIX + ".npz"
+
+
+def load_models(model_names: Iterable[str] = DISTANCE_MODELS) -> None:
+    """Load the preprocessor and the given distance models.
+
+    :param model_names: names of the distance models to load
+    """
+    load_model("preprocessor")
+    for name in model_names:
+        load_model(name)
+
+
+def load_available_models() -> None:
+    """Load the distance models and the lookup table found in the model path."""
+    try:
+        load_models()
+    except FileNotFoundError as exception:
+        logger.warning(f"Distance models could not be loaded: {exception}")
+    try:
+        load_lookup_table("gradient_boosting" + LOOKUP_TABLE_SUFFIX)
+    except FileNotFoundError:
+        logger.info("No lookup table of the gradient boosted regression found.")
+
+
+def models_loaded(model_names: Iterable[str] = DISTANCE_MODELS) -> bool:
+    """Return whether the given models and the preprocessor they need are loaded.
+
+    Lookup tables are evaluated without the preprocessor.
+
+    :param model_names: names of the distance models
+    :return: True if all models are loaded
+    """
+    model_names = list(model_names)
+    if any(not name.endswith(LOOKUP_TABLE_SUFFIX) for name in model_names):
+        model_names.append("preprocessor")
+    return all(name in _models for name in model_names)
+
+
+def warm_up(model_names: Iterable[str] = DISTANCE_MODELS) -> None:
+    """Load the distance models and run one prediction with each of them.
+
+    The first prediction initialises lazily created state of pandas and
+    scikit-learn, so it should not be paid by the first request.
+
+    :param model_names: names of the distance models to warm up
+    """
+    model_names = list(model_names)
+    try:
+        load_models(model_names)
+    except FileNotFoundError as exception:
+        logger.warning(f"Distance models could not be loaded: {exception}")
+        return
+    features: Dict[str, List[Any]] = {
+        "snr": [0.0],
+        "rssi": [-100.0],
+        "datarate": ["SF9BW125"],
+        "frequency": [868.1],
+    }
+    for name in model_names:
+        try:
+            predict_distance(name, features)
+        except Exception as exception:  # noqa: B902
+            logger.warning(f"Warm up of model {name} failed: {exception}")
 
 
 def __get_model_path() -> str:
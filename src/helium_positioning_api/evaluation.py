@@ -0,0 +1,413 @@
+"""Evaluation module.
+
+.. module:: evaluation
+
+:synopsis: Parallel evaluation of the accuracy and the cost of the models.
+
+.. moduleauthor:: DSIA21
+
+Labelled integration events, with the hotspots that witnessed an uplink
+and the true ``lat`` and ``lng`` of the device, are read in chunks and
+every model predicts the position of every event in worker processes.
+The distance to the true position is the error of a prediction and the
+CPU time of the process during the prediction its cost. The memory of a
+model is measured with ``tracemalloc`` on the first events of a chunk:
+the memory a model retains after its first prediction in a process (the
+loaded artifacts) and the peak allocated by one prediction. Models that
+fail on every event, e.g. because their artifacts are missing, are
+reported as unavailable. Predictions a model leaves to a fallback model,
+e.g. trilateration with fewer than three witnesses, are reported apart
+from the errors of the model itself.
+
+The report lists the median and p90 error next to the CPU time and memory
+of every model and marks the models for which no other model is both more
+accurate and cheaper.
+"""
+
+import json
+import logging
+import os
+import time
+import tracemalloc
+from concurrent.futures import Future
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import Iterator
+from typing import List
+from typing import Optional
+from typing import Sequence
+from typing import Tuple
+
+import numpy as np
+import numpy.typing as npt
+from haversine import Unit
+from haversine import haversine
+from helium_api_wrapper.DataObjects import IntegrationHotspot
+
+from helium_positioning_api.DataObjects import Prediction
+from helium_positioning_api.models import MODELS
+from helium_positioning_api.training import CHUNK_SIZE
+from helium_positioning_api.training import read_chunks
+
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+FloatArray = npt.NDArray[np.float64]
+
+MEMORY_SAMPLES = 20  # events per chunk whose allocations are traced
+# artifacts whose absence makes a model unavailable
+UNAVAILABLE_ERRORS = (FileNotFoundError, ImportError)
+# models whose predictions name the model they were routed to, not a fallback
+ROUTING_MODELS = ("auto",)
+
+Event = Tuple[str, List[IntegrationHotspot], float, float]
+
+# memory retained by the first prediction of a model in this process
+_loaded: Dict[str, int] = {}
+
+
+def read_events(records: List[Any]) -> List[Event]:
+    """Return the labelled events of records, skipping unlabelled ones.
+
+    :param records: JSON strings or dicts of integration events with the
+        true ``lat`` and ``lng`` of the device
+    :return: device id, hotspots, true lat and lng of the events
+    """
+    events = []
+    for record in records:
+        if isinstance(record, str):
+            record = json.loads(record)
+        if record.get("lat") is None or record.get("lng") is None:
+            continue
+        hotspots = [
+            IntegrationHotspot.construct(**hotspot)
+            for hotspot in record.get("hotspots") or []
+        ]
+        uuid = record.get("device_id") or record.get("id") or ""
+        events.append((uuid, hotspots, float(record["lat"]), float(record["lng"])))
+    return events
+
+
+def evaluate_chunk(records: List[Any], models: Sequence[str]) -> Dict[str, Any]:
+    """Predict the events of a chunk with every model.
+
+    :param records: labelled integration events
+    :param models: names of the models
+    :return: number of events and the measurements of every model
+    """
+    events = read_events(records)
+    results: Dict[str, Any] = {"events": len(events), "models": {}}
+    if not events:
+        return results
+    # the models log every prediction
+    disabled = logging.root.manager.disable
+    logging.disable(logging.INFO)
+    try:
+        for model in models:
+            results["models"][model] = _evaluate_model(model, events)
+    finally:
+        logging.disable(disabled)
+    return results
+
+
+def evaluate(
+    paths: Sequence[str],
+    output: Optional[str] = None,
+    models: Optional[Sequence[str]] = None,
+    chunk_size: int = CHUNK_SIZE,
+    n_jobs: int = 1,
+    limit: Optional[int] = None,
+) -> Dict[str, Any]:
+    """Evaluate the accuracy and the cost of the models on labelled events.
+
+    Writes the returned report as ``evaluation.json`` and as the table
+    ``evaluation.md`` to ``output``.
+
+    :param paths: JSON lines or Parquet files of labelled integration events
+    :param output: directory of the report, not written if None
+    :param models: names of the models, all models if None
+    :param chunk_size: events per chunk
+    :param n_jobs: number of worker processes, in process if 1
+    :param limit: maximum number of records read
+    :return: report with the errors, CPU time and memory of every model
+    """
+    models = list(MODELS if models is None else models)
+    for model in models:
+        if model not in MODELS:
+            raise ValueError(f"Model {model} not implemented.")
+
+    start = time.perf_counter()
+    events = 0
+    measurements: Dict[str, List[Dict[str, Any]]] = {model: [] for model in models}
+    for result in _evaluate_chunks(paths, models, chunk_size, n_jobs, limit):
+        events += result["events"]
+        for model, measurement in result["models"].items():
+            measurements[model].append(measurement)
+
+    report: Dict[str, Any] = {
+        "events": events,
+        "jobs": n_jobs,
+        "seconds": time.perf_counter() - start,
+        "models": {model: _summary(measurements[model]) for model in models},
+    }
+    _mark_pareto(report["models"])
+    if output is not None:
+        os.makedirs(output, exist_ok=True)
+        with open(os.path.join(output, "evaluation.json"), "w") as file:
+            json.dump(report, file, indent=2)
+        with open(os.path.join(output, "evaluation.md"), "w") as file:
+            file.write(format_report(report))
+    return report
+
+
+def format_report(report: Dict[str, Any]) -> str:
+    """Return an evaluation report as a Markdown table.
+
+    :param report: report of :func:`evaluate`
+    :return: Markdown
+    """
+    lines = [
+        "# Model evaluation",
+        "",
+        f"{report['events']} labelled events, {report['jobs']} worker processes, "
+        f"{report['seconds']:.1f} s.",
+        "",
+        "| Model | Predictions | Fallbacks | Failures | Median error (m) "
+        "| P90 error (m) | Mean CPU (ms) | P90 CPU (ms) | Peak memory (KiB) "
+        "| Loaded (MiB) | Pareto |",
+        "|---|---:|---:|---:|---:|---:|---:|---:|---:|---:|:---:|",
+    ]
+    for model, summary in report["models"].items():
+        if summary.get("unavailable"):
+            lines.append(
+                f"| {model} | unavailable: {summary['unavailable']} "
+                "| | | | | | | | | |"
+            )
+            continue
+        lines.append(
+            f"| {model} | {summary['predictions']} | {summary['fallbacks']} "
+            f"| {summary['failures']} "
+            f"| {_number(summary['error_m']['median'], 0)} "
+            f"| {_number(summary['error_m']['p90'], 0)} "
+            f"| {_number(summary['cpu_ms']['mean'], 3)} "
+            f"| {_number(summary['cpu_ms']['p90'], 3)} "
+            f"| {_number(summary['memory']['peak_kib'], 1)} "
+            f"| {_number(summary['memory']['loaded_mib'], 1)} "
+            f"| {'yes' if summary['pareto'] else ''} |"
+        )
+    return "\n".join(lines) + "\n"
+
+
+def _evaluate_chunks(
+    paths: Sequence[str],
+    models: Sequence[str],
+    chunk_size: int,
+    n_jobs: int,
+    limit: Optional[int],
+) -> Iterator[Dict[str, Any]]:
+    """Evaluate the chunks of files in worker processes.
+
+    At most two chunks per worker are read ahead.
+    """
+    chunks = _limit(
+        (chunk for path in paths for chunk in read_chunks(path, chunk_size)), limit
+    )
+    if n_jobs <= 1:
+        for chunk in chunks:
+            yield evaluate_chunk(chunk, models)
+        return
+    with ProcessPoolExecutor(n_jobs) as executor:
+        pending: List["Future[Dict[str, Any]]"] = []
+        for chunk in chunks:
+            pending.append(executor.submit(evaluate_chunk, chunk, models))
+            if len(pending) >= 2 * n_jobs:
+                yield pending.pop(0).result()
+        for future in pending:
+            yield future.result()
+
+
+def _limit(chunks: Iterator[List[Any]], limit: Optional[int]) -> Iterator[List[Any]]:
+    """Truncate chunks to a total number of records."""
+    remaining = limit
+    for chunk in chunks:
+        if remaining is not None:
+            if remaining <= 0:
+                return
+            chunk = chunk[:remaining]
+            remaining -= len(chunk)
+        yield chunk
+
+
+def _evaluate_model(model: str, events: List[Event]) -> Dict[str, Any]:
+    """Return the errors, CPU times and memory of a model on events."""
+    predict = MODELS[model]
+    loaded = _warm_up(model, events[0])
+
+    errors: List[float] = []
+    fallbacks: List[float] = []
+    cpu: List[float] = []
+    wall: List[float] = []
+    failures = unavailable = 0
+    first_error = reason = None
+    for uuid, hotspots, lat, lng in events:
+        start_cpu, start_wall = time.process_time(), time.perf_counter()
+        try:
+            prediction = predict(uuid, hotspots=hotspots)
+        except UNAVAILABLE_ERRORS as exception:
+            unavailable += 1
+            reason = reason or f"{type(exception).__name__}: {exception}"
+            continue
+        except Exception as exception:  # noqa: B902
+            failures += 1
+            first_error = first_error or f"{type(exception).__name__}: {exception}"
+            continue
+        cpu.append(time.process_time() - start_cpu)
+        wall.append(time.perf_counter() - start_wall)
+        fallback = prediction.model not in (None, model) and model not in ROUTING_MODELS
+        (fallbacks if fallback else errors).append(_error(prediction, lat, lng))
+    if unavailable == len(events):
+        return {"unavailable": reason}
+    return {
+        "errors": np.asarray(errors, dtype=np.float64),
+        "fallback_errors": np.asarray(fallbacks, dtype=np.float64),
+        "cpu": np.asarray(cpu, dtype=np.float64),
+        "wall": np.asarray(wall, dtype=np.float64),
+        "failures": failures + unavailable,
+        "error": reason or first_error,
+        "peaks": _peak_allocations(predict, events[:MEMORY_SAMPLES]),
+        "loaded": loaded,
+    }
+
+
+def _error(prediction: Prediction, lat: float, lng: float) -> float:
+    """Return the distance of a prediction to the true position, NaN if missing."""
+    if prediction.lat is None or prediction.lng is None:
+        return np.nan
+    return float(haversine((lat, lng), (prediction.lat, prediction.lng), Unit.METERS))
+
+
+def _warm_up(model: str, event: Event) -> int:
+    """Run the first prediction of a model, return the retained memory.
+
+    The memory is only measured by the first call in a process, later calls
+    return 0.
+    """
+    uuid, hotspots, _, _ = event
+    tracing = tracemalloc.is_tracing()
+    if not tracing:
+        tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    try:
+        MODELS[model](uuid, hotspots=hotspots)
+    except Exception:  # noqa: B902
+        pass  # counted when the event is evaluated
+    finally:
+        retained = tracemalloc.get_traced_memory()[0] - before
+        if not tracing:
+            tracemalloc.stop()
+    if model in _loaded:
+        return 0
+    _loaded[model] = max(retained, 0)
+    return _loaded[model]
+
+
+def _peak_allocations(
+    predict: Callable[..., Prediction], events: List[Event]
+) -> FloatArray:
+    """Return the peak memory allocated by the predictions of events."""
+    tracing = tracemalloc.is_tracing()
+    if not tracing:
+        tracemalloc.start()
+    peaks = []
+    try:
+        for uuid, hotspots, _, _ in events:
+            tracemalloc.reset_peak()
+            current = tracemalloc.get_traced_memory()[0]
+            try:
+                predict(uuid, hotspots=hotspots)
+            except Exception:  # noqa: B902
+                continue
+            peaks.append(tracemalloc.get_traced_memory()[1] - current)
+    finally:
+        if not tracing:
+            tracemalloc.stop()
+    return np.asarray(peaks, dtype=np.float64)
+
+
+def _summary(measurements: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Return the summary of the measurements of a model over all chunks."""
+    available = [m for m in measurements if "unavailable" not in m]
+    if not available:
+        reason = measurements[0]["unavailable"] if measurements else "no events"
+        return {"unavailable": reason}
+
+    errors = np.concatenate([m["errors"] for m in available])
+    cpu = np.concatenate([m["cpu"] for m in available])
+    wall = np.concatenate([m["wall"] for m in available])
+    peaks = np.concatenate([m["peaks"] for m in available])
+    fallbacks = np.concatenate([m["fallback_errors"] for m in available])
+    failures = sum(m["failures"] for m in available)
+    # predictions without a position count as failures
+    located = errors[~np.isnan(errors)]
+    located_fallbacks = fallbacks[~np.isnan(fallbacks)]
+    failures += len(errors) - len(located) + len(fallbacks) - len(located_fallbacks)
+    if not len(located) and not len(located_fallbacks):
+        # a model failing on every event lacks its configuration
+        reasons = [m["error"] for m in available if m["error"]]
+        return {"unavailable": reasons[0] if reasons else "no predictions"}
+    return {
+        "predictions": len(located),
+        "fallbacks": len(located_fallbacks),
+        "failures": failures,
+        "error_m": _distribution(located),
+        "fallback_error_m": _distribution(located_fallbacks),
+        "cpu_ms": {**_distribution(cpu * 1000), "total": float(cpu.sum() * 1000)},
+        "wall_ms": _distribution(wall * 1000),
+        "memory": {
+            "peak_kib": _statistic(np.median, peaks / 1024),
+            "max_peak_kib": _statistic(np.max, peaks / 1024),
+            "loaded_mib": max(m["loaded"] for m in available) / 2**20,
+        },
+    }
+
+
+def _distribution(values: FloatArray) -> Dict[str, Optional[float]]:
+    """Return the median, p90 and mean of values."""
+    return {
+        "median": _statistic(np.median, values),
+        "p90": _statistic(lambda v: np.percentile(v, 90), values),
+        "mean": _statistic(np.mean, values),
+    }
+
+
+def _statistic(function: Any, values: FloatArray) -> Optional[float]:
+    """Return a statistic of values, None if there are none."""
+    return float(function(values)) if len(values) else None
+
+
+def _mark_pareto(summaries: Dict[str, Dict[str, Any]]) -> None:
+    """Mark the models no other model is both more accurate and cheaper than."""
+    costs = {
+        model: (summary["error_m"]["median"], summary["cpu_ms"]["mean"])
+        for model, summary in summaries.items()
+        if not summary.get("unavailable") and summary["error_m"]["median"] is not None
+    }
+    for model, summary in summaries.items():
+        if model not in costs:
+            summary["pareto"] = False
+            continue
+        error, cpu = costs[model]
+        summary["pareto"] = not any(
+            other_error <= error
+            and other_cpu <= cpu
+            and (other_error, other_cpu) != (error, cpu)
+            for other_error, other_cpu in costs.values()
+        )
+
+
+def _number(value: Optional[float], digits: int) -> str:
+    """Return a number with fixed digits, empty if None."""
+    return "" if value is None else f"{value:.{digits}f}"
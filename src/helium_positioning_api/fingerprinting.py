@@ -0,0 +1,340 @@
+"""Fingerprinting module.
+
+.. module:: fingerprinting
+
+:synopsis: RF fingerprinting model backed by a prebuilt nearest-neighbour index.
+
+.. moduleauthor:: DSIA21
+
+A fingerprint is the set of hotspots that witnessed an uplink at a known
+location, together with the rssi of every witness. The index stores the
+fingerprints as sparse rows (hotspot id -> rssi) and, for every hotspot,
+the fingerprints it appears in sorted by rssi. A query only looks at the
+fingerprints in which its strongest witnesses were received with a similar
+rssi, so its cost depends on the density of fingerprints around the device
+and not on the size of the database.
+"""
+
+import json
+import logging
+from dataclasses import dataclass
+from dataclasses import field
+from typing import Dict
+from typing import Iterable
+from typing import Iterator
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+import numpy as np
+import numpy.typing as npt
+from helium_api_wrapper.DataObjects import IntegrationHotspot
+
+from helium_positioning_api.auxilary import get_integration_hotspots
+from helium_positioning_api.auxilary import get_setting
+from helium_positioning_api.DataObjects import Prediction
+from helium_positioning_api.nearest_neighbor import nearest_neighbor
+from helium_positioning_api.witnesses import select_witnesses
+
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+FloatArray = npt.NDArray[np.float64]
+IndexArray = npt.NDArray[np.intp]
+
+MISSING_RSSI = -140.0  # rssi assumed for a hotspot that did not witness an uplink
+STRONGEST_WITNESSES = 3  # witnesses of a query used to look up candidates
+RSSI_WINDOW = 10.0  # dB around the rssi of a witness in which candidates are taken
+MAX_CANDIDATES = 50000  # candidates compared with a query
+K_NEIGHBORS = 5
+
+# (lat, lng, rssi by hotspot id)
+Fingerprint = Tuple[float, float, Dict[str, float]]
+
+# loaded indexes by path, shared by all requests of a process
+_indexes: Dict[str, "FingerprintIndex"] = {}
+
+
+@dataclass
+class FingerprintIndex:
+    """Sparse fingerprint database with an inverted index by hotspot."""
+
+    hotspots: List[str]
+    # (lat, lng) of every fingerprint
+    positions: FloatArray
+    # fingerprints as compressed sparse rows of hotspot ids and rssi
+    indptr: IndexArray
+    indices: IndexArray
+    rssi: npt.NDArray[np.float32]
+    # fingerprints of every hotspot, sorted by rssi
+    posting_indptr: IndexArray
+    postings: IndexArray
+    posting_rssi: npt.NDArray[np.float32]
+    _hotspot_index: Dict[str, int] = field(init=False, repr=False)
+
+    def __post_init__(self) -> None:
+        """Index the hotspot ids."""
+        self._hotspot_index = {h: i for i, h in enumerate(self.hotspots)}
+
+    def __len__(self) -> int:
+        """Return the number of fingerprints."""
+        return len(self.positions)
+
+    @classmethod
+    def build(cls, fingerprints: Iterable[Fingerprint]) -> "FingerprintIndex":
+        """Build the index from labelled uplinks.
+
+        :param fingerprints: (lat, lng, rssi by hotspot id) of every uplink
+        :return: FingerprintIndex
+        """
+        hotspot_index: Dict[str, int] = {}
+        positions: List[Tuple[float, float]] = []
+        lengths: List[int] = []
+        indices: List[int] = []
+        rssi: List[float] = []
+        for lat, lng, witnesses in fingerprints:
+            if not witnesses:
+                continue
+            positions.append((lat, lng))
+            lengths.append(len(witnesses))
+            for hotspot, value in witnesses.items():
+                indices.append(hotspot_index.setdefault(hotspot, len(hotspot_index)))
+                rssi.append(value)
+
+        entry_hotspots = np.array(indices, dtype=np.int32)
+        entry_rssi = np.array(rssi, dtype=np.float32)
+        entry_fingerprints = np.repeat(
+            np.arange(len(positions), dtype=np.int32), lengths
+        )
+        order = np.lexsort((entry_rssi, entry_hotspots))
+        counts = np.bincount(entry_hotspots, minlength=len(hotspot_index))
+        return cls(
+            hotspots=list(hotspot_index),
+            positions=np.array(positions, dtype=np.float64).reshape(-1, 2),
+            indptr=np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64),
+            indices=entry_hotspots,
+            rssi=entry_rssi,
+            posting_indptr=np.concatenate([[0], np.cumsum(counts)]).astype(np.int64),
+            postings=entry_fingerprints[order],
+            posting_rssi=entry_rssi[order],
+        )
+
+    def neighbors(
+        self,
+        witnesses: Dict[str, float],
+        k: int = K_NEIGHBORS,
+        strongest: int = STRONGEST_WITNESSES,
+        window: float = RSSI_WINDOW,
+        max_candidates: int = MAX_CANDIDATES,
+    ) -> Tuple[IndexArray, FloatArray]:
+        """Return the fingerprints most similar to the witnesses of an uplink.
+
+        Candidates are the fingerprints in which one of the ``strongest``
+        witnesses was received within ``window`` dB. They are compared by
+        the euclidean distance of their rssi vectors, hotspots missing on
+        one side count with ``MISSING_RSSI``. Unknown hotspots are ignored.
+
+        :param witnesses: rssi by hotspot id
+        :param k: number of neighbours
+        :param strongest: number of witnesses used to look up candidates
+        :param window: rssi window in dB of the candidate lookup
+        :param max_candidates: maximum number of compared candidates
+        :return: ids and rssi distances of the neighbours, nearest first
+        """
+        known = [
+            (self._hotspot_index[hotspot], value)
+            for hotspot, value in witnesses.items()
+            if hotspot in self._hotspot_index
+        ]
+        if not known:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        query_order = np.argsort([hotspot for hotspot, _ in known])
+        query_hotspots = np.array([known[i][0] for i in query_order])
+        query_rssi = np.array([known[i][1] for i in query_order], dtype=np.float64)
+
+        candidates = self._candidates(
+            query_hotspots, query_rssi, strongest, window, max_candidates
+        )
+        distances = self._distances(candidates, query_hotspots, query_rssi)
+        if len(candidates) > k:
+            nearest = np.argpartition(distances, k - 1)[:k]
+            candidates, distances = candidates[nearest], distances[nearest]
+        order = np.argsort(distances, kind="stable")
+        return candidates[order], distances[order]
+
+    def locate(
+        self, witnesses: Dict[str, float], k: int = K_NEIGHBORS
+    ) -> Optional[Tuple[float, float]]:
+        """Return the position of an uplink as weighted mean of its neighbours.
+
+        :param witnesses: rssi by hotspot id
+        :param k: number of neighbours
+        :return: (lat, lng) or None if no fingerprint shares a witness
+        """
+        ids, distances = self.neighbors(witnesses, k)
+        if not len(ids):
+            return None
+        weights = 1 / (distances + 1.0)
+        lat, lng = (self.positions[ids] * weights[:, None]).sum(axis=0) / weights.sum()
+        return float(lat), float(lng)
+
+    def save(self, path: str) -> None:
+        """Save the index as ``.npz`` file.
+
+        :param path: file path
+        """
+        np.savez(
+            path,
+            hotspots=np.array(self.hotspots),
+            positions=self.positions,
+            indptr=self.indptr,
+            indices=self.indices,
+            rssi=self.rssi,
+            posting_indptr=self.posting_indptr,
+            postings=self.postings,
+            posting_rssi=self.posting_rssi,
+        )
+
+    @classmethod
+    def load(cls, path: str) -> "FingerprintIndex":
+        """Load an index saved by :meth:`save`.
+
+        :param path: file path
+        :return: FingerprintIndex
+        """
+        with np.load(path) as data:
+            return cls(
+                hotspots=[str(h) for h in data["hotspots"]],
+                positions=data["positions"],
+                indptr=data["indptr"],
+                indices=data["indices"],
+                rssi=data["rssi"],
+                posting_indptr=data["posting_indptr"],
+                postings=data["postings"],
+                posting_rssi=data["posting_rssi"],
+            )
+
+    def _candidates(
+        self,
+        query_hotspots: IndexArray,
+        query_rssi: FloatArray,
+        strongest: int,
+        window: float,
+        max_candidates: int,
+    ) -> IndexArray:
+        """Return the fingerprints sharing a strong witness with similar rssi.
+
+        Fingerprints matching more of the strongest witnesses are kept first
+        if there are more than ``max_candidates``.
+        """
+        parts = []
+        for i in np.argsort(-query_rssi, kind="stable")[:strongest]:
+            hotspot, value = query_hotspots[i], query_rssi[i]
+            lower = self.posting_indptr[hotspot]
+            upper = self.posting_indptr[hotspot + 1]
+            block = self.posting_rssi[lower:upper]
+            first = lower + np.searchsorted(block, value - window, side="left")
+            last = lower + np.searchsorted(block, value + window, side="right")
+            parts.append(self.postings[first:last])
+        candidates, matches = np.unique(np.concatenate(parts), return_counts=True)
+        if len(candidates) > max_candidates:
+            candidates = candidates[
+                np.argpartition(-matches, max_candidates - 1)[:max_candidates]
+            ]
+        selected: IndexArray = candidates.astype(np.intp)
+        return selected
+
+    def _distances(
+        self, candidates: IndexArray, query_hotspots: IndexArray, query_rssi: FloatArray
+    ) -> FloatArray:
+        """Return the rssi distances between candidates and a sorted query."""
+        starts = self.indptr[candidates]
+        lengths = self.indptr[candidates + 1] - starts
+        rows = np.repeat(np.arange(len(candidates)), lengths)
+        entries = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(
+            lengths.sum()
+        )
+        hotspots, rssi = self.indices[entries], self.rssi[entries]
+
+        position = np.minimum(
+            np.searchsorted(query_hotspots, hotspots), len(query_hotspots) - 1
+        )
+        matched = query_hotspots[position] == hotspots
+        expected = np.where(matched, query_rssi[position], MISSING_RSSI)
+
+        # query hotspots not witnessed by a candidate count against MISSING_RSSI
+        missing = (query_rssi - MISSING_RSSI) ** 2
+        squared = np.bincount(
+            rows, weights=(rssi - expected) ** 2, minlength=len(candidates)
+        )
+        squared += missing.sum() - np.bincount(
+            rows,
+            weights=np.where(matched, missing[position], 0.0),
+            minlength=len(candidates),
+        )
+        distances: FloatArray = np.sqrt(np.maximum(squared, 0.0))
+        return distances
+
+
+def read_fingerprints(path: str) -> Iterator[Fingerprint]:
+    """Read labelled uplinks from a JSON lines file.
+
+    Every line holds the known ``lat`` and ``lng`` of the device and the
+    witnessing ``hotspots`` with their ``address`` (or ``id``) and ``rssi``.
+
+    :param path: file path
+    :return: fingerprints
+    """
+    with open(path) as file:
+        for line in file:
+            if not line.strip():
+                continue
+            uplink = json.loads(line)
+            witnesses = {
+                str(hotspot.get("address", hotspot.get("id"))): float(hotspot["rssi"])
+                for hotspot in uplink["hotspots"]
+            }
+            yield float(uplink["lat"]), float(uplink["lng"]), witnesses
+
+
+def load_index(path: Optional[str] = None) -> FingerprintIndex:
+    """Return a fingerprint index, loading it on first use.
+
+    :param path: file of the index, defaults to the ``FINGERPRINT_PATH`` setting
+    :return: FingerprintIndex
+    """
+    path = path or get_setting("FINGERPRINT_PATH")
+    if path is None:
+        raise ValueError("No fingerprint index configured (FINGERPRINT_PATH).")
+    if path not in _indexes:
+        _indexes[path] = FingerprintIndex.load(path)
+    return _indexes[path]
+
+
+def fingerprinting(
+    uuid: str, hotspots: Optional[List[IntegrationHotspot]] = None
+) -> Prediction:
+    """This model predicts the location of a given device.
+
+    It takes the weighted mean location of the labelled uplinks whose
+    witnesses and rssi are most similar to the last integration. Falls
+    back to the nearest neighbor model if no labelled uplink shares a
+    witness.
+
+    :param uuid: Device id
+    :param hotspots: hotspots of the last integration, loaded if not given
+    :return: coordinates of predicted location
+    """
+    if hotspots is None:
+        hotspots = get_integration_hotspots(uuid)
+    # the location of a witness is not needed to compare fingerprints
+    selected = select_witnesses(hotspots, located=False).hotspots
+    witnesses = {hotspot.address: hotspot.rssi for hotspot in selected}
+    position = load_index().locate(witnesses)
+    if position is None:
+        logger.info(f"No similar fingerprints for device {uuid}.")
+        return nearest_neighbor(uuid, hotspots)
+    return Prediction(
+        uuid=uuid, lat=position[0], lng=position[1], model="fingerprinting"
+    )
@@ -0,0 +1,300 @@
+"""Geofence module.
+
+.. module:: geofence
+
+:synopsis: Incremental evaluation of geofence enter and exit events.
+
+.. moduleauthor:: DSIA21
+
+Fences are polygons prepared once with their bounding box and vertex
+arrays and registered in the grid cells their bounding box overlaps. A new
+position is only tested against the fences of its cell, so the cost of an
+evaluation depends on the number of fences around the device and not on the
+number of registered fences. The fences containing every device are kept,
+so only changes are emitted as ``enter`` and ``exit`` events.
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from math import floor
+from typing import Callable
+from typing import Deque
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Sequence
+from typing import Set
+from typing import Tuple
+
+import numpy as np
+
+from helium_positioning_api.DataObjects import Prediction
+
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+CELL_SIZE = 0.05  # edge of a grid cell in degrees
+# fences covering more cells are tested by their bounding box only
+MAX_FENCE_CELLS = 4096
+EVENT_BUFFER = 10000  # recent events kept for polling clients
+
+Cell = Tuple[int, int]
+Vertex = Tuple[float, float]  # (lat, lng)
+
+
+@dataclass(frozen=True)
+class GeofenceEvent:
+    """Entering or leaving of a fence by a device."""
+
+    sequence: int
+    uuid: str
+    fence: str
+    event: str  # "enter" or "exit"
+    lat: float
+    lng: float
+    timestamp: int  # milliseconds
+
+
+class Geofence:
+    """Polygon prepared for point-in-polygon tests."""
+
+    def __init__(self, fence_id: str, polygon: Sequence[Vertex]) -> None:
+        """Prepare a polygon.
+
+        :param fence_id: id of the fence
+        :param polygon: (lat, lng) vertices, the ring is closed implicitly
+        """
+        vertices = np.asarray(polygon, dtype=np.float64)
+        if vertices.ndim != 2 or vertices.shape[1] != 2:
+            raise ValueError("A polygon must be a list of (lat, lng) vertices.")
+        if len(vertices) > 1 and np.array_equal(vertices[0], vertices[-1]):
+            vertices = vertices[:-1]
+        if len(vertices) < 3:
+            raise ValueError("A polygon needs at least three vertices.")
+        self.id = fence_id
+        self.polygon: List[Vertex] = [(float(a), float(b)) for a, b in vertices]
+        self.min_lat, self.min_lng = vertices.min(axis=0)
+        self.max_lat, self.max_lng = vertices.max(axis=0)
+        # edges from every vertex to the next one
+        self._lat0, self._lng0 = vertices[:, 0], vertices[:, 1]
+        self._lat1 = np.roll(self._lat0, -1)
+        self._lng1 = np.roll(self._lng0, -1)
+
+    def contains(self, lat: float, lng: float) -> bool:
+        """Return whether a position is inside the polygon (even-odd rule).
+
+        :param lat: latitude
+        :param lng: longitude
+        :return: True if inside
+        """
+        if not (
+            self.min_lat <= lat <= self.max_lat and self.min_lng <= lng <= self.max_lng
+        ):
+            return False
+        crosses = (self._lat0 > lat) != (self._lat1 > lat)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            intersection = self._lng0 + (lat - self._lat0) * (
+                self._lng1 - self._lng0
+            ) / (self._lat1 - self._lat0)
+        return bool(np.count_nonzero(crosses & (lng < intersection)) % 2)
+
+
+class GeofenceEngine:
+    """Registry of fences evaluating device positions incrementally."""
+
+    def __init__(
+        self, cell_size: float = CELL_SIZE, event_buffer: int = EVENT_BUFFER
+    ) -> None:
+        """Create an engine without fences.
+
+        :param cell_size: edge of a grid cell in degrees
+        :param event_buffer: number of recent events kept
+        """
+        self.cell_size = cell_size
+        self._fences: Dict[str, Geofence] = {}
+        self._fence_cells: Dict[str, List[Cell]] = {}
+        self._cells: Dict[Cell, Set[str]] = {}
+        self._large: Set[str] = set()
+        self._inside: Dict[str, Set[str]] = {}
+        self._events: Deque[GeofenceEvent] = deque(maxlen=event_buffer)
+        self._sequence = 0
+        self._callbacks: List[Callable[[GeofenceEvent], None]] = []
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        """Return the number of fences."""
+        return len(self._fences)
+
+    def add(self, fence_id: str, polygon: Sequence[Vertex]) -> Geofence:
+        """Register a fence or replace the polygon of a registered one.
+
+        Devices are only checked against the new polygon with their next
+        position.
+
+        :param fence_id: id of the fence
+        :param polygon: (lat, lng) vertices
+        :return: prepared Geofence
+        """
+        fence = Geofence(fence_id, polygon)
+        lower = self._cell(fence.min_lat, fence.min_lng)
+        upper = self._cell(fence.max_lat, fence.max_lng)
+        n_cells = (upper[0] - lower[0] + 1) * (upper[1] - lower[1] + 1)
+        with self._lock:
+            self._unregister(fence_id)
+            self._fences[fence_id] = fence
+            if n_cells > MAX_FENCE_CELLS:
+                self._large.add(fence_id)
+                return fence
+            cells = [
+                (i, j)
+                for i in range(lower[0], upper[0] + 1)
+                for j in range(lower[1], upper[1] + 1)
+            ]
+            self._fence_cells[fence_id] = cells
+            for cell in cells:
+                self._cells.setdefault(cell, set()).add(fence_id)
+        return fence
+
+    def remove(self, fence_id: str) -> None:
+        """Unregister a fence without emitting exit events.
+
+        :param fence_id: id of the fence
+        """
+        with self._lock:
+            if fence_id not in self._fences:
+                raise KeyError(fence_id)
+            self._unregister(fence_id)
+            for fences in self._inside.values():
+                fences.discard(fence_id)
+
+    def get(self, fence_id: str) -> Geofence:
+        """Return a fence.
+
+        :param fence_id: id of the fence
+        :return: Geofence
+        """
+        return self._fences[fence_id]
+
+    def fences(self) -> List[Geofence]:
+        """Return all fences."""
+        return list(self._fences.values())
+
+    def inside(self, uuid: str) -> Set[str]:
+        """Return the fences a device is inside of.
+
+        :param uuid: Device id
+        :return: fence ids
+        """
+        return set(self._inside.get(uuid, ()))
+
+    def candidates(self, lat: float, lng: float) -> Set[str]:
+        """Return the fences whose bounding box may contain a position.
+
+        :param lat: latitude
+        :param lng: longitude
+        :return: fence ids
+        """
+        return self._cells.get(self._cell(lat, lng), set()) | self._large
+
+    def evaluate(
+        self, uuid: str, lat: float, lng: float, timestamp: Optional[int] = None
+    ) -> List[GeofenceEvent]:
+        """Update the position of a device and return its enter and exit events.
+
+        :param uuid: Device id
+        :param lat: latitude
+        :param lng: longitude
+        :param timestamp: time of the position in milliseconds, now if None
+        :return: new events
+        """
+        if timestamp is None:
+            timestamp = int(time.time() * 1000)
+        with self._lock:
+            inside = {
+                fence_id
+                for fence_id in self.candidates(lat, lng)
+                if self._fences[fence_id].contains(lat, lng)
+            }
+            previous = self._inside.get(uuid, set())
+            events = [
+                self._event(uuid, fence_id, "exit", lat, lng, timestamp)
+                for fence_id in sorted(previous - inside)
+            ] + [
+                self._event(uuid, fence_id, "enter", lat, lng, timestamp)
+                for fence_id in sorted(inside - previous)
+            ]
+            if inside:
+                self._inside[uuid] = inside
+            else:
+                self._inside.pop(uuid, None)
+        for event in events:
+            for callback in list(self._callbacks):
+                try:
+                    callback(event)
+                except Exception:  # noqa: B902
+                    logger.exception(f"Geofence callback {callback} failed")
+        return events
+
+    def events(self, since: int = 0, limit: int = 1000) -> List[GeofenceEvent]:
+        """Return the buffered events after a sequence number, oldest first.
+
+        :param since: sequence number of the last event seen by the client
+        :param limit: maximum number of events
+        :return: events
+        """
+        with self._lock:
+            events = [event for event in self._events if event.sequence > since]
+        return events[:limit]
+
+    def add_callback(self, callback: Callable[[GeofenceEvent], None]) -> None:
+        """Register a function called with every new event.
+
+        :param callback: function taking a GeofenceEvent
+        """
+        if callback not in self._callbacks:
+            self._callbacks.append(callback)
+
+    def update_prediction(self, prediction: Prediction, model: str) -> None:
+        """Evaluate the position of a prediction, ignore unsuccessful ones.
+
+        Can be registered with :func:`helium_positioning_api.listeners.add_listener`.
+
+        :param prediction: Prediction
+        :param model: name of the model that produced the prediction
+        """
+        if prediction.lat is not None and prediction.lng is not None:
+            self.evaluate(prediction.uuid, prediction.lat, prediction.lng)
+
+    def _event(
+        self,
+        uuid: str,
+        fence_id: str,
+        kind: str,
+        lat: float,
+        lng: float,
+        timestamp: int,
+    ) -> GeofenceEvent:
+        """Create and buffer an event."""
+        self._sequence += 1
+        event = GeofenceEvent(self._sequence, uuid, fence_id, kind, lat, lng, timestamp)
+        self._events.append(event)
+        return event
+
+    def _unregister(self, fence_id: str) -> None:
+        """Remove a fence from the cells."""
+        self._fences.pop(fence_id, None)
+        self._large.discard(fence_id)
+        for cell in self._fence_cells.pop(fence_id, ()):
+            fences = self._cells.get(cell)
+            if fences is not None:
+                fences.discard(fence_id)
+                if not fences:
+                    del self._cells[cell]
+
+    def _cell(self, lat: float, lng: float) -> Cell:
+        """Return the cell of a position."""
+        return floor(lat / self.cell_size), floor(lng / self.cell_size)
@@ -0,0 +1,389 @@
+"""History module.
+
+.. module:: history
+
+:synopsis: Append-only columnar store of predicted device positions.
+
+.. moduleauthor:: DSIA21
+
+Predictions are appended to an in-memory buffer that is sealed into a
+segment once it is full or old enough. A segment is a directory of ``.npy``
+columns (device, timestamp, lat, lng, conf, model) sorted by device and
+timestamp, together with the per-device row offsets, so the track of a
+device is a contiguous slice that is found without scanning other devices.
+Segments are opened memory-mapped and never modified; compaction merges
+old segments into a new one, hiding them before the new one is published.
+"""
+
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+import uuid as uuid_lib
+from dataclasses import dataclass
+from typing import Any
+from typing import Dict
+from typing import List
+from typing import Optional
+
+import numpy as np
+import numpy.typing as npt
+
+from helium_positioning_api.DataObjects import Prediction
+
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+SEGMENT_SIZE = 65536  # rows of the buffer before it is sealed
+FLUSH_INTERVAL = 60.0  # seconds after which a non-empty buffer is sealed
+
+COLUMNS = ("device", "timestamp", "lat", "lng", "conf", "model")
+Track = Dict[str, npt.NDArray[Any]]
+
+
+@dataclass
+class Segment:
+    """Sealed, memory-mapped segment of the history."""
+
+    path: str
+    devices: Dict[str, int]
+    models: List[str]
+    offsets: npt.NDArray[Any]
+    columns: Dict[str, npt.NDArray[Any]]
+    min_timestamp: int
+    max_timestamp: int
+
+    @classmethod
+    def open(cls, path: str) -> "Segment":
+        """Open a segment directory.
+
+        :param path: segment directory
+        :return: Segment with memory-mapped columns
+        """
+        with open(os.path.join(path, "meta.json")) as file:
+            meta = json.load(file)
+        columns = {
+            name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r")
+            for name in COLUMNS
+        }
+        return cls(
+            path=path,
+            devices={uuid: i for i, uuid in enumerate(meta["devices"])},
+            models=meta["models"],
+            offsets=np.load(os.path.join(path, "offsets.npy"), mmap_mode="r"),
+            columns=columns,
+            min_timestamp=meta["min_timestamp"],
+            max_timestamp=meta["max_timestamp"],
+        )
+
+    def track(self, uuid: str, start: int, end: int) -> Optional[Track]:
+        """Return the rows of a device with ``start <= timestamp < end``.
+
+        :param uuid: Device id
+        :param start: first timestamp in milliseconds
+        :param end: timestamp in milliseconds after the last one
+        :return: columns of the rows or None if there are none
+        """
+        if uuid not in self.devices or end <= self.min_timestamp:
+            return None
+        if start > self.max_timestamp:
+            return None
+        device = self.devices[uuid]
+        first, last = int(self.offsets[device]), int(self.offsets[device + 1])
+        timestamps = self.columns["timestamp"][first:last]
+        lower = first + int(np.searchsorted(timestamps, start, side="left"))
+        upper = first + int(np.searchsorted(timestamps, end, side="left"))
+        if lower == upper:
+            return None
+        models = np.array(self.models, dtype=object)
+        return {
+            "timestamp": np.array(self.columns["timestamp"][lower:upper]),
+            "lat": np.array(self.columns["lat"][lower:upper]),
+            "lng": np.array(self.columns["lng"][lower:upper]),
+            "conf": np.array(self.columns["conf"][lower:upper]),
+            "model": models[self.columns["model"][lower:upper]],
+        }
+
+
+class PositionHistory:
+    """Append-only position history of devices stored in a directory.
+
+    Several processes may append to the same directory; rows appended by a
+    process become visible to the others once its buffer is sealed.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        segment_size: int = SEGMENT_SIZE,
+        flush_interval: float = FLUSH_INTERVAL,
+    ) -> None:
+        """Open or create a history.
+
+        :param path: directory of the history
+        :param segment_size: rows of the buffer before it is sealed
+        :param flush_interval: seconds after which a non-empty buffer is sealed
+        """
+        self.path = path
+        self.segment_size = segment_size
+        self.flush_interval = flush_interval
+        os.makedirs(path, exist_ok=True)
+        self._lock = threading.Lock()
+        # held while the set of segments changes
+        self._segments_lock = threading.Lock()
+        self._segments: Dict[str, Segment] = {}
+        self._buffer: Dict[str, List[List[float]]] = {}
+        self._buffer_models: Dict[str, List[str]] = {}
+        self._buffer_rows = 0
+        self._buffer_since = time.monotonic()
+
+    def append(
+        self,
+        uuid: str,
+        timestamp: int,
+        lat: Optional[float],
+        lng: Optional[float],
+        conf: Optional[float],
+        model: str,
+    ) -> None:
+        """Append a position of a device.
+
+        :param uuid: Device id
+        :param timestamp: time of the position in milliseconds
+        :param lat: latitude
+        :param lng: longitude
+        :param conf: confidence
+        :param model: name of the model that predicted the position
+        """
+        row = [float(timestamp), _float(lat), _float(lng), _float(conf)]
+        with self._lock:
+            if not self._buffer_rows:
+                self._buffer_since = time.monotonic()
+            self._buffer.setdefault(uuid, []).append(row)
+            self._buffer_models.setdefault(uuid, []).append(model)
+            self._buffer_rows += 1
+            full = self._buffer_rows >= self.segment_size
+            old = time.monotonic() - self._buffer_since >= self.flush_interval
+        if full or old:
+            self.flush()
+
+    def append_prediction(self, prediction: Prediction, model: str) -> None:
+        """Append a prediction at the current time.
+
+        Can be registered with :func:`helium_positioning_api.listeners.add_listener`.
+
+        :param prediction: Prediction
+        :param model: name of the model that produced the prediction
+        """
+        self.append(
+            prediction.uuid,
+            int(time.time() * 1000),
+            prediction.lat,
+            prediction.lng,
+            prediction.conf,
+            model,
+        )
+
+    def flush(self) -> None:
+        """Seal the buffered rows into a new segment."""
+        with self._lock:
+            buffer, models = self._buffer, self._buffer_models
+            self._buffer, self._buffer_models, self._buffer_rows = {}, {}, 0
+        if buffer:
+            tracks = {
+                uuid: _buffer_track(rows, models[uuid]) for uuid, rows in buffer.items()
+            }
+            tmp_path = self._write_segment(tracks)
+            with self._segments_lock:
+                self._publish(tmp_path)
+
+    def track(self, uuid: str, start: int = 0, end: Optional[int] = None) -> Track:
+        """Return the positions of a device in a time range, ordered by time.
+
+        Only segments overlapping the time range and containing the device
+        are read.
+
+        :param uuid: Device id
+        :param start: first timestamp in milliseconds
+        :param end: timestamp in milliseconds after the last one, open if None
+        :return: columns timestamp, lat, lng, conf and model
+        """
+        end = np.iinfo(np.int64).max if end is None else end
+        parts = []
+        for segment in self._refresh_segments():
+            part = segment.track(uuid, start, end)
+            if part is not None:
+                parts.append(part)
+        with self._lock:
+            if uuid in self._buffer:
+                buffered = _buffer_track(self._buffer[uuid], self._buffer_models[uuid])
+                in_range = (buffered["timestamp"] >= start) & (
+                    buffered["timestamp"] < end
+                )
+                parts.append({name: buffered[name][in_range] for name in buffered})
+        return _concatenate(parts)
+
+    def compact(self, before: Optional[int] = None) -> int:
+        """Merge the segments ending before a timestamp into one segment.
+
+        The merged segments are hidden before the new segment is published,
+        so a concurrent :meth:`track` never returns their rows twice. If
+        another process compacted one of them first, nothing is merged.
+
+        :param before: merge segments whose last timestamp is before this one,
+            all segments if None
+        :return: number of merged segments
+        """
+        segments = [
+            segment
+            for segment in self._refresh_segments()
+            if before is None or segment.max_timestamp < before
+        ]
+        if len(segments) < 2:
+            return 0
+        tracks: Dict[str, List[Track]] = {}
+        for segment in segments:
+            for uuid in segment.devices:
+                part = segment.track(uuid, 0, np.iinfo(np.int64).max)
+                if part is not None:
+                    tracks.setdefault(uuid, []).append(part)
+        tmp_path = self._write_segment(
+            {uuid: _concatenate(parts) for uuid, parts in tracks.items()}
+        )
+        with self._segments_lock:
+            hidden = self._hide(segments)
+            if hidden is None:
+                shutil.rmtree(tmp_path, ignore_errors=True)
+                return 0
+            self._publish(tmp_path)
+        for hidden_path in hidden:
+            shutil.rmtree(hidden_path, ignore_errors=True)
+        return len(segments)
+
+    def _hide(self, segments: List[Segment]) -> Optional[List[str]]:
+        """Rename segments so that readers skip them, locked.
+
+        :param segments: segments to hide
+        :return: hidden paths or None if a segment was already removed
+        """
+        hidden: List[str] = []
+        try:
+            for segment in segments:
+                name = os.path.basename(segment.path)
+                hidden.append(os.path.join(self.path, f".{name}"))
+                os.rename(segment.path, hidden[-1])
+        except FileNotFoundError:
+            # merged by a concurrent compaction
+            for segment, hidden_path in zip(segments, hidden[:-1]):
+                os.rename(hidden_path, segment.path)
+            return None
+        for segment in segments:
+            self._segments.pop(os.path.basename(segment.path), None)
+        return hidden
+
+    def _refresh_segments(self) -> List[Segment]:
+        """Open new segments of the directory and forget removed ones."""
+        with self._segments_lock:
+            return self._open_segments()
+
+    def _open_segments(self) -> List[Segment]:
+        """Open new segments of the directory and forget removed ones, locked."""
+        names = {
+            entry.name
+            for entry in os.scandir(self.path)
+            if entry.is_dir() and not entry.name.startswith(".")
+        }
+        for name in list(self._segments):
+            if name not in names:
+                del self._segments[name]
+        for name in sorted(names - set(self._segments)):
+            try:
+                self._segments[name] = Segment.open(os.path.join(self.path, name))
+            except FileNotFoundError:
+                # removed by a concurrent compaction
+                continue
+        return [self._segments[name] for name in sorted(self._segments)]
+
+    def _write_segment(self, tracks: Dict[str, Track]) -> str:
+        """Write tracks as a hidden segment, sorted by device and timestamp.
+
+        :return: path of the segment to :meth:`_publish`
+        """
+        devices = sorted(tracks)
+        models = sorted({str(m) for track in tracks.values() for m in track["model"]})
+        model_ids = {model: i for i, model in enumerate(models)}
+        lengths = [len(tracks[uuid]["timestamp"]) for uuid in devices]
+        offsets = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+
+        columns: Track = {
+            "device": np.repeat(np.arange(len(devices), dtype=np.int32), lengths),
+            "timestamp": np.concatenate(
+                [tracks[uuid]["timestamp"] for uuid in devices]
+            ).astype(np.int64),
+            "lat": np.concatenate([tracks[uuid]["lat"] for uuid in devices]),
+            "lng": np.concatenate([tracks[uuid]["lng"] for uuid in devices]),
+            "conf": np.concatenate([tracks[uuid]["conf"] for uuid in devices]),
+            "model": np.array(
+                [model_ids[str(m)] for uuid in devices for m in tracks[uuid]["model"]],
+                dtype=np.uint8,
+            ),
+        }
+        meta = {
+            "devices": devices,
+            "models": models,
+            "min_timestamp": int(columns["timestamp"].min()),
+            "max_timestamp": int(columns["timestamp"].max()),
+        }
+
+        # segment names sort by creation time, the directory appears atomically
+        name = f"{time.time_ns():020d}-{uuid_lib.uuid4().hex[:8]}"
+        tmp_path = os.path.join(self.path, f".{name}")
+        os.makedirs(tmp_path)
+        for column, values in columns.items():
+            np.save(os.path.join(tmp_path, f"{column}.npy"), values)
+        np.save(os.path.join(tmp_path, "offsets.npy"), offsets)
+        with open(os.path.join(tmp_path, "meta.json"), "w") as file:
+            json.dump(meta, file)
+        return tmp_path
+
+    def _publish(self, tmp_path: str) -> None:
+        """Make a written segment visible to readers."""
+        name = os.path.basename(tmp_path)[1:]
+        os.rename(tmp_path, os.path.join(self.path, name))
+        logger.debug(f"Sealed history segment {name}")
+
+
+def _float(value: Optional[float]) -> float:
+    """Replace a missing value by nan."""
+    return np.nan if value is None else float(value)
+
+
+def _buffer_track(rows: List[List[float]], models: List[str]) -> Track:
+    """Return buffered rows of a device as columns sorted by timestamp."""
+    values = np.array(rows, dtype=np.float64).reshape(-1, 4)
+    order = np.argsort(values[:, 0], kind="stable")
+    return {
+        "timestamp": values[order, 0].astype(np.int64),
+        "lat": values[order, 1],
+        "lng": values[order, 2],
+        "conf": values[order, 3],
+        "model": np.array(models, dtype=object)[order],
+    }
+
+
+def _concatenate(parts: List[Track]) -> Track:
+    """Concatenate tracks and sort them by timestamp."""
+    if not parts:
+        return {
+            "timestamp": np.empty(0, dtype=np.int64),
+            "lat": np.empty(0),
+            "lng": np.empty(0),
+            "conf": np.empty(0),
+            "model": np.empty(0, dtype=object),
+        }
+    track = {name: np.concatenate([part[name] for part in parts]) for name in parts[0]}
+    order = np.argsort(track["timestamp"], kind="stable")
+    return {name: values[order] for name, values in track.items()}
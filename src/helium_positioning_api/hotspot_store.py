@@ -0,0 +1,414 @@
+"""Hotspot store module.
+
+.. module:: hotspot_store
+
+:synopsis: Local persistent store of hotspot metadata keyed by address.
+
+.. moduleauthor:: DSIA21
+
+The location, the asserted location changes, gain and elevation of the
+hotspots are kept in an embedded SQLite database, so no network call is
+needed to locate a witness. Hotspots are looked up by their address, the
+primary key of a table without row ids that SQLite reads memory-mapped.
+The UTM projection of every location is computed when it is imported.
+
+Dumps of the Helium API (JSON lines, a JSON array or CSV of hotspots) are
+imported in batches. A record only replaces a stored hotspot if it was
+asserted at the same or a later block; every assertion not seen before is
+appended to the location changes of the hotspot.
+
+If ``HOTSPOT_STORE_PATH`` is set, the witnesses of every prediction are
+completed from the store: witnesses without a location get the stored
+one, and witnesses whose integration reports an assertion block older
+than the stored one get the newer location.
+"""
+
+import csv
+import json
+import logging
+import sqlite3
+import threading
+from dataclasses import dataclass
+from itertools import islice
+from typing import Any
+from typing import Dict
+from typing import Iterable
+from typing import Iterator
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+import numpy as np
+from helium_api_wrapper.DataObjects import IntegrationHotspot
+from utm import from_latlon
+from utm import latitude_to_zone_letter
+from utm import latlon_to_zone_number
+
+from helium_positioning_api.auxilary import get_setting
+
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 10000  # records per import transaction
+MMAP_SIZE = 1 << 30  # bytes of the database SQLite maps into memory
+# fields of the Helium API with the block of the latest location assertion
+BLOCK_FIELDS = ("last_change_block", "block", "block_added")
+
+COLUMNS = (
+    "address",
+    "name",
+    "lat",
+    "lng",
+    "location",
+    "gain",
+    "elevation",
+    "block",
+    "easting",
+    "northing",
+    "zone_number",
+    "zone_letter",
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS hotspots (
+    address TEXT PRIMARY KEY,
+    name TEXT,
+    lat REAL,
+    lng REAL,
+    location TEXT,
+    gain REAL,
+    elevation REAL,
+    block INTEGER,
+    easting REAL,
+    northing REAL,
+    zone_number INTEGER,
+    zone_letter TEXT
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS location_changes (
+    address TEXT NOT NULL,
+    block INTEGER,
+    lat REAL,
+    lng REAL,
+    location TEXT
+);
+CREATE INDEX IF NOT EXISTS location_changes_address
+    ON location_changes (address, block);
+"""
+
+_lock = threading.Lock()
+# store of the HOTSPOT_STORE_PATH setting, resolved on first use
+_store: Optional["HotspotStore"] = None
+_resolved = False
+
+
+@dataclass(frozen=True)
+class HotspotInfo:
+    """Stored metadata of a hotspot."""
+
+    address: str
+    name: Optional[str]
+    lat: Optional[float]
+    lng: Optional[float]
+    # h3 index of the asserted location
+    location: Optional[str]
+    # antenna gain in dBi * 10 and elevation in meters, as asserted
+    gain: Optional[float]
+    elevation: Optional[float]
+    # block of the latest location assertion
+    block: Optional[int]
+    # UTM projection of the location
+    easting: Optional[float]
+    northing: Optional[float]
+    zone_number: Optional[int]
+    zone_letter: Optional[str]
+
+
+@dataclass(frozen=True)
+class LocationChange:
+    """Asserted location of a hotspot."""
+
+    block: Optional[int]
+    lat: Optional[float]
+    lng: Optional[float]
+    location: Optional[str]
+
+
+class HotspotStore:
+    """Hotspot metadata in an embedded SQLite database."""
+
+    def __init__(self, path: str) -> None:
+        """Open or create a store.
+
+        :param path: database file, ``:memory:`` for a temporary store
+        """
+        self.path = path
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._connection.execute(f"PRAGMA mmap_size = {MMAP_SIZE}")
+            if path != ":memory:":
+                self._connection.execute("PRAGMA journal_mode = WAL")
+            self._connection.executescript(SCHEMA)
+
+    def __len__(self) -> int:
+        """Return the number of hotspots."""
+        with self._lock:
+            row = self._connection.execute("SELECT COUNT(*) FROM hotspots").fetchone()
+        return int(row[0])
+
+    def get(self, address: str) -> Optional[HotspotInfo]:
+        """Return the metadata of a hotspot.
+
+        :param address: address of the hotspot
+        :return: HotspotInfo or None if the hotspot is unknown
+        """
+        with self._lock:
+            row = self._connection.execute(
+                f"SELECT {', '.join(COLUMNS)} FROM hotspots WHERE address = ?",
+                (address,),
+            ).fetchone()
+        return None if row is None else HotspotInfo(*row)
+
+    def get_many(self, addresses: Iterable[str]) -> Dict[str, HotspotInfo]:
+        """Return the metadata of the known hotspots of a list.
+
+        :param addresses: addresses of the hotspots
+        :return: HotspotInfo by address
+        """
+        addresses = list(set(addresses))
+        found: Dict[str, HotspotInfo] = {}
+        # the number of parameters of a statement is limited
+        for first in range(0, len(addresses), 500):
+            batch = addresses[first : first + 500]
+            with self._lock:
+                rows = self._connection.execute(
+                    f"SELECT {', '.join(COLUMNS)} FROM hotspots "
+                    f"WHERE address IN ({', '.join('?' * len(batch))})",
+                    batch,
+                ).fetchall()
+            found.update((row[0], HotspotInfo(*row)) for row in rows)
+        return found
+
+    def history(self, address: str) -> List[LocationChange]:
+        """Return the asserted locations of a hotspot, oldest first.
+
+        :param address: address of the hotspot
+        :return: location changes
+        """
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT block, lat, lng, location FROM location_changes "
+                "WHERE address = ? ORDER BY block, rowid",
+                (address,),
+            ).fetchall()
+        return [LocationChange(*row) for row in rows]
+
+    def upsert(self, records: Iterable[Dict[str, Any]]) -> int:
+        """Insert or update hotspots in batches.
+
+        A record without an ``address`` is skipped. A stored hotspot is
+        only replaced by a record asserted at the same or a later block.
+
+        :param records: hotspots in the format of the Helium API
+        :return: number of imported records
+        """
+        rows = (row for row in map(_row, records) if row is not None)
+        count = 0
+        while batch := list(islice(rows, BATCH_SIZE)):
+            with self._lock, self._connection:
+                self._write(_project(batch))
+            count += len(batch)
+        return count
+
+    def import_file(self, path: str) -> int:
+        """Import a dump of hotspots.
+
+        :param path: JSON lines, JSON array or ``.csv`` file of hotspots
+        :return: number of imported records
+        """
+        count = self.upsert(read_hotspots(path))
+        logger.info(f"Imported {count} hotspots from {path}")
+        return count
+
+    def fill(self, hotspots: List[IntegrationHotspot]) -> List[IntegrationHotspot]:
+        """Complete the locations of witnesses from the store.
+
+        Witnesses without a location, or with an assertion ``block`` older
+        than the stored one, are replaced by copies with the stored
+        location. Other witnesses are returned unchanged, without a lookup.
+
+        :param hotspots: hotspots of an integration
+        :return: hotspots with completed locations
+        """
+        lookups = [
+            hotspot.address
+            for hotspot in hotspots
+            if _needs_lookup(hotspot) and getattr(hotspot, "address", None)
+        ]
+        if not lookups:
+            return hotspots
+        stored = self.get_many(lookups)
+        if not stored:
+            return hotspots
+        return [_completed(hotspot, stored) for hotspot in hotspots]
+
+    def close(self) -> None:
+        """Close the database."""
+        with self._lock:
+            self._connection.close()
+
+    def _write(self, batch: List[Tuple[Any, ...]]) -> None:
+        """Write a batch of rows within a transaction."""
+        connection = self._connection
+        connection.execute(
+            "CREATE TEMP TABLE IF NOT EXISTS staging AS "
+            "SELECT * FROM hotspots WHERE 0"
+        )
+        connection.execute("DELETE FROM staging")
+        placeholders = ", ".join("?" * len(COLUMNS))
+        connection.executemany(f"INSERT INTO staging VALUES ({placeholders})", batch)
+        connection.execute(
+            "INSERT INTO location_changes (address, block, lat, lng, location) "
+            "SELECT s.address, s.block, s.lat, s.lng, s.location FROM staging s "
+            "WHERE (s.lat IS NOT NULL OR s.location IS NOT NULL) AND NOT EXISTS ("
+            "SELECT 1 FROM location_changes c WHERE c.address = s.address "
+            "AND c.block IS s.block AND c.lat IS s.lat AND c.lng IS s.lng "
+            "AND c.location IS s.location)"
+        )
+        updates = ", ".join(f"{column} = excluded.{column}" for column in COLUMNS[1:])
+        connection.execute(
+            f"INSERT INTO hotspots SELECT * FROM staging WHERE true "
+            f"ON CONFLICT (address) DO UPDATE SET {updates} "
+            "WHERE excluded.block IS NULL OR hotspots.block IS NULL "
+            "OR excluded.block >= hotspots.block"
+        )
+
+
+def read_hotspots(path: str) -> Iterator[Dict[str, Any]]:
+    """Read the hotspots of a dump.
+
+    :param path: JSON lines, JSON array or ``.csv`` file of hotspots
+    :return: hotspot records
+    """
+    with open(path, newline="") as file:
+        if path.endswith(".csv"):
+            for record in csv.DictReader(file):
+                yield {key: value or None for key, value in record.items()}
+            return
+        for line in file:
+            if not line.strip():
+                continue
+            if line.lstrip().startswith("["):
+                yield from json.loads(line + file.read())
+                return
+            yield json.loads(line)
+
+
+def fill_locations(hotspots: List[IntegrationHotspot]) -> List[IntegrationHotspot]:
+    """Complete the locations of witnesses from the configured store.
+
+    Returns the hotspots unchanged if ``HOTSPOT_STORE_PATH`` is not set.
+
+    :param hotspots: hotspots of an integration
+    :return: hotspots with completed locations
+    """
+    store = configured_store()
+    return hotspots if store is None else store.fill(hotspots)
+
+
+def configured_store() -> Optional[HotspotStore]:
+    """Return the store of the ``HOTSPOT_STORE_PATH`` setting, opened on first use.
+
+    :return: HotspotStore or None if no store is configured
+    """
+    global _store, _resolved
+    if not _resolved:
+        with _lock:
+            if not _resolved:
+                path = get_setting("HOTSPOT_STORE_PATH")
+                _store = None if path is None else HotspotStore(path)
+                _resolved = True
+    return _store
+
+
+def use_store(store: Optional[HotspotStore]) -> None:
+    """Complete the witnesses of all predictions from a store.
+
+    :param store: HotspotStore, None to stop completing witnesses
+    """
+    global _store, _resolved
+    with _lock:
+        _store, _resolved = store, True
+
+
+def _row(record: Dict[str, Any]) -> Optional[Tuple[Any, ...]]:
+    """Return the database row of a hotspot record, None without address."""
+    address = record.get("address") or record.get("id")
+    if not address:
+        return None
+    lat, lng = _float(record.get("lat")), _float(record.get("lng"))
+    block = next(
+        (int(record[field]) for field in BLOCK_FIELDS if record.get(field)), None
+    )
+    return (
+        str(address),
+        record.get("name"),
+        lat,
+        lng,
+        record.get("location"),
+        _float(record.get("gain")),
+        _float(record.get("elevation")),
+        block,
+    )
+
+
+def _project(batch: List[Tuple[Any, ...]]) -> List[Tuple[Any, ...]]:
+    """Return rows with the UTM projection of their location.
+
+    The locations of a UTM zone are projected at once.
+    """
+    zones: Dict[Tuple[int, str], List[int]] = {}
+    for i, row in enumerate(batch):
+        lat, lng = row[2], row[3]
+        if lat is not None and lng is not None and -80.0 <= lat <= 84.0:
+            zone = (latlon_to_zone_number(lat, lng), latitude_to_zone_letter(lat))
+            zones.setdefault(zone, []).append(i)
+    projections: Dict[int, Tuple[Any, ...]] = {}
+    for (number, letter), rows in zones.items():
+        lat = np.array([batch[i][2] for i in rows])
+        lng = np.array([batch[i][3] for i in rows])
+        easting, northing, _, _ = from_latlon(lat, lng, number, letter)
+        for i, e, n in zip(rows, easting.tolist(), northing.tolist()):
+            projections[i] = (e, n, number, letter)
+    return [
+        row + projections.get(i, (None, None, None, None))
+        for i, row in enumerate(batch)
+    ]
+
+
+def _float(value: Any) -> Optional[float]:
+    """Return a value as float, None if missing."""
+    return None if value is None or value == "" else float(value)
+
+
+def _needs_lookup(hotspot: IntegrationHotspot) -> bool:
+    """Return whether the location of a witness may be completed."""
+    if getattr(hotspot, "lat", None) is None or getattr(hotspot, "lng", None) is None:
+        return True
+    return getattr(hotspot, "block", None) is not None
+
+
+def _completed(
+    hotspot: IntegrationHotspot, stored: Dict[str, HotspotInfo]
+) -> IntegrationHotspot:
+    """Return a witness with the stored location if it is missing or older."""
+    info = stored.get(getattr(hotspot, "address", None) or "")
+    if info is None or info.lat is None or info.lng is None:
+        return hotspot
+    missing = hotspot.lat is None or hotspot.lng is None
+    block = getattr(hotspot, "block", None)
+    stale = block is not None and info.block is not None and info.block > block
+    if not (missing or stale):
+        return hotspot
+    return hotspot.copy(update={"lat": info.lat, "lng": info.lng, "block": info.block})
@@ -0,0 +1,57 @@
+"""Listeners module.
+
+.. module:: listeners
+
+:synopsis: Notification of components about every new prediction.
+
+.. moduleauthor:: DSIA21
+
+"""
+
+import logging
+from typing import Callable
+from typing import List
+
+from helium_positioning_api.DataObjects import Prediction
+
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+Listener = Callable[[Prediction, str], None]
+
+_listeners: List[Listener] = []
+
+
+def add_listener(listener: Listener) -> None:
+    """Register a function called with every new prediction and its model name.
+
+    :param listener: function taking a Prediction and the name of the model
+    """
+    if listener not in _listeners:
+        _listeners.append(listener)
+
+
+def remove_listener(listener: Listener) -> None:
+    """Unregister a listener.
+
+    :param listener: registered function
+    """
+    if listener in _listeners:
+        _listeners.remove(listener)
+
+
+def notify(prediction: Prediction, model: str) -> None:
+    """Call every listener with a new prediction.
+
+    A failing listener is logged and does not affect the others or the
+    caller of the prediction.
+
+    :param prediction: new Prediction
+    :param model: name of the model that produced the prediction
+    """
+    for listener in list(_listeners):
+        try:
+            listener(prediction, model)
+        except Exception:  # noqa: B902
+            logger.exception(f"Listener {listener} failed")
@@ -0,0 +1,263 @@
+"""Lookup table module.
+
+.. module:: lookup_table
+
+:synopsis: Precomputed distance model with interpolated lookups.
+
+.. moduleauthor:: DSIA21
+
+A lookup table holds the distances a regression model predicts on a grid
+of rssi and snr values for every datarate and frequency of the grid.
+Lookups interpolate the logarithm of the distance bilinearly between the
+rssi/snr grid points, since distances grow exponentially with the path
+loss, use the nearest frequency of the grid and average over all datarates
+for unknown datarates. Values outside the grid are clipped to its edges.
+"""
+
+from dataclasses import dataclass
+from dataclasses import field
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import Sequence
+from typing import Tuple
+
+import numpy as np
+import numpy.typing as npt
+import pandas as pd
+
+
+FloatArray = npt.NDArray[np.float64]
+
+# distances are interpolated in log space and not shorter than this, in meters
+MIN_DISTANCE = 1.0
+RSSI_GRID = np.arange(-140.0, -29.0, 1.0)
+SNR_GRID = np.arange(-25.0, 15.5, 0.5)
+DATARATES = (
+    "SF7BW125",
+    "SF8BW125",
+    "SF9BW125",
+    "SF10BW125",
+    "SF11BW125",
+    "SF12BW125",
+    "SF8BW500",
+)
+# EU868 and US915 (sub-band 2) uplink channels in MHz
+FREQUENCIES = (
+    867.1,
+    867.3,
+    867.5,
+    867.7,
+    867.9,
+    868.1,
+    868.3,
+    868.5,
+    903.9,
+    904.1,
+    904.3,
+    904.5,
+    904.7,
+    904.9,
+    905.1,
+    905.3,
+)
+
+
+@dataclass
+class DistanceLookupTable:
+    """Distances predicted by a model on a grid of features."""
+
+    rssi: FloatArray
+    snr: FloatArray
+    datarates: List[str]
+    frequencies: FloatArray
+    # distances with shape (datarates, frequencies, rssi, snr)
+    table: npt.NDArray[np.float32]
+    source_model: str = ""
+    max_error: float = float("nan")
+    p99_error: float = float("nan")
+    _datarate_index: Dict[str, int] = field(init=False, repr=False)
+    _log_table: FloatArray = field(init=False, repr=False)
+    _log_any_datarate: FloatArray = field(init=False, repr=False)
+
+    def __post_init__(self) -> None:
+        """Index the datarates and precompute the log distances."""
+        self._datarate_index = {d: i for i, d in enumerate(self.datarates)}
+        self._log_table = np.log(np.maximum(self.table, MIN_DISTANCE))
+        self._log_any_datarate = np.log(
+            np.maximum(self.table, MIN_DISTANCE).mean(axis=0)
+        )
+
+    @classmethod
+    def build(
+        cls,
+        predict: Callable[[pd.DataFrame], FloatArray],
+        source_model: str = "",
+        rssi: npt.ArrayLike = RSSI_GRID,
+        snr: npt.ArrayLike = SNR_GRID,
+        datarates: Sequence[str] = DATARATES,
+        frequencies: npt.ArrayLike = FREQUENCIES,
+        n_samples: int = 10000,
+        seed: int = 0,
+    ) -> "DistanceLookupTable":
+        """Evaluate a model on the grid and measure the error of the table.
+
+        :param predict: function predicting distances for a feature data frame
+        :param source_model: name of the evaluated model
+        :param rssi: rssi grid in dBm
+        :param snr: snr grid in dB
+        :param datarates: datarates of the grid
+        :param frequencies: frequencies of the grid in MHz
+        :param n_samples: random off-grid samples to measure the error on
+        :param seed: seed of the random samples
+
+        :return: DistanceLookupTable
+        """
+        rssi_grid = np.asarray(rssi, dtype=np.float64)
+        snr_grid = np.asarray(snr, dtype=np.float64)
+        frequency_grid = np.sort(np.asarray(frequencies, dtype=np.float64))
+        rssi_values, snr_values = np.meshgrid(rssi_grid, snr_grid, indexing="ij")
+
+        table = np.empty(
+            (len(datarates), len(frequency_grid), len(rssi_grid), len(snr_grid)),
+            dtype=np.float32,
+        )
+        for i, datarate in enumerate(datarates):
+            for j, frequency in enumerate(frequency_grid):
+                features = pd.DataFrame(
+                    {
+                        "snr": snr_values.ravel(),
+                        "rssi": rssi_values.ravel(),
+                        "datarate": datarate,
+                        "frequency": frequency,
+                    }
+                )
+                table[i, j] = np.asarray(predict(features)).reshape(rssi_values.shape)
+
+        lookup_table = cls(
+            rssi=rssi_grid,
+            snr=snr_grid,
+            datarates=list(datarates),
+            frequencies=frequency_grid,
+            table=table,
+            source_model=source_model,
+        )
+        if n_samples > 0:
+            lookup_table.measure_error(predict, n_samples, seed)
+        return lookup_table
+
+    def measure_error(
+        self,
+        predict: Callable[[pd.DataFrame], FloatArray],
+        n_samples: int = 10000,
+        seed: int = 0,
+    ) -> None:
+        """Measure the absolute error against the model on random grid features.
+
+        Sets ``max_error`` and ``p99_error`` in meters.
+
+        :param predict: function predicting distances for a feature data frame
+        :param n_samples: number of random samples
+        :param seed: seed of the random samples
+        """
+        rng = np.random.default_rng(seed)
+        features = pd.DataFrame(
+            {
+                "snr": rng.uniform(self.snr[0], self.snr[-1], n_samples),
+                "rssi": rng.uniform(self.rssi[0], self.rssi[-1], n_samples),
+                "datarate": rng.choice(self.datarates, n_samples),
+                "frequency": rng.choice(self.frequencies, n_samples),
+            }
+        )
+        expected = np.asarray(predict(features)).reshape(-1)
+        error = np.abs(self.predict(features.to_dict(orient="list")) - expected)
+        self.max_error = float(error.max())
+        self.p99_error = float(np.percentile(error, 99))
+
+    def predict(self, features: Dict[str, List[Any]]) -> FloatArray:
+        """Return the interpolated distances for features.
+
+        :param features: lists of snr, rssi, datarate and frequency
+        :return: distances
+        """
+        rssi = np.asarray(features["rssi"], dtype=np.float64)
+        snr = np.asarray(features["snr"], dtype=np.float64)
+        frequency = np.asarray(features["frequency"], dtype=np.float64)
+        datarate = np.array(
+            [self._datarate_index.get(str(d), -1) for d in features["datarate"]]
+        )
+
+        # nearest frequency of the grid
+        upper = np.clip(np.searchsorted(self.frequencies, frequency), 1, None)
+        upper = np.minimum(upper, len(self.frequencies) - 1)
+        lower = np.maximum(upper - 1, 0)
+        closer_lower = np.abs(frequency - self.frequencies[lower]) <= np.abs(
+            self.frequencies[upper] - frequency
+        )
+        f = np.where(closer_lower, lower, upper)
+
+        i, w_rssi = _grid_position(self.rssi, rssi)
+        j, w_snr = _grid_position(self.snr, snr)
+
+        def corner(di: int, dj: int) -> FloatArray:
+            known = self._log_table[np.maximum(datarate, 0), f, i + di, j + dj]
+            unknown = self._log_any_datarate[f, i + di, j + dj]
+            return np.where(datarate >= 0, known, unknown)
+
+        distances: FloatArray = np.exp(
+            corner(0, 0) * (1 - w_rssi) * (1 - w_snr)
+            + corner(1, 0) * w_rssi * (1 - w_snr)
+            + corner(0, 1) * (1 - w_rssi) * w_snr
+            + corner(1, 1) * w_rssi * w_snr
+        ).astype(np.float64)
+        return distances
+
+    def save(self, path: str) -> None:
+        """Save the table as ``.npz`` file.
+
+        :param path: file path
+        """
+        np.savez_compressed(
+            path,
+            rssi=self.rssi,
+            snr=self.snr,
+            datarates=np.array(self.datarates),
+            frequencies=self.frequencies,
+            table=self.table,
+            source_model=np.array(self.source_model),
+            max_error=np.array(self.max_error),
+            p99_error=np.array(self.p99_error),
+        )
+
+    @classmethod
+    def load(cls, path: str) -> "DistanceLookupTable":
+        """Load a table saved by :meth:`save`.
+
+        :param path: file path
+        :return: DistanceLookupTable
+        """
+        with np.load(path) as data:
+            return cls(
+                rssi=data["rssi"],
+                snr=data["snr"],
+                datarates=[str(d) for d in data["datarates"]],
+                frequencies=data["frequencies"],
+                table=data["table"],
+                source_model=str(data["source_model"]),
+                max_error=float(data["max_error"]),
+                p99_error=float(data["p99_error"]),
+            )
+
+
+def _grid_position(
+    grid: FloatArray, values: FloatArray
+) -> Tuple[npt.NDArray[np.intp], FloatArray]:
+    """Return the lower grid index and interpolation weight of values.
+
+    Values outside the grid are clipped to its edges.
+    """
+    values = np.clip(values, grid[0], grid[-1])
+    index = np.clip(np.searchsorted(grid, values, side="right") - 1, 0, len(grid) - 2)
+    weight = (values - grid[index]) / (grid[index + 1] - grid[index])
+    return index, weight
@@ -0,0 +1,244 @@
+"""Metrics module.
+
+.. module:: metrics
+
+:synopsis: In-process counters, gauges and histograms in the Prometheus text format.
+
+.. moduleauthor:: DSIA21
+
+Metrics are created once by the modules that update them and rendered by
+the ``/metrics`` endpoint. Every worker process has its own metrics.
+"""
+
+import math
+import threading
+from abc import ABC
+from abc import abstractmethod
+from bisect import bisect_left
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import Sequence
+from typing import Tuple
+
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+Labels = Tuple[str, ...]
+
+_registry: Dict[str, "Metric"] = {}
+_lock = threading.Lock()
+
+
+class Metric(ABC):
+    """Metric with optional labels."""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, description: str, labels: Sequence[str] = ()) -> None:
+        """Create a metric.
+
+        :param name: name of the metric
+        :param description: help text
+        :param labels: names of the labels
+        """
+        self.name = name
+        self.description = description
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Labels:
+        """Return the label values in the order of the label names."""
+        return tuple(str(labels[name]) for name in self.labels)
+
+    def _format(self, key: Labels, extra: str = "") -> str:
+        """Return the label set of a sample."""
+        pairs = [f'{name}="{value}"' for name, value in zip(self.labels, key)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    @abstractmethod
+    def samples(self) -> List[str]:
+        """Return the sample lines of the metric."""
+
+    def render(self) -> str:
+        """Return the metric in the Prometheus text format."""
+        lines = [
+            f"# HELP {self.name} {self.description}",
+            f"# TYPE {self.name} {self.kind}",
+        ]
+        return "\n".join(lines + self.samples())
+
+
+class Counter(Metric):
+    """Monotonically increasing value."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, description: str, labels: Sequence[str] = ()) -> None:
+        """Create a counter at zero."""
+        super().__init__(name, description, labels)
+        self._values: Dict[Labels, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        """Increase the counter.
+
+        :param amount: increment
+        :param labels: label values
+        """
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def samples(self) -> List[str]:
+        """Return the sample lines of the counter."""
+        with self._lock:
+            return [
+                f"{self.name}{self._format(key)} {value}"
+                for key, value in sorted(self._values.items())
+            ]
+
+
+class Gauge(Metric):
+    """Value that is set or read from a function when rendered."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, description: str, labels: Sequence[str] = ()) -> None:
+        """Create a gauge without values."""
+        super().__init__(name, description, labels)
+        self._values: Dict[Labels, float] = {}
+        self._functions: List[Callable[[], Dict[Labels, float]]] = []
+
+    def set(self, value: float, **labels: str) -> None:
+        """Set the value.
+
+        :param value: new value
+        :param labels: label values
+        """
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def set_function(self, function: Callable[[], Dict[Labels, float]]) -> None:
+        """Read values from a function whenever the gauge is rendered.
+
+        :param function: returns the values by label values
+        """
+        self._functions.append(function)
+
+    def samples(self) -> List[str]:
+        """Return the sample lines of the gauge."""
+        with self._lock:
+            values = dict(self._values)
+        for function in self._functions:
+            values.update(function())
+        return [
+            f"{self.name}{self._format(key)} {value}"
+            for key, value in sorted(values.items())
+        ]
+
+
+class Histogram(Metric):
+    """Distribution of observations in cumulative buckets."""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        description: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> None:
+        """Create an empty histogram.
+
+        :param buckets: upper bounds of the buckets
+        """
+        super().__init__(name, description, labels)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self._counts: Dict[Labels, List[int]] = {}
+        self._sums: Dict[Labels, float] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        """Add an observation.
+
+        :param value: observed value
+        :param labels: label values
+        """
+        key = self._key(labels)
+        with self._lock:
+            counts = self._counts.setdefault(key, [0] * len(self.buckets))
+            counts[bisect_left(self.buckets, value)] += 1
+            self._sums[key] = self._sums.get(key, 0.0) + value
+
+    def samples(self) -> List[str]:
+        """Return the sample lines of the histogram."""
+        lines = []
+        with self._lock:
+            for key, counts in sorted(self._counts.items()):
+                total = 0
+                for bound, count in zip(self.buckets, counts):
+                    total += count
+                    le = "+Inf" if math.isinf(bound) else repr(bound)
+                    labels = self._format(key, 'le="' + le + '"')
+                    lines.append(f"{self.name}_bucket{labels} {total}")
+                lines.append(f"{self.name}_sum{self._format(key)} {self._sums[key]}")
+                lines.append(f"{self.name}_count{self._format(key)} {total}")
+        return lines
+
+
+def counter(name: str, description: str, labels: Sequence[str] = ()) -> Counter:
+    """Return the registered counter of a name, creating it on first use.
+
+    :param name: name of the metric
+    :param description: help text
+    :param labels: names of the labels
+    :return: Counter
+    """
+    return _register(Counter(name, description, labels))  # type: ignore[return-value]
+
+
+def gauge(name: str, description: str, labels: Sequence[str] = ()) -> Gauge:
+    """Return the registered gauge of a name, creating it on first use.
+
+    :param name: name of the metric
+    :param description: help text
+    :param labels: names of the labels
+    :return: Gauge
+    """
+    return _register(Gauge(name, description, labels))  # type: ignore[return-value]
+
+
+def histogram(
+    name: str,
+    description: str,
+    labels: Sequence[str] = (),
+    buckets: Sequence[float] = DEFAULT_BUCKETS,
+) -> Histogram:
+    """Return the registered histogram of a name, creating it on first use.
+
+    :param name: name of the metric
+    :param description: help text
+    :param labels: names of the labels
+    :param buckets: upper bounds of the buckets
+    :return: Histogram
+    """
+    metric = Histogram(name, description, labels, buckets)
+    return _register(metric)  # type: ignore[return-value]
+
+
+def render() -> str:
+    """Return all registered metrics in the Prometheus text format.
+
+    :return: exposition text
+    """
+    with _lock:
+        metrics = list(_registry.values())
+    return "\n".join(metric.render() for metric in metrics) + "\n"
+
+
+def _register(metric: Metric) -> Metric:
+    """Register a metric unless one of the same name exists."""
+    with _lock:
+        return _registry.setdefault(metric.name, metric)
@@ -0,0 +1,97 @@
+"""Models module.
+
+.. module:: models
+
+:synopsis: Registry of the available positioning models.
+
+.. moduleauthor:: DSIA21
+
+"""
+
+from functools import partial
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import Optional
+
+from helium_api_wrapper.DataObjects import IntegrationHotspot
+
+from helium_positioning_api.DataObjects import Observation
+from helium_positioning_api.DataObjects import Prediction
+from helium_positioning_api.fingerprinting import fingerprinting
+from helium_positioning_api.listeners import notify
+from helium_positioning_api.midpoint import midpoint
+from helium_positioning_api.nearest_neighbor import nearest_neighbor
+from helium_positioning_api.routing import auto
+from helium_positioning_api.trilateration import trilateration
+from helium_positioning_api.weighted_centroid import weighted_centroid
+
+
+# every model is called with the device uuid and optionally the hotspots of
+# its last integration
+MODELS: Dict[str, Callable[..., Prediction]] = {
+    "nearest_neighbor": nearest_neighbor,
+    "midpoint": midpoint,
+    "linear_regression": partial(trilateration, model="linear_regression"),
+    "gradient_boosting": partial(trilateration, model="gradient_boosting"),
+    "gradient_boosting_lut": partial(trilateration, model="gradient_boosting_lut"),
+    "fingerprinting": fingerprinting,
+    "weighted_centroid": weighted_centroid,
+    "auto": auto,
+}
+
+
+def predict(
+    uuid: str,
+    model: str,
+    hotspots: Optional[List[IntegrationHotspot]] = None,
+    record: bool = True,
+) -> Prediction:
+    """Predict the position of a device with the given model.
+
+    Registered listeners are notified about the prediction.
+
+    :param uuid: Device id
+    :param model: name of the model
+    :param hotspots: hotspots of the last integration, loaded if not given
+    :param record: whether to notify the listeners
+
+    :return: coordinates of predicted location
+    """
+    if model not in MODELS:
+        raise ValueError(f"Model {model} not implemented.")
+    prediction = MODELS[model](uuid, hotspots=hotspots)
+    if record:
+        notify(prediction, model)
+    return prediction
+
+
+def predict_observations(
+    observations: List[Observation], model: str, uuid: Optional[str] = None
+) -> Prediction:
+    """Predict the position of a device from the hotspots that witnessed it.
+
+    The Console is not contacted. Listeners are only notified if the
+    device id is given.
+
+    :param observations: hotspots of an uplink of the device
+    :param model: name of the model
+    :param uuid: Device id
+
+    :return: coordinates of predicted location
+    """
+    if not observations:
+        raise ValueError("No hotspot observations given.")
+    return predict(uuid or "", model, to_hotspots(observations), uuid is not None)
+
+
+def to_hotspots(observations: List[Observation]) -> List[IntegrationHotspot]:
+    """Return observations as the hotspots of an integration.
+
+    :param observations: hotspot observations
+    :return: IntegrationHotspots
+    """
+    return [
+        IntegrationHotspot.construct(**observation.dict())
+        for observation in observations
+    ]
@@ -1,30 +1,42 @@
 """Nearest neighbor for the positioning API."""
 
 import logging
+from typing import List
+from typing import Optional
+
+from helium_api_wrapper.DataObjects import IntegrationHotspot
 
 from helium_positioning_api.auxilary import get_integration_hotspots
 from helium_positioning_api.DataObjects import Prediction
+from helium_positioning_api.witnesses import select_witnesses
 
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
-def nearest_neighbor(uuid: str) -> Prediction:
+def nearest_neighbor(
+    uuid: str, hotspots: Optional[List[IntegrationHotspot]] = None
+) -> Prediction:
     """This model predicts the location of a given device.
 
     It takes the location of the nearest witness
     in terms of highest rssi recieved.
 
     :param uuid: Device id
+    :param hotspots: hotspots of the last integration, loaded if not given
     :return: coordinates of predicted location
     """
-    hotspots = get_integration_hotspots(uuid)
-    sorted_hotspots = sorted(hotspots, key=lambda h: h.rssi)
-    neighbor = sorted_hotspots[0]
+    if hotspots is None:
+        hotspots = get_integration_hotspots(uuid)
+    witnesses = select_witnesses(hotspots, top_k=1)
+    if not len(witnesses):
+        raise ValueError(f"No hotspots with a location found for device {uuid}")
+    neighbor = witnesses.hotspots[0]
     return Prediction(
         uuid=uuid,
         lat=neighbor.lat,
         lng=neighbor.lng,
+        model="nearest_neighbor",
         # timestamp=neighbor.reported_at,
     )
@@ -0,0 +1,349 @@
+"""Prefetch module.
+
+.. module:: prefetch
+
+:synopsis: Prediction cache with a background refresher for frequently polled devices.
+
+.. moduleauthor:: DSIA21
+
+Predictions are cached per device and model for a fixed time to live, and
+every lookup counts as an access of the entry. The access rate of an entry
+is an exponentially decaying count, so a device polled by a dashboard stays
+hot while a device asked for once cools down. Shortly before a hot entry
+expires, the refresher loads the last integration of the device again and
+recomputes the cached predictions of all its models, so the next request is
+served from the cache instead of paying the Console round trip. Refreshes
+are limited by a budget of upstream calls per second; the hottest devices
+are refreshed first and the others are left to expire.
+"""
+
+import logging
+import math
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+from helium_positioning_api.auxilary import get_integration_hotspots
+from helium_positioning_api.auxilary import get_setting
+from helium_positioning_api.DataObjects import Prediction
+from helium_positioning_api.listeners import notify
+from helium_positioning_api.metrics import counter
+from helium_positioning_api.metrics import gauge
+from helium_positioning_api.models import predict
+from helium_positioning_api.server import worker_count
+
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+MAX_ENTRIES = 100_000  # cached predictions, the least recently used are evicted
+# seconds after which the access count of an entry has decayed to 1/e
+ACCESS_DECAY = 60.0
+# accesses per time to live from which an entry is refreshed before it
+# expires, a device asked for once is not refreshed
+HOT_ACCESSES = 2.0
+# part of the time to live before the expiry in which hot entries are refreshed
+LEAD_FRACTION = 0.2
+INTERVAL = 0.5  # seconds between two runs of the refresher
+
+Key = Tuple[str, str]  # (uuid, model)
+
+lookups = counter(
+    "prediction_cache_lookups",
+    "Lookups of cached predictions.",
+    ("result",),
+)
+refreshes = counter(
+    "prefetch_refreshes",
+    "Devices refreshed before their cached predictions expired.",
+    ("result",),
+)
+deferred = counter(
+    "prefetch_deferred",
+    "Hot devices not refreshed because the upstream budget was spent.",
+)
+
+
+@dataclass
+class Entry:
+    """Cached prediction of a device and its access statistics."""
+
+    prediction: Prediction
+    # monotonic time after which the prediction is not served anymore
+    expires: float
+    # exponentially decaying number of accesses
+    accesses: float = 0.0
+    accessed: float = 0.0
+    # monotonic time of the first access
+    created: float = 0.0
+    # monotonic time before which a failed refresh is not retried
+    retry: float = 0.0
+
+    def access_rate(self, now: float) -> float:
+        """Return the decayed accesses per second.
+
+        Entries younger than the decay time are rated over their age, so a
+        polled device is hot within its first time to live.
+
+        :param now: monotonic time
+        :return: accesses per second
+        """
+        decay = math.exp(-(now - self.accessed) / ACCESS_DECAY)
+        return self.accesses * decay / min(max(now - self.created, 1.0), ACCESS_DECAY)
+
+
+class PredictionCache:
+    """Predictions per device and model, served until their time to live ends."""
+
+    def __init__(self, ttl: float = 0.0, max_entries: int = MAX_ENTRIES) -> None:
+        """Create an empty cache.
+
+        :param ttl: seconds a prediction is served, caching is disabled if 0
+        :param max_entries: entries kept at most
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Key, Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        """Return the number of entries, including expired ones."""
+        return len(self._entries)
+
+    def export_metrics(self) -> None:
+        """Report the number of entries in the metrics."""
+        gauge("prediction_cache_entries", "Cached predictions.").set_function(
+            lambda: {(): float(len(self))}
+        )
+
+    def get(self, uuid: str, model: str) -> Optional[Prediction]:
+        """Return the cached prediction of a device and count the access.
+
+        Expired entries are kept for their access statistics.
+
+        :param uuid: Device id
+        :param model: name of the model
+        :return: Prediction or None if not cached or expired
+        """
+        if not self.ttl:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get((uuid, model))
+            if entry is None:
+                lookups.inc(result="miss")
+                return None
+            self._entries.move_to_end((uuid, model))
+            decay = math.exp(-(now - entry.accessed) / ACCESS_DECAY)
+            entry.accesses = entry.accesses * decay + 1.0
+            entry.accessed = now
+            if entry.expires <= now:
+                lookups.inc(result="expired")
+                return None
+        lookups.inc(result="hit")
+        return entry.prediction
+
+    def put(self, uuid: str, model: str, prediction: Prediction) -> None:
+        """Cache the prediction of a device for the time to live.
+
+        The access statistics of a replaced entry are kept.
+
+        :param uuid: Device id
+        :param model: name of the model
+        :param prediction: Prediction
+        """
+        if not self.ttl:
+            return
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get((uuid, model))
+            if entry is None:
+                # the prediction was computed for a request
+                self._entries[(uuid, model)] = Entry(
+                    prediction, now + self.ttl, accesses=1.0, accessed=now, created=now
+                )
+                if len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+            else:
+                entry.prediction = prediction
+                entry.expires = now + self.ttl
+                self._entries.move_to_end((uuid, model))
+
+    def due(self, lead: float, min_rate: float) -> List[Tuple[str, List[str]]]:
+        """Return the hot devices whose entries expire within the lead time.
+
+        :param lead: seconds before the expiry
+        :param min_rate: accesses per second from which an entry is hot
+        :return: devices with the models to refresh, hottest first
+        """
+        now = time.monotonic()
+        devices: Dict[str, Tuple[float, List[str]]] = {}
+        # the entries are rated outside the lock, so lookups are not blocked
+        # while the whole cache is scanned
+        with self._lock:
+            entries = list(self._entries.items())
+        for (uuid, model), entry in entries:
+            if entry.expires - now > lead or entry.retry > now:
+                continue
+            rate = entry.access_rate(now)
+            if rate < min_rate:
+                continue
+            hottest, models = devices.get(uuid, (0.0, []))
+            devices[uuid] = (max(hottest, rate), models + [model])
+        ranked = sorted(devices.items(), key=lambda item: -item[1][0])
+        return [(uuid, models) for uuid, (_, models) in ranked]
+
+    def postpone(self, uuid: str, models: List[str], seconds: float) -> None:
+        """Exclude entries of a device from refreshing for a while.
+
+        :param uuid: Device id
+        :param models: models of the entries
+        :param seconds: time until the entries are due again
+        """
+        retry = time.monotonic() + seconds
+        with self._lock:
+            for model in models:
+                entry = self._entries.get((uuid, model))
+                if entry is not None:
+                    entry.retry = retry
+
+    def previous(self, uuid: str, model: str) -> Optional[Prediction]:
+        """Return the cached prediction of a device, expired or not.
+
+        :param uuid: Device id
+        :param model: name of the model
+        :return: Prediction or None if not cached
+        """
+        with self._lock:
+            entry = self._entries.get((uuid, model))
+            return None if entry is None else entry.prediction
+
+
+class Prefetcher:
+    """Refreshes the cached predictions of hot devices in a background thread."""
+
+    def __init__(
+        self,
+        cache: PredictionCache,
+        budget: float,
+        lead: Optional[float] = None,
+        interval: float = INTERVAL,
+    ) -> None:
+        """Create a stopped refresher.
+
+        :param cache: cache to refresh
+        :param budget: upstream calls per second
+        :param lead: seconds before the expiry to refresh, a fifth of the
+            time to live if None
+        :param interval: seconds between two runs, at most half the lead time
+        """
+        if not cache.ttl:
+            raise ValueError("Predictions are not cached.")
+        self.cache = cache
+        self.budget = budget
+        self.lead = LEAD_FRACTION * cache.ttl if lead is None else lead
+        # every due entry is seen at least twice within the lead time
+        self.interval = min(interval, self.lead / 2)
+        # upstream calls that can be made right away, at most a second's budget
+        self._capacity = max(budget, 1.0)
+        self._tokens = self._capacity
+        self._filled = time.monotonic()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        """Start refreshing in a daemon thread."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="prefetch", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop refreshing and wait for the running refresh."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def refresh_due(self) -> int:
+        """Refresh the hot devices that are due within the budget.
+
+        :return: number of devices refreshed
+        """
+        now = time.monotonic()
+        self._tokens = min(
+            self._capacity, self._tokens + (now - self._filled) * self.budget
+        )
+        self._filled = now
+        due = self.cache.due(self.lead, HOT_ACCESSES / self.cache.ttl)
+        refreshed = 0
+        for i, (uuid, models) in enumerate(due):
+            if self._tokens < 1.0 or self._stop.is_set():
+                deferred.inc(len(due) - i)
+                break
+            self._tokens -= 1.0
+            refreshed += self.refresh(uuid, models)
+        return refreshed
+
+    def refresh(self, uuid: str, models: List[str]) -> bool:
+        """Load the last integration of a device and recompute its predictions.
+
+        Listeners are notified of predictions that changed. After a failed
+        refresh the device is not retried within the lead time, the cached
+        predictions expire.
+
+        :param uuid: Device id
+        :param models: models of the cached predictions
+        :return: whether the device was refreshed
+        """
+        try:
+            hotspots = get_integration_hotspots(uuid)
+            for model in models:
+                prediction = predict(uuid, model, hotspots, record=False)
+                if prediction != self.cache.previous(uuid, model):
+                    notify(prediction, model)
+                self.cache.put(uuid, model, prediction)
+        except Exception as exception:  # noqa: B902
+            logger.warning(f"Refresh of device {uuid} failed: {exception}")
+            self.cache.postpone(uuid, models, self.lead)
+            refreshes.inc(result="failed")
+            return False
+        refreshes.inc(result="refreshed")
+        return True
+
+    def _run(self) -> None:
+        """Refresh the due devices until stopped."""
+        while not self._stop.wait(self.interval):
+            self.refresh_due()
+
+
+def configured_ttl() -> float:
+    """Return the time to live of cached predictions configured by the settings.
+
+    :return: ``PREDICTION_TTL`` in seconds, 0 if predictions are not cached
+    """
+    return float(get_setting("PREDICTION_TTL", "0") or 0)
+
+
+def configured_prefetcher(cache: PredictionCache) -> Optional[Prefetcher]:
+    """Return the refresher configured by the settings.
+
+    ``PREFETCH_BUDGET`` is the number of upstream calls per second the
+    refreshers of all worker processes may make together, every worker
+    refreshes its own cache with its share. ``PREFETCH_LEAD`` is the seconds
+    before the expiry in which hot entries are refreshed.
+
+    :param cache: cache to refresh
+    :return: Prefetcher or None if caching or prefetching is disabled
+    """
+    budget = float(get_setting("PREFETCH_BUDGET", "0") or 0) / worker_count()
+    if not cache.ttl or not budget:
+        return None
+    lead = get_setting("PREFETCH_LEAD")
+    return Prefetcher(cache, budget, None if lead is None else float(lead))
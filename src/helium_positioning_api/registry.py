@@ -0,0 +1,392 @@
+"""Registry module.
+
+.. module:: registry
+
+:synopsis: Compact array-backed registry of the latest position of every device.
+
+.. moduleauthor:: DSIA21
+
+Every device gets a dense integer slot. The latest lat, lng, conf,
+timestamp and model id of the devices are columns of preallocated typed
+arrays indexed by slot, grown in chunks. Device ids in the canonical UUID
+form are stored as two 64-bit integers and found through an open
+addressing hash table of slots, so no Python object is kept per device;
+other ids are kept in a dictionary. A device takes about 60 bytes,
+including the hash table.
+
+With a directory, the columns are memory-mapped ``.npy`` files and the
+registry survives restarts; the metadata is written by
+:meth:`PositionRegistry.flush`, at the latest ``FLUSH_INTERVAL`` seconds
+after a change. A directory is written by a single process, which holds
+an exclusive lock on it until the registry is closed.
+"""
+
+import fcntl
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+import numpy as np
+import numpy.typing as npt
+
+from helium_positioning_api.DataObjects import Prediction
+
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+CHUNK = 65536  # slots the columns grow by
+FLUSH_INTERVAL = 60.0  # seconds after which a persisted registry is flushed
+GOLDEN = 0x9E3779B97F4A7C15  # multiplier of the Fibonacci hash
+MASK = (1 << 64) - 1
+SIGN = 1 << 63
+HEX_DIGITS = "0123456789abcdef"
+EMPTY = -1
+
+# the halves of a UUID are stored as signed integers, numpy compares
+# unsigned 64-bit values with Python integers through float64
+COLUMNS = {
+    "hi": np.int64,
+    "lo": np.int64,
+    "lat": np.float64,
+    "lng": np.float64,
+    "conf": np.float32,
+    "timestamp": np.int64,
+    "model": np.int16,
+}
+
+
+class PositionRegistry:
+    """Latest position of every device in typed arrays indexed by slot."""
+
+    def __init__(self, path: Optional[str] = None) -> None:
+        """Create an empty registry or open a persisted one.
+
+        :param path: directory of the memory-mapped columns, in memory if None
+        :raises ValueError: if another process has the directory open
+        """
+        self.path = path
+        self._size = 0
+        self._models: List[str] = []
+        self._model_ids: Dict[str, int] = {}
+        # slots of device ids that are not canonical UUIDs
+        self._names: Dict[str, int] = {}
+        self._slot_names: Dict[int, str] = {}
+        self._lock = threading.Lock()
+        self._columns: Dict[str, npt.NDArray[Any]] = {}
+        self._flushed = time.monotonic()
+        self._lock_file: Optional[int] = None
+        if path is not None:
+            os.makedirs(path, exist_ok=True)
+            self._lock_file = _lock(path)
+        if path is not None and os.path.exists(os.path.join(path, "meta.json")):
+            self._open()
+        else:
+            self._allocate(CHUNK)
+        self._rehash()
+
+    def __len__(self) -> int:
+        """Return the number of devices."""
+        return self._size
+
+    def __contains__(self, uuid: str) -> bool:
+        """Return whether a device is registered."""
+        return self._find(uuid) != EMPTY
+
+    def update(
+        self,
+        uuid: str,
+        lat: float,
+        lng: float,
+        conf: Optional[float] = None,
+        model: Optional[str] = None,
+        timestamp: Optional[int] = None,
+    ) -> None:
+        """Set the latest position of a device.
+
+        :param uuid: Device id
+        :param lat: latitude
+        :param lng: longitude
+        :param conf: confidence, NaN if None
+        :param model: name of the model that predicted the position
+        :param timestamp: time in milliseconds, now if None
+        """
+        if timestamp is None:
+            timestamp = int(time.time() * 1000)
+        with self._lock:
+            slot = self._find(uuid)
+            if slot == EMPTY:
+                slot = self._insert(uuid)
+            columns = self._columns
+            columns["lat"][slot] = lat
+            columns["lng"][slot] = lng
+            columns["conf"][slot] = np.nan if conf is None else conf
+            columns["timestamp"][slot] = timestamp
+            columns["model"][slot] = self._model_id(model)
+        if self.path is not None and time.monotonic() - self._flushed > FLUSH_INTERVAL:
+            self.flush()
+
+    def get(self, uuid: str) -> Optional[Prediction]:
+        """Return the latest position of a device.
+
+        :param uuid: Device id
+        :return: Prediction or None if the device is unknown
+        """
+        with self._lock:
+            slot = self._find(uuid)
+            if slot == EMPTY:
+                return None
+            columns = self._columns
+            conf = float(columns["conf"][slot])
+            model = int(columns["model"][slot])
+            return Prediction(
+                uuid=uuid,
+                lat=float(columns["lat"][slot]),
+                lng=float(columns["lng"][slot]),
+                conf=None if np.isnan(conf) else conf,
+                model=None if model == EMPTY else self._models[model],
+            )
+
+    def timestamp(self, uuid: str) -> Optional[int]:
+        """Return the time of the latest position of a device.
+
+        :param uuid: Device id
+        :return: milliseconds or None if the device is unknown
+        """
+        with self._lock:
+            slot = self._find(uuid)
+            return None if slot == EMPTY else int(self._columns["timestamp"][slot])
+
+    def snapshot(self) -> Dict[str, npt.NDArray[Any]]:
+        """Return a copy of the latest positions of all devices.
+
+        :return: ``uuid`` (object array), ``lat``, ``lng``, ``conf``,
+            ``timestamp`` and ``model`` (object array, None if unknown) by slot
+        """
+        with self._lock:
+            n = self._size
+            columns = {
+                name: column[:n].copy() for name, column in self._columns.items()
+            }
+            slot_names = dict(self._slot_names)
+            models = np.array(self._models + [None], dtype=object)
+        digits = (
+            np.column_stack([columns["hi"], columns["lo"]])
+            .astype(">i8")
+            .tobytes()
+            .hex()
+        )
+        uuids = np.array(
+            [_format(digits[32 * slot : 32 * slot + 32]) for slot in range(n)],
+            dtype=object,
+        )
+        for slot, name in slot_names.items():
+            uuids[slot] = name
+        return {
+            "uuid": uuids,
+            "lat": columns["lat"],
+            "lng": columns["lng"],
+            "conf": columns["conf"],
+            "timestamp": columns["timestamp"],
+            "model": models[columns["model"]],
+        }
+
+    def update_prediction(self, prediction: Prediction, model: str) -> None:
+        """Register the position of a prediction, ignore unsuccessful ones.
+
+        Can be registered with :func:`helium_positioning_api.listeners.add_listener`.
+
+        :param prediction: Prediction
+        :param model: name of the model that produced the prediction
+        """
+        if prediction.lat is not None and prediction.lng is not None:
+            self.update(
+                prediction.uuid,
+                prediction.lat,
+                prediction.lng,
+                prediction.conf,
+                prediction.model or model,
+            )
+
+    def flush(self) -> None:
+        """Write the columns and the metadata of a persisted registry."""
+        if self.path is None:
+            return
+        with self._lock:
+            for column in self._columns.values():
+                column.flush()  # type: ignore[attr-defined]
+            meta = {
+                "size": self._size,
+                "models": self._models,
+                "names": {str(slot): name for slot, name in self._slot_names.items()},
+            }
+            temporary = os.path.join(self.path, "meta.json.tmp")
+            with open(temporary, "w") as file:
+                json.dump(meta, file)
+            os.replace(temporary, os.path.join(self.path, "meta.json"))
+            self._flushed = time.monotonic()
+
+    def close(self) -> None:
+        """Flush a persisted registry and release its directory."""
+        self.flush()
+        if self._lock_file is not None:
+            os.close(self._lock_file)
+            self._lock_file = None
+
+    def _find(self, uuid: str) -> int:
+        """Return the slot of a device or EMPTY."""
+        key = _key(uuid)
+        if key is None:
+            return self._names.get(uuid, EMPTY)
+        hi, lo = key
+        position = _hash(hi, lo, self._bits)
+        table, mask = self._table, len(self._table) - 1
+        columns_hi, columns_lo = self._columns["hi"], self._columns["lo"]
+        while True:
+            slot = int(table[position])
+            if slot == EMPTY:
+                return EMPTY
+            if columns_hi[slot] == hi and columns_lo[slot] == lo:
+                return slot
+            position = (position + 1) & mask
+
+    def _insert(self, uuid: str) -> int:
+        """Assign the next slot to a new device."""
+        slot = self._size
+        if slot == len(self._columns["lat"]):
+            self._allocate(slot + CHUNK)
+        self._size += 1
+        key = _key(uuid)
+        if key is None:
+            self._names[uuid] = slot
+            self._slot_names[slot] = uuid
+            return slot
+        self._columns["hi"][slot], self._columns["lo"][slot] = key
+        if 2 * (self._size - len(self._names)) > len(self._table):
+            self._rehash()
+            return slot
+        position = _hash(*key, self._bits)
+        mask = len(self._table) - 1
+        while self._table[position] != EMPTY:
+            position = (position + 1) & mask
+        self._table[position] = slot
+        return slot
+
+    def _model_id(self, model: Optional[str]) -> int:
+        """Return the id of a model name, registering new names."""
+        if model is None:
+            return EMPTY
+        if model not in self._model_ids:
+            self._model_ids[model] = len(self._models)
+            self._models.append(model)
+        return self._model_ids[model]
+
+    def _allocate(self, capacity: int) -> None:
+        """Grow the columns to a capacity, keeping the used slots."""
+        for name, dtype in COLUMNS.items():
+            old = self._columns.get(name)
+            if self.path is None:
+                column = np.zeros(capacity, dtype=dtype)
+            else:
+                file = os.path.join(self.path, f"{name}.npy")
+                temporary = file + ".tmp"
+                column = np.lib.format.open_memmap(  # type: ignore[no-untyped-call]
+                    temporary, mode="w+", dtype=dtype, shape=(capacity,)
+                )
+            if old is not None:
+                column[: self._size] = old[: self._size]
+            # the columns of a persisted registry are mapped from their files
+            if isinstance(column, np.memmap):
+                column.flush()
+                os.replace(temporary, file)
+                column = np.load(file, mmap_mode="r+")
+            self._columns[name] = column
+
+    def _open(self) -> None:
+        """Open the columns and metadata of a persisted registry."""
+        assert self.path is not None
+        with open(os.path.join(self.path, "meta.json")) as file:
+            meta = json.load(file)
+        self._size = meta["size"]
+        self._models = list(meta["models"])
+        self._model_ids = {model: i for i, model in enumerate(self._models)}
+        self._slot_names = {int(slot): name for slot, name in meta["names"].items()}
+        self._names = {name: slot for slot, name in self._slot_names.items()}
+        for name in COLUMNS:
+            self._columns[name] = np.load(
+                os.path.join(self.path, f"{name}.npy"), mmap_mode="r+"
+            )
+        logger.info(f"Opened position registry of {self._size} devices at {self.path}")
+
+    def _rehash(self) -> None:
+        """Rebuild the hash table with room for twice the UUID devices."""
+        n_keys = self._size - len(self._names)
+        bits = max(int(np.ceil(np.log2(max(4 * n_keys, 2 * CHUNK)))), 1)
+        self._bits = bits
+        self._table = np.full(1 << bits, EMPTY, dtype=np.int32)
+        slots = np.arange(self._size, dtype=np.int32)
+        if self._slot_names:
+            slots = slots[~np.isin(slots, list(self._slot_names))]
+        hi = self._columns["hi"][slots].view(np.uint64)
+        lo = self._columns["lo"][slots].view(np.uint64)
+        hashes = ((hi ^ lo) * np.uint64(GOLDEN)) >> np.uint64(64 - bits)
+        positions = hashes.astype(np.int64)
+        mask = len(self._table) - 1
+        # linear probing of all keys at once: free positions are claimed by
+        # the first key probing them, the others move on
+        while len(slots):
+            free = self._table[positions] == EMPTY
+            _, first = np.unique(positions, return_index=True)
+            claims = np.zeros(len(slots), dtype=bool)
+            claims[first] = True
+            claims &= free
+            self._table[positions[claims]] = slots[claims]
+            slots, positions = slots[~claims], (positions[~claims] + 1) & mask
+
+
+def _lock(path: str) -> int:
+    """Lock a registry directory for this process.
+
+    :param path: directory of the registry
+    :return: descriptor of the lock file, the lock is released when it is closed
+    :raises ValueError: if another process holds the lock
+    """
+    descriptor = os.open(os.path.join(path, "lock"), os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(descriptor, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        os.close(descriptor)
+        raise ValueError(
+            f"Position registry {path} is used by another process."
+        ) from None
+    return descriptor
+
+
+def _key(uuid: str) -> Optional[Tuple[int, int]]:
+    """Return the signed 64-bit halves of a canonical (lower case) UUID or None."""
+    if len(uuid) != 36 or uuid[8] + uuid[13] + uuid[18] + uuid[23] != "----":
+        return None
+    digits = uuid.replace("-", "")
+    if len(digits) != 32 or digits.strip(HEX_DIGITS):
+        return None
+    hi, lo = int(digits[:16], 16), int(digits[16:], 16)
+    return hi - (hi & SIGN) * 2, lo - (lo & SIGN) * 2
+
+
+def _hash(hi: int, lo: int, bits: int) -> int:
+    """Return the table position of a key, like the vectorized hash."""
+    return ((((hi ^ lo) & MASK) * GOLDEN) & MASK) >> (64 - bits)
+
+
+def _format(digits: str) -> str:
+    """Return 32 hex digits in the canonical UUID form."""
+    return "-".join(
+        (digits[:8], digits[8:12], digits[12:16], digits[16:20], digits[20:])
+    )
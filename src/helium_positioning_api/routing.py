@@ -0,0 +1,195 @@
+"""Routing module.
+
+.. module:: routing
+
+:synopsis: Selection of the cheapest model expected to meet a target accuracy.
+
+.. moduleauthor:: DSIA21
+
+The ``auto`` model computes cheap features of the witness geometry of the
+last integration: the number of witnesses with a location, their spread,
+how collinear they are and the spread of their rssi. Every model has an
+expected error for a geometry; the cheapest model whose expected error is
+within the target accuracy is run, or the most accurate one if none is.
+Trilateration is only considered for at least three witnesses that are
+not collinear and if its distance models (or lookup table) are loaded.
+Routing decisions are counted in the ``routing_decisions`` metric.
+"""
+
+import logging
+from dataclasses import dataclass
+from functools import partial
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+import numpy as np
+from helium_api_wrapper.DataObjects import IntegrationHotspot
+
+from helium_positioning_api.auxilary import get_integration_hotspots
+from helium_positioning_api.DataObjects import Prediction
+from helium_positioning_api.distance_prediction import models_loaded
+from helium_positioning_api.metrics import counter
+from helium_positioning_api.nearest_neighbor import nearest_neighbor
+from helium_positioning_api.trilateration import trilateration
+from helium_positioning_api.weighted_centroid import weighted_centroid
+from helium_positioning_api.witnesses import select_witnesses
+
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+METERS_PER_DEGREE = 111195.0  # length of one degree of latitude
+TARGET_ACCURACY = 500.0  # meters, default target of the auto model
+# expected error in meters of a single witness, the range of a hotspot
+SINGLE_WITNESS_ERROR = 2000.0
+# expected error in meters of trilateration with well spread witnesses
+TRILATERATION_ERROR = 300.0
+# witnesses are collinear below this ratio of the minor to the major axis
+COLLINEARITY_THRESHOLD = 0.1
+# rssi spread in dB below which the signal carries no position information
+MIN_RSSI_SPREAD = 3.0
+
+decisions = counter(
+    "routing_decisions",
+    "Models chosen by the auto model.",
+    ("model", "reason"),
+)
+
+
+@dataclass(frozen=True)
+class WitnessGeometry:
+    """Cheap features of the witnesses of an uplink."""
+
+    count: int
+    # largest distance of a witness from the centroid in meters
+    spread: float
+    # minor to major axis of the witness positions, 0 if collinear
+    collinearity: float
+    # difference between the strongest and the weakest rssi in dB
+    rssi_spread: float
+
+
+def witness_geometry(hotspots: List[IntegrationHotspot]) -> WitnessGeometry:
+    """Return the geometry features of the selected witnesses.
+
+    :param hotspots: witnesses of an uplink
+    :return: WitnessGeometry
+    """
+    witnesses = select_witnesses(hotspots)
+    if not len(witnesses):
+        return WitnessGeometry(0, 0.0, 0.0, 0.0)
+    lat, lng, rssi = witnesses.lat, witnesses.lng, witnesses.rssi
+    # local plane around the centroid in meters
+    scale = np.cos(np.radians(lat.mean()))
+    points = np.column_stack([(lat - lat.mean()), (lng - lng.mean()) * scale])
+    points *= METERS_PER_DEGREE
+    spread = float(np.hypot(points[:, 0], points[:, 1]).max())
+    if len(witnesses) < 3 or spread == 0.0:
+        collinearity = 0.0
+    else:
+        minor, major = np.linalg.eigvalsh(np.cov(points, rowvar=False))
+        collinearity = float(np.sqrt(max(minor, 0.0) / major))
+    return WitnessGeometry(
+        count=len(witnesses),
+        spread=spread,
+        collinearity=collinearity,
+        rssi_spread=float(rssi.max() - rssi.min()),
+    )
+
+
+def expected_errors(
+    geometry: WitnessGeometry, trilateration_model: Optional[str]
+) -> List[Tuple[str, float, str]]:
+    """Return the candidate models with their expected error, cheapest first.
+
+    :param geometry: geometry of the witnesses
+    :param trilateration_model: distance model available for trilateration
+    :return: (model, expected error in meters, reason) of the candidates
+    """
+    if geometry.count == 1:
+        return [("nearest_neighbor", SINGLE_WITNESS_ERROR, "single_witness")]
+    # the device is between the witnesses, or within range of one of them
+    candidates = [
+        ("nearest_neighbor", min(geometry.spread, SINGLE_WITNESS_ERROR), "spread"),
+        ("weighted_centroid", min(geometry.spread, SINGLE_WITNESS_ERROR) / 2, "spread"),
+    ]
+    if (
+        trilateration_model is None
+        or geometry.count < 3
+        or geometry.collinearity < COLLINEARITY_THRESHOLD
+        or geometry.rssi_spread < MIN_RSSI_SPREAD
+    ):
+        return candidates
+    return candidates + [(trilateration_model, TRILATERATION_ERROR, "geometry")]
+
+
+def available_trilateration_model() -> Optional[str]:
+    """Return the fastest loaded distance model, None if none is loaded.
+
+    :return: model name
+    """
+    if models_loaded(("gradient_boosting_lut",)):
+        return "gradient_boosting_lut"
+    if models_loaded(("gradient_boosting",)):
+        return "gradient_boosting"
+    return None
+
+
+def route(
+    geometry: WitnessGeometry,
+    target_accuracy: float = TARGET_ACCURACY,
+    trilateration_model: Optional[str] = None,
+) -> Tuple[str, str]:
+    """Return the cheapest model expected to meet the target accuracy.
+
+    :param geometry: geometry of the witnesses
+    :param target_accuracy: acceptable error in meters
+    :param trilateration_model: distance model available for trilateration
+    :return: name of the model and the reason of the choice
+    """
+    if geometry.count == 0:
+        raise ValueError("No hotspots with a location to route on.")
+    candidates = expected_errors(geometry, trilateration_model)
+    for model, error, reason in candidates:
+        if error <= target_accuracy:
+            return model, reason
+    best = min(candidates, key=lambda candidate: candidate[1])
+    return best[0], "best_effort"
+
+
+def auto(
+    uuid: str,
+    hotspots: Optional[List[IntegrationHotspot]] = None,
+    target_accuracy: float = TARGET_ACCURACY,
+) -> Prediction:
+    """This model predicts the location of a given device.
+
+    It runs the cheapest model expected to meet the target accuracy for
+    the geometry of the witnesses of the last integration. The ``model``
+    field of the prediction names the model that was run.
+
+    :param uuid: Device id
+    :param hotspots: hotspots of the last integration, loaded if not given
+    :param target_accuracy: acceptable error in meters
+    :return: coordinates of predicted location
+    """
+    if hotspots is None:
+        hotspots = get_integration_hotspots(uuid)
+    model, reason = route(
+        witness_geometry(hotspots), target_accuracy, available_trilateration_model()
+    )
+    decisions.inc(model=model, reason=reason)
+    logger.info(f"Routing device {uuid} to {model} ({reason}).")
+    return ROUTES[model](uuid, hotspots=hotspots)
+
+
+# models the auto model routes to
+ROUTES: Dict[str, Callable[..., Prediction]] = {
+    "nearest_neighbor": nearest_neighbor,
+    "weighted_centroid": weighted_centroid,
+    "gradient_boosting": partial(trilateration, model="gradient_boosting"),
+    "gradient_boosting_lut": partial(trilateration, model="gradient_boosting_lut"),
+}
@@ -0,0 +1,236 @@
+"""Server module.
+
+.. module:: server
+
+:synopsis: Pre-forking production server for the REST api.
+
+.. moduleauthor:: DSIA21
+
+"""
+
+import gc
+import logging
+import os
+import signal
+import socket
+import threading
+import time
+from types import FrameType
+from typing import Dict
+from typing import Optional
+
+import uvicorn
+
+from helium_positioning_api.auxilary import get_setting
+from helium_positioning_api.distance_prediction import warm_up
+
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# number of workers, set for the forked workers
+WORKERS_VARIABLE = "SERVER_WORKERS"
+# settings whose state would be written by every worker on its own
+SINGLE_WORKER_SETTINGS = ("REGISTRY_PATH", "SHARD_SELF")
+# seconds before a crashed worker is replaced, doubled for every crash in a row
+RESPAWN_DELAY = 1.0
+MAX_RESPAWN_DELAY = 60.0
+# seconds after which a worker counts as started successfully
+STABLE_UPTIME = 30.0
+
+
+class DrainingServer(uvicorn.Server):
+    """Uvicorn server that reports not ready before it stops on a shutdown signal."""
+
+    def __init__(self, config: uvicorn.Config, drain_delay: float) -> None:
+        """Create the server.
+
+        :param config: uvicorn configuration
+        :param drain_delay: seconds between failing readiness and closing the socket
+        """
+        super().__init__(config)
+        self.drain_delay = drain_delay
+
+    def handle_exit(self, sig: int, frame: Optional[FrameType]) -> None:
+        """Start draining and shut down gracefully after the drain delay.
+
+        :param sig: received signal
+        :param frame: current stack frame
+        """
+        from helium_positioning_api.api import app
+
+        if app.state.draining or self.drain_delay <= 0:
+            super().handle_exit(sig, frame)
+            return
+        app.state.draining = True
+        timer = threading.Timer(self.drain_delay, super().handle_exit, (sig, frame))
+        timer.daemon = True
+        timer.start()
+
+
+def serve_production(
+    host: str = "0.0.0.0",
+    port: int = 8000,
+    workers: int = 1,
+    drain_delay: float = 5.0,
+    graceful_timeout: float = 30.0,
+    log_level: str = "info",
+) -> None:
+    """Serve the REST api with pre-forked worker processes.
+
+    Models are loaded and warmed up once in the parent process before the
+    port is opened and the workers are forked, so all workers share the
+    loaded models copy-on-write. Workers that die are replaced, after a
+    growing delay if they keep crashing. On SIGTERM or SIGINT every worker
+    fails its readiness probe for ``drain_delay`` seconds, finishes its
+    in-flight requests and exits; workers still alive after
+    ``graceful_timeout`` seconds are killed.
+
+    :param host: interface to bind to
+    :param port: port to bind to
+    :param workers: number of worker processes
+    :param drain_delay: seconds to report not ready before closing the socket
+    :param graceful_timeout: seconds to wait for workers on shutdown
+    :param log_level: uvicorn log level
+    :raises ValueError: if a setting needs a single worker
+    """
+    single = [name for name in SINGLE_WORKER_SETTINGS if get_setting(name)]
+    if workers > 1 and single:
+        raise ValueError(f"A single worker process is needed with {', '.join(single)}.")
+    warm_up()
+    from helium_positioning_api.api import app
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    logger.info(f"Listening on {host}:{port} with {workers} workers")
+
+    config = uvicorn.Config(
+        app, host=host, port=port, log_level=log_level, proxy_headers=True
+    )
+    if not hasattr(os, "fork") or workers <= 1:
+        DrainingServer(config, drain_delay).run(sockets=[sock])
+        return
+
+    # keep the preloaded objects out of the garbage collector, so collections
+    # in the workers do not touch (and copy) the shared memory pages
+    gc.freeze()
+    os.environ[WORKERS_VARIABLE] = str(workers)
+    pool = WorkerPool(config, sock, drain_delay)
+    signal.signal(signal.SIGTERM, pool.stop)
+    signal.signal(signal.SIGINT, pool.stop)
+    for slot in range(workers):
+        pool.spawn(slot)
+    pool.supervise()
+    pool.reap(drain_delay + graceful_timeout)
+    sock.close()
+
+
+def worker_count() -> int:
+    """Return the number of worker processes serving the api.
+
+    :return: workers forked by :func:`serve_production`, 1 otherwise
+    """
+    return int(os.environ.get(WORKERS_VARIABLE, "1"))
+
+
+class WorkerPool:
+    """Pre-forked worker processes that are replaced when they die."""
+
+    def __init__(
+        self, config: uvicorn.Config, sock: socket.socket, drain_delay: float
+    ) -> None:
+        """Create a pool without workers.
+
+        :param config: uvicorn configuration of the workers
+        :param sock: listening socket shared by the workers
+        :param drain_delay: seconds to report not ready before closing the socket
+        """
+        self.config = config
+        self.sock = sock
+        self.drain_delay = drain_delay
+        self.stopping = False
+        # slot of every running worker by pid
+        self.children: Dict[int, int] = {}
+        self._started: Dict[int, float] = {}
+        self._crashes: Dict[int, int] = {}
+
+    def spawn(self, slot: int) -> None:
+        """Fork a worker serving the api in a slot.
+
+        :param slot: number of the worker
+        """
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            DrainingServer(self.config, self.drain_delay).run(sockets=[self.sock])
+            os._exit(0)
+        self.children[pid] = slot
+        self._started[slot] = time.monotonic()
+
+    def stop(self, sig: int, frame: Optional[FrameType]) -> None:
+        """Ask all workers to shut down.
+
+        :param sig: received signal
+        :param frame: current stack frame
+        """
+        self.stopping = True
+        for pid in self.children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def supervise(self) -> None:
+        """Replace workers that exit until the pool is stopped."""
+        while self.children and not self.stopping:
+            pid, _ = os.wait()
+            slot = self.children.pop(pid)
+            # the pool may have been stopped by a signal while waiting
+            if not self.stopping:
+                delay = self.respawn_delay(slot)
+                logger.warning(f"Worker {pid} exited, starting a new one in {delay}s")
+                if self._sleep(delay):
+                    self.spawn(slot)
+
+    def respawn_delay(self, slot: int) -> float:
+        """Return the seconds to wait before replacing the worker of a slot.
+
+        The delay doubles with every crash in a row; a worker that ran for
+        ``STABLE_UPTIME`` seconds resets it.
+
+        :param slot: number of the worker
+        :return: delay in seconds
+        """
+        if time.monotonic() - self._started.get(slot, 0.0) >= STABLE_UPTIME:
+            self._crashes[slot] = 0
+            return 0.0
+        crashes = self._crashes.get(slot, 0) + 1
+        self._crashes[slot] = crashes
+        return float(min(RESPAWN_DELAY * 2 ** (crashes - 1), MAX_RESPAWN_DELAY))
+
+    def reap(self, timeout: float) -> None:
+        """Wait for the workers to exit and kill those that do not in time.
+
+        :param timeout: seconds to wait
+        """
+        deadline = time.monotonic() + timeout
+        while self.children and time.monotonic() < deadline:
+            pid, _ = os.waitpid(-1, os.WNOHANG)
+            if pid:
+                self.children.pop(pid, None)
+            else:
+                time.sleep(0.1)
+        for pid in self.children:
+            logger.warning(f"Worker {pid} did not stop in time, killing it")
+            os.kill(pid, signal.SIGKILL)
+
+    def _sleep(self, seconds: float) -> bool:
+        """Sleep unless the pool is stopped, return whether it is still running."""
+        end = time.monotonic() + seconds
+        while not self.stopping and time.monotonic() < end:
+            time.sleep(min(0.1, end - time.monotonic()))
+        return not self.stopping
@@ -0,0 +1,453 @@
+"""Sharding module.
+
+.. module:: sharding
+
+:synopsis: Consistent-hash sharding of devices across service instances.
+
+.. moduleauthor:: DSIA21
+
+Every instance knows the members of the cluster, identified by their base
+url, and places them on a hash ring with many virtual nodes each. A device
+is owned by the member following the hash of its uuid on the ring, so the
+per-device state (integration events, predictions, tracking) stays in one
+process. Requests for devices owned by a peer are forwarded to it or
+redirected to it. When a member joins or leaves, only the devices between
+its virtual nodes and their predecessors change owner; their latest
+positions are handed over to the new owner. The members share a secret
+that authenticates their requests to each other.
+"""
+
+import hashlib
+import hmac
+import json
+import logging
+import threading
+from bisect import bisect_left
+from typing import Any
+from typing import Dict
+from typing import Iterable
+from typing import List
+from typing import Mapping
+from typing import Optional
+from typing import Sequence
+from typing import Tuple
+from typing import Union
+from urllib.error import HTTPError
+from urllib.error import URLError
+from urllib.parse import quote
+from urllib.request import Request
+from urllib.request import urlopen
+
+import numpy as np
+import numpy.typing as npt
+
+from helium_positioning_api.auxilary import get_setting
+from helium_positioning_api.metrics import counter
+
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# uuids of devices as a list or an object array of a registry column
+Keys = Union[Sequence[str], npt.NDArray[np.object_]]
+
+FORWARD = "forward"
+REDIRECT = "redirect"
+# virtual nodes per member, more nodes spread the devices more evenly
+REPLICAS = 128
+# seconds to wait for a peer
+TIMEOUT = 5.0
+# requests carrying this header are served locally, so that members with a
+# different view of the ring during a change do not pass requests around
+FORWARDED_HEADER = "X-Shard-Forwarded"
+# shared secret of the members, requests without it are not trusted as
+# forwarded and cannot change the cluster
+TOKEN_HEADER = "X-Shard-Token"
+# headers passed on to the owner of a forwarded request
+FORWARDED_HEADERS = ("content-type", "accept")
+
+decisions = counter(
+    "shard_requests",
+    "Device requests served locally, forwarded or redirected to the owner.",
+    ("decision",),
+)
+
+
+class NotOwner(Exception):
+    """Raised when a request is for a device owned by a peer."""
+
+    def __init__(self, owner: str, body: bytes = b"") -> None:
+        """Create the exception.
+
+        :param owner: base url of the owning member
+        :param body: body of the request, to forward it
+        """
+        super().__init__(f"Device is owned by {owner}.")
+        self.owner = owner
+        self.body = body
+
+
+class HashRing:
+    """Consistent-hash ring of the members of a cluster."""
+
+    def __init__(self, members: Iterable[str] = (), replicas: int = REPLICAS) -> None:
+        """Create a ring.
+
+        :param members: base urls of the members
+        :param replicas: virtual nodes per member
+        """
+        self.replicas = replicas
+        self.version = 0
+        self._members = set(members)
+        self._lock = threading.Lock()
+        self._build()
+
+    def __len__(self) -> int:
+        """Return the number of members."""
+        return len(self._members)
+
+    def __contains__(self, member: str) -> bool:
+        """Return whether a member is on the ring."""
+        return member in self._members
+
+    @property
+    def members(self) -> List[str]:
+        """Return the members in sorted order."""
+        return sorted(self._members)
+
+    def add(self, member: str) -> bool:
+        """Place a member on the ring.
+
+        :param member: base url of the member
+        :return: whether the member was new
+        """
+        with self._lock:
+            if member in self._members:
+                return False
+            self._members.add(member)
+            self._build()
+            return True
+
+    def remove(self, member: str) -> bool:
+        """Take a member off the ring.
+
+        :param member: base url of the member
+        :return: whether the member was on the ring
+        """
+        with self._lock:
+            if member not in self._members:
+                return False
+            self._members.discard(member)
+            self._build()
+            return True
+
+    def owner(self, key: str) -> Optional[str]:
+        """Return the member owning a key.
+
+        :param key: uuid of a device
+        :return: base url of the member or None if the ring is empty
+        """
+        points, _, owners = self._ring
+        if not points:
+            return None
+        return owners[bisect_left(points, _hash(key)) % len(points)]
+
+    def owners(self, keys: Keys) -> npt.NDArray[np.object_]:
+        """Return the members owning many keys.
+
+        :param keys: uuids of devices
+        :return: object array of the base urls, None if the ring is empty
+        """
+        points, array, owners = self._ring
+        if not points:
+            return np.full(len(keys), None, dtype=object)
+        hashes = np.fromiter((_hash(key) for key in keys), np.uint64, len(keys))
+        slots = np.searchsorted(array, hashes) % len(points)
+        members: npt.NDArray[np.object_] = np.array(owners, dtype=object)[slots]
+        return members
+
+    def _build(self) -> None:
+        """Place the virtual nodes of the members on the ring."""
+        nodes = sorted(
+            (_hash(f"{member}#{replica}"), member)
+            for member in self._members
+            for replica in range(self.replicas)
+        )
+        points = [point for point, _ in nodes]
+        # replaced at once, lookups do not take the lock
+        self._ring: Tuple[List[int], npt.NDArray[np.uint64], List[str]] = (
+            points,
+            np.array(points, dtype=np.uint64),
+            [member for _, member in nodes],
+        )
+        self.version += 1
+
+
+class Cluster:
+    """Membership and request routing of one instance."""
+
+    def __init__(
+        self,
+        url: str,
+        peers: Iterable[str] = (),
+        mode: str = FORWARD,
+        timeout: float = TIMEOUT,
+        replicas: int = REPLICAS,
+        token: str = "",
+    ) -> None:
+        """Create the view of the cluster of an instance.
+
+        :param url: base url of this instance
+        :param peers: base urls of the other members
+        :param mode: ``forward`` or ``redirect`` requests for devices of peers
+        :param timeout: seconds to wait for a peer
+        :param replicas: virtual nodes per member
+        :param token: shared secret of the members, no request is trusted if empty
+        """
+        if mode not in (FORWARD, REDIRECT):
+            raise ValueError(f"Unknown sharding mode {mode}.")
+        self.url = normalize(url)
+        self.mode = mode
+        self.timeout = timeout
+        self.token = token
+        self.ring = HashRing(
+            {self.url, *(normalize(peer) for peer in peers)}, replicas=replicas
+        )
+
+    @property
+    def peers(self) -> List[str]:
+        """Return the other members."""
+        return [member for member in self.ring.members if member != self.url]
+
+    def route(self, uuid: str, headers: Mapping[str, str]) -> Optional[str]:
+        """Return the peer a device request has to be sent to.
+
+        :param uuid: Device id
+        :param headers: headers of the request
+        :return: base url of the owning peer or None to serve it locally
+        """
+        owner = self.ring.owner(uuid)
+        forwarded = FORWARDED_HEADER in headers and self.authenticated(headers)
+        if owner is None or owner == self.url or forwarded:
+            decisions.inc(decision="local")
+            return None
+        decisions.inc(decision=self.mode)
+        return owner
+
+    def authenticated(self, headers: Mapping[str, str]) -> bool:
+        """Return whether a request was sent by a member of the cluster.
+
+        :param headers: headers of the request
+        :return: whether the request carries the shared secret
+        """
+        token = headers.get(TOKEN_HEADER) or ""
+        return bool(self.token) and hmac.compare_digest(
+            token.encode(), self.token.encode()
+        )
+
+    def join(self, member: str) -> bool:
+        """Add a member to the ring.
+
+        :param member: base url of the member
+        :return: whether the member was new
+        """
+        added = self.ring.add(normalize(member))
+        if added:
+            logger.info(f"{member} joined, {len(self.ring)} members.")
+        return added
+
+    def leave(self, member: str) -> bool:
+        """Remove a member from the ring.
+
+        :param member: base url of the member
+        :return: whether the member was on the ring
+        """
+        member = normalize(member)
+        if member == self.url:
+            raise ValueError("An instance cannot remove itself.")
+        removed = self.ring.remove(member)
+        if removed:
+            logger.info(f"{member} left, {len(self.ring)} members.")
+        return removed
+
+    def owned_by(self, uuids: Keys, member: str) -> npt.NDArray[np.intp]:
+        """Return the positions of the devices owned by a member.
+
+        :param uuids: Device ids
+        :param member: base url of the member
+        :return: indices into ``uuids``
+        """
+        return np.flatnonzero(self.ring.owners(uuids) == normalize(member))
+
+    def forward(
+        self,
+        owner: str,
+        method: str,
+        path: str,
+        body: bytes,
+        headers: Mapping[str, str],
+    ) -> Tuple[int, Dict[str, str], bytes]:
+        """Send a request to the owner of its device and return the response.
+
+        :param owner: base url of the owning peer
+        :param method: HTTP method
+        :param path: path and query of the request
+        :param body: body of the request
+        :param headers: headers of the request
+        :return: status code, headers with lower case names and body of the response
+        :raises ConnectionError: if the owner cannot be reached
+        """
+        forwarded = {
+            name: headers[name] for name in FORWARDED_HEADERS if name in headers
+        }
+        return self._send(owner, method, path, body or None, forwarded)
+
+    def announce(self) -> List[Dict[str, Any]]:
+        """Join the cluster and return the positions handed over by the peers.
+
+        The members known to the configured peers are added to the ring,
+        then this instance is added to the ring of every member, which hand
+        over the latest positions of the devices this instance now owns.
+        Unreachable peers are logged and kept on the ring.
+
+        :return: handed over positions
+        """
+        for peer in self.peers:
+            try:
+                for member in self.call(peer, "GET", "/cluster/members")["members"]:
+                    self.join(member)
+            except ConnectionError as exception:
+                logger.warning(str(exception))
+        positions: List[Dict[str, Any]] = []
+        for peer in self.peers:
+            try:
+                self.call(peer, "POST", "/cluster/members", {"member": self.url})
+                positions.extend(
+                    self.call(peer, "GET", f"/cluster/handoff?member={quote(self.url)}")
+                )
+            except ConnectionError as exception:
+                logger.warning(str(exception))
+        return positions
+
+    def withdraw(self, positions: Sequence[Dict[str, Any]]) -> None:
+        """Leave the cluster and hand over positions to their new owners.
+
+        :param positions: latest positions of the devices of this instance
+        """
+        peers = self.peers
+        for peer in peers:
+            try:
+                self.call(peer, "DELETE", f"/cluster/members?member={quote(self.url)}")
+            except ConnectionError as exception:
+                logger.warning(str(exception))
+        if not peers or not positions:
+            return
+        ring = HashRing(peers, replicas=self.ring.replicas)
+        owners = ring.owners([position["uuid"] for position in positions])
+        for peer in peers:
+            handed = [positions[i] for i in np.flatnonzero(owners == peer)]
+            try:
+                self.call(peer, "POST", "/cluster/handoff", handed)
+            except ConnectionError as exception:
+                logger.warning(f"{len(handed)} positions not handed over: {exception}")
+
+    def broadcast(self, method: str, path: str, payload: Any = None) -> None:
+        """Send a membership change to the peers.
+
+        :param method: HTTP method
+        :param path: path and query of the change
+        :param payload: JSON body
+        """
+        for peer in self.peers:
+            try:
+                self.call(peer, method, path, payload)
+            except ConnectionError as exception:
+                logger.warning(str(exception))
+
+    def call(self, peer: str, method: str, path: str, payload: Any = None) -> Any:
+        """Call the cluster endpoint of a peer.
+
+        :param peer: base url of the peer
+        :param method: HTTP method
+        :param path: path and query of the endpoint
+        :param payload: JSON body
+        :return: decoded JSON response
+        :raises ConnectionError: if the peer cannot be reached or fails
+        """
+        body = None if payload is None else json.dumps(payload).encode()
+        status, _, content = self._send(
+            peer, method, path, body, {"content-type": "application/json"}
+        )
+        if status >= 400:
+            raise ConnectionError(f"{method} {peer}{path} failed with {status}.")
+        return json.loads(content) if content else None
+
+    def _send(
+        self,
+        peer: str,
+        method: str,
+        path: str,
+        body: Optional[bytes],
+        headers: Dict[str, str],
+    ) -> Tuple[int, Dict[str, str], bytes]:
+        """Send a request marked as forwarded and authenticated to a peer."""
+        request = Request(
+            peer + path,
+            data=body,
+            method=method,
+            headers={**headers, FORWARDED_HEADER: self.url, TOKEN_HEADER: self.token},
+        )
+        try:
+            with urlopen(request, timeout=self.timeout) as response:  # noqa: S310
+                return response.status, _headers(response.headers), response.read()
+        except HTTPError as error:
+            return error.code, _headers(error.headers), error.read()
+        except (URLError, OSError) as error:
+            raise ConnectionError(f"Peer {peer} is unreachable: {error}")
+
+
+def normalize(url: str) -> str:
+    """Return the base url of a member without a trailing slash.
+
+    :param url: base url
+    :return: normalized url
+    """
+    return url.strip().rstrip("/")
+
+
+def configured_cluster() -> Optional[Cluster]:
+    """Return the cluster configured by the settings, None if not sharded.
+
+    ``SHARD_SELF`` is the base url of this instance, ``SHARD_PEERS`` the
+    comma separated base urls of the other members, ``SHARD_MODE`` either
+    ``forward`` or ``redirect`` and ``SHARD_TOKEN`` the secret shared by
+    all members.
+
+    :return: Cluster or None if ``SHARD_SELF`` is not set
+    :raises ValueError: if ``SHARD_TOKEN`` is not set
+    """
+    url = get_setting("SHARD_SELF")
+    if not url:
+        return None
+    token = get_setting("SHARD_TOKEN")
+    if not token:
+        raise ValueError("SHARD_TOKEN must be set to shard the devices.")
+    peers = [peer for peer in (get_setting("SHARD_PEERS") or "").split(",") if peer]
+    return Cluster(
+        url,
+        peers,
+        mode=get_setting("SHARD_MODE", FORWARD) or FORWARD,
+        timeout=float(get_setting("SHARD_TIMEOUT", str(TIMEOUT)) or TIMEOUT),
+        token=token,
+    )
+
+
+def _headers(headers: Any) -> Dict[str, str]:
+    """Return the headers of a response with lower case names."""
+    return {name.lower(): value for name, value in headers.items()}
+
+
+def _hash(key: str) -> int:
+    """Return the 64 bit position of a key on the ring."""
+    digest = hashlib.blake2b(key.encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big")
@@ -0,0 +1,263 @@
+"""Spatial index module.
+
+.. module:: spatial_index
+
+:synopsis: Grid index over the latest predicted device positions.
+
+.. moduleauthor:: DSIA21
+
+"""
+
+import heapq
+import threading
+from math import cos
+from math import floor
+from math import radians
+from typing import Dict
+from typing import Iterator
+from typing import List
+from typing import Set
+from typing import Tuple
+
+from haversine import Unit
+from haversine import haversine
+
+from helium_positioning_api.DataObjects import Prediction
+
+
+m = Unit.METERS
+METERS_PER_DEGREE = 111195.0  # length of one degree of latitude
+CELL_SIZE = 0.01  # edge of a grid cell in degrees
+
+Cell = Tuple[int, int]
+Neighbor = Tuple[str, float, float, float]  # (key, lat, lng, distance in meters)
+
+
+class GridIndex:
+    """Index of points in a regular lat/lng grid.
+
+    Queries only visit the cells overlapping the queried area, so their
+    cost grows with the number of points near the query, not with the
+    number of indexed points.
+    """
+
+    def __init__(self, cell_size: float = CELL_SIZE) -> None:
+        """Create an empty index.
+
+        :param cell_size: edge of a grid cell in degrees
+        """
+        self.cell_size = cell_size
+        self._points: Dict[str, Tuple[float, float]] = {}
+        self._cells: Dict[Cell, Set[str]] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        """Return the number of indexed points."""
+        return len(self._points)
+
+    def update(self, key: str, lat: float, lng: float) -> None:
+        """Insert a point or move it to a new position.
+
+        :param key: id of the point
+        :param lat: latitude
+        :param lng: longitude
+        """
+        cell = self._cell(lat, lng)
+        with self._lock:
+            if key in self._points:
+                old_cell = self._cell(*self._points[key])
+                if old_cell != cell:
+                    self._discard(old_cell, key)
+            self._points[key] = (lat, lng)
+            self._cells.setdefault(cell, set()).add(key)
+
+    def remove(self, key: str) -> None:
+        """Remove a point if it is indexed.
+
+        :param key: id of the point
+        """
+        with self._lock:
+            if key in self._points:
+                self._discard(self._cell(*self._points.pop(key)), key)
+
+    def get(self, key: str) -> Tuple[float, float]:
+        """Return the position of a point.
+
+        :param key: id of the point
+        :return: (lat, lng)
+        """
+        return self._points[key]
+
+    def within_bbox(
+        self, min_lat: float, min_lng: float, max_lat: float, max_lng: float
+    ) -> List[Tuple[str, float, float]]:
+        """Return the points inside a bounding box.
+
+        :param min_lat: southern edge
+        :param min_lng: western edge
+        :param max_lat: northern edge
+        :param max_lng: eastern edge
+        :return: (key, lat, lng) of the points
+        """
+        lower, upper = self._cell(min_lat, min_lng), self._cell(max_lat, max_lng)
+        with self._lock:
+            return [
+                (key, lat, lng)
+                for key, (lat, lng) in self._cells_points(lower, upper)
+                if min_lat <= lat <= max_lat and min_lng <= lng <= max_lng
+            ]
+
+    def within_radius(self, lat: float, lng: float, radius: float) -> List[Neighbor]:
+        """Return the points within a radius around a position, nearest first.
+
+        :param lat: latitude of the centre
+        :param lng: longitude of the centre
+        :param radius: radius in meters
+        :return: (key, lat, lng, distance) of the points
+        """
+        d_lat = radius / METERS_PER_DEGREE
+        d_lng = d_lat / max(cos(radians(min(abs(lat) + d_lat, 89.9))), 1e-6)
+        lower = self._cell(lat - d_lat, lng - d_lng)
+        upper = self._cell(lat + d_lat, lng + d_lng)
+        with self._lock:
+            points = list(self._cells_points(lower, upper))
+        neighbors = [
+            (key, p_lat, p_lng, haversine((lat, lng), (p_lat, p_lng), unit=m))
+            for key, (p_lat, p_lng) in points
+        ]
+        return sorted(
+            (neighbor for neighbor in neighbors if neighbor[3] <= radius),
+            key=lambda neighbor: neighbor[3],
+        )
+
+    def nearest(self, lat: float, lng: float, k: int) -> List[Neighbor]:
+        """Return the k points nearest to a position, nearest first.
+
+        Rings of cells around the position are searched until no point
+        outside the searched rings can be closer than the k-th best one.
+        Once the rings cover more cells than are occupied, the remaining
+        occupied cells are scanned instead.
+
+        :param lat: latitude of the position
+        :param lng: longitude of the position
+        :param k: number of points, at least 1
+        :return: (key, lat, lng, distance) of the points
+        :raises ValueError: if k is smaller than 1
+        """
+        if k < 1:
+            raise ValueError("k must be at least 1.")
+        centre = self._cell(lat, lng)
+        best: List[Tuple[float, str, float, float]] = []  # max-heap via negation
+        with self._lock:
+            total, seen, ring = len(self._points), 0, 0
+            while seen < total:
+                if (2 * ring + 1) ** 2 > len(self._cells):
+                    # fewer occupied cells than cells in the rings up to this one
+                    for cell in list(self._cells):
+                        if _chebyshev(centre, cell) >= ring:
+                            self._push_cell(best, k, lat, lng, cell)
+                    break
+                for cell in _ring(centre, ring):
+                    seen += self._push_cell(best, k, lat, lng, cell)
+                # points outside the searched rings are at least this far away
+                reach = ring * self._ring_width(lat, ring)
+                if len(best) == k and -best[0][0] <= reach:
+                    break
+                ring += 1
+        return [
+            (key, p_lat, p_lng, -distance)
+            for distance, key, p_lat, p_lng in sorted(best, reverse=True)
+        ]
+
+    def update_prediction(self, prediction: Prediction, model: str) -> None:
+        """Index the position of a prediction, remove unsuccessful ones.
+
+        Can be registered with :func:`helium_positioning_api.listeners.add_listener`.
+
+        :param prediction: Prediction
+        :param model: name of the model that produced the prediction
+        """
+        if prediction.lat is None or prediction.lng is None:
+            self.remove(prediction.uuid)
+        else:
+            self.update(prediction.uuid, prediction.lat, prediction.lng)
+
+    def _push_cell(
+        self,
+        best: List[Tuple[float, str, float, float]],
+        k: int,
+        lat: float,
+        lng: float,
+        cell: Cell,
+    ) -> int:
+        """Keep the points of a cell that are among the k nearest, locked.
+
+        :return: number of points in the cell
+        """
+        keys = self._cells.get(cell, ())
+        for key in keys:
+            p_lat, p_lng = self._points[key]
+            distance = haversine((lat, lng), (p_lat, p_lng), unit=m)
+            if len(best) < k:
+                heapq.heappush(best, (-distance, key, p_lat, p_lng))
+            elif distance < -best[0][0]:
+                heapq.heapreplace(best, (-distance, key, p_lat, p_lng))
+        return len(keys)
+
+    def _ring_width(self, lat: float, ring: int) -> float:
+        """Return the narrowest width in meters of the cells up to a ring."""
+        max_lat = min(abs(lat) + (ring + 1) * self.cell_size, 89.9)
+        return self.cell_size * METERS_PER_DEGREE * max(cos(radians(max_lat)), 1e-6)
+
+    def _cell(self, lat: float, lng: float) -> Cell:
+        """Return the cell of a position."""
+        return floor(lat / self.cell_size), floor(lng / self.cell_size)
+
+    def _discard(self, cell: Cell, key: str) -> None:
+        """Remove a key from a cell and drop empty cells."""
+        keys = self._cells.get(cell)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._cells[cell]
+
+    def _cells_points(
+        self, lower: Cell, upper: Cell
+    ) -> Iterator[Tuple[str, Tuple[float, float]]]:
+        """Yield the points of the cells between two corner cells."""
+        n_cells = (upper[0] - lower[0] + 1) * (upper[1] - lower[1] + 1)
+        if n_cells > len(self._cells):
+            # fewer occupied cells than cells in the area
+            cells: Iterator[Cell] = (
+                cell
+                for cell in list(self._cells)
+                if lower[0] <= cell[0] <= upper[0] and lower[1] <= cell[1] <= upper[1]
+            )
+        else:
+            cells = (
+                (i, j)
+                for i in range(lower[0], upper[0] + 1)
+                for j in range(lower[1], upper[1] + 1)
+            )
+        for cell in cells:
+            for key in self._cells.get(cell, ()):
+                yield key, self._points[key]
+
+
+def _chebyshev(a: Cell, b: Cell) -> int:
+    """Return the number of rings between two cells."""
+    return max(abs(a[0] - b[0]), abs(a[1] - b[1]))
+
+
+def _ring(centre: Cell, ring: int) -> Iterator[Cell]:
+    """Yield the cells at Chebyshev distance ``ring`` from a cell."""
+    if ring == 0:
+        yield centre
+        return
+    i, j = centre
+    for d in range(-ring, ring + 1):
+        yield i - ring, j + d
+        yield i + ring, j + d
+    for d in range(-ring + 1, ring):
+        yield i + d, j - ring
+        yield i + d, j + ring
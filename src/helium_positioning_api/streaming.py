@@ -0,0 +1,215 @@
+"""Streaming module.
+
+.. module:: streaming
+
+:synopsis: Push of changed device positions to subscribed clients.
+
+.. moduleauthor:: DSIA21
+
+"""
+
+import asyncio
+import logging
+from typing import Any
+from typing import AsyncIterator
+from typing import Dict
+from typing import Hashable
+from typing import Iterable
+from typing import List
+from typing import Optional
+from typing import Set
+from typing import Tuple
+
+from helium_api_wrapper.devices import get_last_integration
+from starlette.concurrency import run_in_threadpool
+
+from helium_positioning_api.DataObjects import Prediction
+from helium_positioning_api.models import predict
+
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+POLL_INTERVAL = 10.0  # seconds between two polls of the subscribed devices
+KEEP_ALIVE = 15.0  # seconds between two keep-alive comments of an idle stream
+MAX_CONCURRENT_POLLS = 8  # upstream calls running at the same time
+QUEUE_SIZE = 100  # pending predictions per subscriber
+
+Subscription = Tuple[str, str]  # (uuid, model)
+
+
+class PositionBroker:
+    """Polls the subscribed devices and pushes changed predictions to subscribers.
+
+    Every subscribed device is polled once per interval, regardless of the
+    number of subscribers. A prediction is only computed when the device
+    has a new integration, and only pushed when it differs from the last
+    pushed prediction. Every subscriber gets its own queue.
+    """
+
+    def __init__(
+        self,
+        interval: float = POLL_INTERVAL,
+        max_concurrent_polls: int = MAX_CONCURRENT_POLLS,
+    ) -> None:
+        """Create a broker without subscribers.
+
+        :param interval: seconds between two polls of the subscribed devices
+        :param max_concurrent_polls: upstream calls running at the same time
+        """
+        self.interval = interval
+        self.max_concurrent_polls = max_concurrent_polls
+        self._subscribers: Dict[Subscription, Set["asyncio.Queue[Prediction]"]] = {}
+        self._integrations: Dict[str, Hashable] = {}
+        self._predictions: Dict[Subscription, Prediction] = {}
+        self._task: Optional["asyncio.Task[None]"] = None
+
+    def subscribe(
+        self, uuids: Iterable[str], model: str
+    ) -> "asyncio.Queue[Prediction]":
+        """Subscribe to the predictions of devices.
+
+        The last pushed predictions of the devices are queued right away.
+
+        :param uuids: Device ids
+        :param model: name of the model
+        :return: queue receiving the changed predictions
+        """
+        queue: "asyncio.Queue[Prediction]" = asyncio.Queue(maxsize=QUEUE_SIZE)
+        for uuid in set(uuids):
+            subscription = (uuid, model)
+            self._subscribers.setdefault(subscription, set()).add(queue)
+            if subscription in self._predictions:
+                self._put(queue, self._predictions[subscription])
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_event_loop().create_task(self.run())
+        return queue
+
+    def unsubscribe(self, queue: "asyncio.Queue[Prediction]") -> None:
+        """Remove a subscriber and forget devices without subscribers.
+
+        :param queue: queue returned by :meth:`subscribe`
+        """
+        for subscription in list(self._subscribers):
+            self._subscribers[subscription].discard(queue)
+            if not self._subscribers[subscription]:
+                del self._subscribers[subscription]
+                self._predictions.pop(subscription, None)
+        subscribed = {uuid for uuid, _ in self._subscribers}
+        for uuid in list(self._integrations):
+            if uuid not in subscribed:
+                del self._integrations[uuid]
+
+    def stop(self) -> None:
+        """Stop polling."""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def run(self) -> None:
+        """Poll the subscribed devices until there are no subscribers left."""
+        semaphore = asyncio.Semaphore(self.max_concurrent_polls)
+
+        async def bounded_poll(uuid: str, models: List[str]) -> None:
+            async with semaphore:
+                await self.poll(uuid, models)
+
+        while self._subscribers:
+            devices: Dict[str, List[str]] = {}
+            for uuid, model in self._subscribers:
+                devices.setdefault(uuid, []).append(model)
+            await asyncio.gather(
+                *(bounded_poll(uuid, models) for uuid, models in devices.items())
+            )
+            await asyncio.sleep(self.interval)
+
+    async def poll(self, uuid: str, models: List[str]) -> None:
+        """Load the last integration of a device and push changed predictions.
+
+        :param uuid: Device id
+        :param models: subscribed models of the device
+        """
+        try:
+            integration = await run_in_threadpool(get_last_integration, uuid)
+        except Exception as exception:  # noqa: B902
+            logger.warning(f"Polling device {uuid} failed: {exception}")
+            return
+        hotspots = list(integration.hotspots)
+        key = _integration_key(integration)
+        if not hotspots or not any(
+            (uuid, model) in self._subscribers for model in models
+        ):
+            # no hotspots or unsubscribed while polling
+            return
+        new_integration = self._integrations.get(uuid) != key
+        self._integrations[uuid] = key
+
+        for model in models:
+            if not new_integration and (uuid, model) in self._predictions:
+                continue
+            try:
+                prediction = await run_in_threadpool(predict, uuid, model, hotspots)
+            except Exception as exception:  # noqa: B902
+                logger.warning(f"Prediction of device {uuid} failed: {exception}")
+                continue
+            self.publish(uuid, model, prediction)
+
+    def publish(self, uuid: str, model: str, prediction: Prediction) -> None:
+        """Push a prediction to all subscribers if it changed.
+
+        Predictions of devices without subscribers are dropped.
+
+        :param uuid: Device id
+        :param model: name of the model
+        :param prediction: new prediction
+        """
+        subscription = (uuid, model)
+        if subscription not in self._subscribers:
+            return
+        if self._predictions.get(subscription) == prediction:
+            return
+        self._predictions[subscription] = prediction
+        for queue in self._subscribers.get(subscription, ()):
+            self._put(queue, prediction)
+
+    @staticmethod
+    def _put(queue: "asyncio.Queue[Prediction]", prediction: Prediction) -> None:
+        """Queue a prediction, dropping the oldest one of a slow subscriber."""
+        if queue.full():
+            queue.get_nowait()
+        queue.put_nowait(prediction)
+
+
+async def event_stream(
+    broker: PositionBroker,
+    queue: "asyncio.Queue[Prediction]",
+    keep_alive: float = KEEP_ALIVE,
+) -> AsyncIterator[str]:
+    """Yield Server-Sent Events for the predictions of a subscription.
+
+    :param broker: broker the queue is subscribed to
+    :param queue: queue returned by :meth:`PositionBroker.subscribe`
+    :param keep_alive: seconds between two keep-alive comments
+    :return: Server-Sent Events
+    """
+    try:
+        while True:
+            try:
+                prediction = await asyncio.wait_for(queue.get(), timeout=keep_alive)
+            except asyncio.TimeoutError:
+                yield ": keep-alive\n\n"
+                continue
+            yield f"event: prediction\ndata: {prediction.json()}\n\n"
+    finally:
+        broker.unsubscribe(queue)
+
+
+def _integration_key(integration: Any) -> Hashable:
+    """Return a value that changes with every new integration of a device."""
+    return (
+        getattr(integration, "reported_at", None),
+        tuple(
+            (hotspot.lat, hotspot.lng, hotspot.rssi, hotspot.snr)
+            for hotspot in integration.hotspots
+        ),
+    )
@@ -0,0 +1,252 @@
+"""Synthetic data module.
+
+.. module:: synthetic
+
+:synopsis: Generator of synthetic Helium networks and device uplinks.
+
+.. moduleauthor:: DSIA21
+
+Hotspots are placed uniformly over a region and devices at random
+positions in it. The rssi of an uplink at a hotspot follows a
+log-distance path-loss model with log-normal shadowing, the snr follows
+the rssi above the noise floor. Hotspots receive an uplink if its rssi is
+above the sensitivity of its spreading factor; the strongest ones are
+reported. Uplinks are generated in vectorized chunks of devices, so only
+one chunk is held in memory.
+
+Every generated event has the fields of the integration events returned by
+``get_last_integration`` and the true position of the device as ``lat``
+and ``lng``, so the files can be used to train and evaluate the models.
+"""
+
+import json
+import uuid as uuid_lib
+from dataclasses import dataclass
+from typing import Any
+from typing import Dict
+from typing import Iterator
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+import numpy as np
+import numpy.typing as npt
+
+
+FloatArray = npt.NDArray[np.float64]
+
+METERS_PER_DEGREE = 111195.0  # length of one degree of latitude
+# sensitivity in dBm of the spreading factors at 125 kHz
+SENSITIVITY = {
+    "SF7BW125": -123.0,
+    "SF8BW125": -126.0,
+    "SF9BW125": -129.0,
+    "SF10BW125": -132.0,
+    "SF11BW125": -134.5,
+    "SF12BW125": -137.0,
+}
+FREQUENCIES = (867.1, 867.3, 867.5, 867.7, 867.9, 868.1, 868.3, 868.5)
+CHUNK_ENTRIES = 10000000  # device-hotspot pairs evaluated per chunk
+
+
+@dataclass
+class PathLossModel:
+    """Log-distance path-loss model with log-normal shadowing."""
+
+    # rssi in dBm at the reference distance
+    reference_rssi: float = -40.0
+    reference_distance: float = 1.0
+    exponent: float = 2.7
+    # standard deviation of the shadowing in dB
+    shadowing: float = 6.0
+    noise_floor: float = -117.0
+    snr_noise: float = 2.0
+
+    def rssi(self, distances: FloatArray, rng: np.random.Generator) -> FloatArray:
+        """Return random rssi values for distances.
+
+        :param distances: distances in meters
+        :param rng: random generator
+        :return: rssi in dBm
+        """
+        ratio = np.maximum(distances, self.reference_distance) / self.reference_distance
+        loss = 10 * self.exponent * np.log10(ratio)
+        rssi: FloatArray = (
+            self.reference_rssi
+            - loss
+            + rng.normal(0.0, self.shadowing, np.shape(distances))
+        )
+        return rssi
+
+    def snr(self, rssi: FloatArray, rng: np.random.Generator) -> FloatArray:
+        """Return random snr values for rssi values.
+
+        :param rssi: rssi in dBm
+        :param rng: random generator
+        :return: snr in dB
+        """
+        snr = rssi - self.noise_floor + rng.normal(0.0, self.snr_noise, np.shape(rssi))
+        return np.clip(snr, -20.0, 15.0)
+
+
+@dataclass
+class SyntheticNetwork:
+    """Hotspots placed over a region."""
+
+    addresses: List[str]
+    lat: FloatArray
+    lng: FloatArray
+
+    @classmethod
+    def generate(
+        cls,
+        n_hotspots: int,
+        region: Tuple[float, float, float, float],
+        rng: np.random.Generator,
+    ) -> "SyntheticNetwork":
+        """Place hotspots uniformly over a region.
+
+        :param n_hotspots: number of hotspots
+        :param region: (min_lat, min_lng, max_lat, max_lng)
+        :param rng: random generator
+        :return: SyntheticNetwork
+        """
+        lat, lng = _uniform_positions(n_hotspots, region, rng)
+        addresses = [f"synthetic-{i:08d}" for i in range(n_hotspots)]
+        return cls(addresses=addresses, lat=lat, lng=lng)
+
+    def hotspot(self, index: int) -> Dict[str, Any]:
+        """Return a hotspot in the shape of the Helium API.
+
+        :param index: index of the hotspot
+        :return: hotspot fields
+        """
+        return {
+            "address": self.addresses[index],
+            "name": self.addresses[index],
+            "lat": float(self.lat[index]),
+            "lng": float(self.lng[index]),
+        }
+
+
+def generate_uplinks(
+    network: SyntheticNetwork,
+    n_devices: int,
+    region: Tuple[float, float, float, float],
+    rng: np.random.Generator,
+    path_loss: Optional[PathLossModel] = None,
+    uplinks_per_device: int = 1,
+    max_witnesses: int = 20,
+    start_time: int = 1669299359000,
+) -> Iterator[Dict[str, Any]]:
+    """Generate integration events of random devices with their true positions.
+
+    Uplinks that are not received by any hotspot are skipped.
+
+    :param network: hotspots
+    :param n_devices: number of devices
+    :param region: (min_lat, min_lng, max_lat, max_lng) of the devices
+    :param rng: random generator
+    :param path_loss: propagation model, the default model if None
+    :param uplinks_per_device: uplinks of every device at its position
+    :param max_witnesses: strongest receiving hotspots reported per uplink
+    :param start_time: time of the first uplink in milliseconds
+    :return: integration events with ``lat`` and ``lng`` of the device
+    """
+    path_loss = path_loss or PathLossModel()
+    datarates = np.array(list(SENSITIVITY))
+    sensitivity = np.array(list(SENSITIVITY.values()))
+    hotspot_xy = _project(network.lat, network.lng, region)
+    chunk = max(CHUNK_ENTRIES // max(len(network.addresses), 1), 1)
+    reported_at = start_time
+
+    for first in range(0, n_devices, chunk):
+        n = min(chunk, n_devices - first)
+        lat, lng = _uniform_positions(n, region, rng)
+        devices = np.repeat(np.arange(n), uplinks_per_device)
+        device_xy = _project(lat, lng, region)[devices]
+        distances = np.hypot(
+            device_xy[:, None, 0] - hotspot_xy[None, :, 0],
+            device_xy[:, None, 1] - hotspot_xy[None, :, 1],
+        )
+        rssi = path_loss.rssi(distances, rng)
+        datarate = rng.integers(0, len(datarates), len(devices))
+        frequency = rng.choice(FREQUENCIES, len(devices))
+        received = rssi >= sensitivity[datarate][:, None]
+        # strongest witnesses first, not received ones last
+        key = np.where(received, -rssi, np.inf)
+        if key.shape[1] > max_witnesses:
+            strongest = np.argpartition(key, max_witnesses - 1, axis=1)
+            key = np.take_along_axis(key, strongest[:, :max_witnesses], axis=1)
+        else:
+            strongest = np.broadcast_to(np.arange(key.shape[1]), key.shape)
+        order = np.argsort(key, axis=1)
+        ranked = np.take_along_axis(strongest[:, : key.shape[1]], order, axis=1)
+
+        for row, device in enumerate(devices):
+            witnesses = [h for h in ranked[row] if received[row, h]]
+            if not witnesses:
+                continue
+            uplink_rssi = np.round(rssi[row, witnesses], 1)
+            snr = np.round(path_loss.snr(uplink_rssi, rng), 1)
+            reported_at += 1000
+            device_id = f"synthetic-device-{first + device:08d}"
+            hotspots = [
+                {
+                    **network.hotspot(h),
+                    "rssi": float(r),
+                    "snr": float(s),
+                    "datarate": str(datarates[datarate[row]]),
+                    "frequency": float(frequency[row]),
+                    "reported_at": reported_at,
+                }
+                for h, r, s in zip(witnesses, uplink_rssi, snr)
+            ]
+            yield {
+                "data": {},
+                "description": "synthetic uplink",
+                "device_id": device_id,
+                "organization_id": "synthetic",
+                "reported_at": str(reported_at),
+                "router_uuid": str(uuid_lib.UUID(int=int(rng.integers(2**63)))),
+                "sub_category": "uplink_integration_req",
+                "hotspots": hotspots,
+                "lat": float(lat[device]),
+                "lng": float(lng[device]),
+            }
+
+
+def write_events(path: str, events: Iterator[Dict[str, Any]]) -> int:
+    """Write events to a JSON lines file.
+
+    :param path: file path
+    :param events: events
+    :return: number of written events
+    """
+    count = 0
+    with open(path, "w") as file:
+        for event in events:
+            file.write(json.dumps(event))
+            file.write("\n")
+            count += 1
+    return count
+
+
+def _uniform_positions(
+    n: int, region: Tuple[float, float, float, float], rng: np.random.Generator
+) -> Tuple[FloatArray, FloatArray]:
+    """Return positions uniformly distributed over the area of a region."""
+    min_lat, min_lng, max_lat, max_lng = region
+    # uniform in sin(lat) is uniform in area
+    sin_lat = rng.uniform(np.sin(np.radians(min_lat)), np.sin(np.radians(max_lat)), n)
+    return np.degrees(np.arcsin(sin_lat)), rng.uniform(min_lng, max_lng, n)
+
+
+def _project(
+    lat: FloatArray, lng: FloatArray, region: Tuple[float, float, float, float]
+) -> FloatArray:
+    """Project positions onto a local plane in meters around the region centre."""
+    centre_lat = (region[0] + region[2]) / 2
+    x = (lng - region[1]) * METERS_PER_DEGREE * np.cos(np.radians(centre_lat))
+    y = (lat - region[0]) * METERS_PER_DEGREE
+    return np.column_stack([x, y])
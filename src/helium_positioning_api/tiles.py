@@ -0,0 +1,245 @@
+"""Tiles module.
+
+.. module:: tiles
+
+:synopsis: Device density and last-seen aggregates of map tiles at several zoom levels.
+
+.. moduleauthor:: DSIA21
+
+Positions are binned into the tiles of the Web Mercator tiling of web maps
+(``x``, ``y`` at a zoom level). Every device is counted in the tile of its
+latest position at every zoom level; the tile of a device at the highest
+zoom level is kept, so a prediction only changes the counts of the zoom
+levels at which the device moved to another tile. ``last_seen`` of a tile
+is the time of the latest prediction in it.
+
+The tiles of a zoom level are stored by row, so a viewport query visits
+the rows and columns of the viewport that hold devices, and its cost
+grows with the number of returned tiles, not with the number of devices.
+"""
+
+import math
+import threading
+import time
+from typing import Any
+from typing import Dict
+from typing import Iterable
+from typing import List
+from typing import Optional
+from typing import Sequence
+from typing import Tuple
+
+import numpy as np
+import numpy.typing as npt
+
+from helium_positioning_api.DataObjects import Prediction
+
+
+FloatArray = npt.NDArray[np.float64]
+
+MAX_LATITUDE = 85.05112878  # latitude of the edges of the Web Mercator tiling
+ZOOMS = (4, 6, 8, 10, 12, 14)  # aggregated zoom levels
+
+Tile = Tuple[int, int]
+# column x -> [device count, last seen in milliseconds] of a row of tiles
+Row = Dict[int, List[int]]
+
+
+class TileAggregates:
+    """Device counts and last-seen times of the tiles at several zoom levels."""
+
+    def __init__(self, zooms: Sequence[int] = ZOOMS) -> None:
+        """Create empty aggregates.
+
+        :param zooms: zoom levels to aggregate
+        """
+        self.zooms = tuple(sorted(set(zooms)))
+        self._max_zoom = self.zooms[-1]
+        # tile of the latest position of every device at the highest zoom
+        self._devices: Dict[str, Tile] = {}
+        self._rows: Dict[int, Dict[int, Row]] = {zoom: {} for zoom in self.zooms}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        """Return the number of devices."""
+        return len(self._devices)
+
+    def update(
+        self, uuid: str, lat: float, lng: float, timestamp: Optional[int] = None
+    ) -> None:
+        """Count a device in the tiles of its latest position.
+
+        :param uuid: Device id
+        :param lat: latitude
+        :param lng: longitude
+        :param timestamp: time in milliseconds, now if None
+        """
+        if timestamp is None:
+            timestamp = int(time.time() * 1000)
+        x, y = tile(lat, lng, self._max_zoom)
+        with self._lock:
+            old = self._devices.get(uuid)
+            self._devices[uuid] = (x, y)
+            for zoom in self.zooms:
+                shift = self._max_zoom - zoom
+                new_tile = (x >> shift, y >> shift)
+                stats = self._stats(zoom, new_tile)
+                if old is None:
+                    stats[0] += 1
+                else:
+                    old_tile = (old[0] >> shift, old[1] >> shift)
+                    if old_tile != new_tile:
+                        stats[0] += 1
+                        self._leave(zoom, old_tile)
+                stats[1] = max(stats[1], timestamp)
+
+    def load(
+        self,
+        uuids: Iterable[str],
+        lat: FloatArray,
+        lng: FloatArray,
+        timestamps: npt.NDArray[np.int64],
+    ) -> None:
+        """Replace the aggregates with the latest positions of devices.
+
+        Positions that are NaN are skipped.
+
+        :param uuids: Device ids
+        :param lat: latitudes
+        :param lng: longitudes
+        :param timestamps: times in milliseconds
+        """
+        ids = np.asarray(list(uuids), dtype=object)
+        lat, lng = np.asarray(lat, dtype=np.float64), np.asarray(lng, dtype=np.float64)
+        timestamps = np.asarray(timestamps, dtype=np.int64)
+        valid = ~(np.isnan(lat) | np.isnan(lng))
+        ids, timestamps = ids[valid], timestamps[valid]
+        x, y = tiles(lat[valid], lng[valid], self._max_zoom)
+        rows: Dict[int, Dict[int, Row]] = {}
+        for zoom in self.zooms:
+            shift = self._max_zoom - zoom
+            keys = ((x >> shift) << 32) | (y >> shift)
+            unique, inverse = np.unique(keys, return_inverse=True)
+            counts = np.bincount(inverse, minlength=len(unique))
+            last_seen = np.zeros(len(unique), dtype=np.int64)
+            np.maximum.at(last_seen, inverse, timestamps)
+            rows[zoom] = {}
+            for key, count, seen in zip(
+                unique.tolist(), counts.tolist(), last_seen.tolist()
+            ):
+                rows[zoom].setdefault(key & 0xFFFFFFFF, {})[key >> 32] = [count, seen]
+        devices = dict(zip(ids.tolist(), zip(x.tolist(), y.tolist())))
+        with self._lock:
+            self._rows, self._devices = rows, devices
+
+    def viewport(
+        self,
+        zoom: int,
+        min_lat: float,
+        min_lng: float,
+        max_lat: float,
+        max_lng: float,
+    ) -> List[Dict[str, Any]]:
+        """Return the tiles with devices in a viewport, by row and column.
+
+        A viewport with ``min_lng`` greater than ``max_lng`` crosses the
+        antimeridian.
+
+        :param zoom: one of the aggregated zoom levels
+        :param min_lat: southern edge
+        :param min_lng: western edge
+        :param max_lat: northern edge
+        :param max_lng: eastern edge
+        :return: ``x``, ``y``, ``count`` and ``last_seen`` of the tiles
+        """
+        if zoom not in self._rows:
+            raise ValueError(f"Zoom level {zoom} is not aggregated, use {self.zooms}.")
+        if min_lat > max_lat:
+            raise ValueError("min_lat is north of max_lat.")
+        west, north = tile(max_lat, min_lng, zoom)
+        east, south = tile(min_lat, max_lng, zoom)
+        if min_lng <= max_lng:
+            columns = [(west, east)]
+        else:
+            columns = [(west, (1 << zoom) - 1), (0, east)]
+        result = []
+        with self._lock:
+            rows = self._rows[zoom]
+            for y in _keys(rows, north, south):
+                row = rows[y]
+                for first, last in columns:
+                    for x in _keys(row, first, last):
+                        count, last_seen = row[x]
+                        result.append(
+                            {"x": x, "y": y, "count": count, "last_seen": last_seen}
+                        )
+        return result
+
+    def update_prediction(self, prediction: Prediction, model: str) -> None:
+        """Count the position of a prediction, ignore unsuccessful ones.
+
+        Can be registered with :func:`helium_positioning_api.listeners.add_listener`.
+
+        :param prediction: Prediction
+        :param model: name of the model that produced the prediction
+        """
+        if prediction.lat is not None and prediction.lng is not None:
+            self.update(prediction.uuid, prediction.lat, prediction.lng)
+
+    def _stats(self, zoom: int, key: Tile) -> List[int]:
+        """Return the aggregates of a tile, creating empty ones."""
+        row = self._rows[zoom].setdefault(key[1], {})
+        return row.setdefault(key[0], [0, 0])
+
+    def _leave(self, zoom: int, key: Tile) -> None:
+        """Remove a device from the count of a tile, dropping empty tiles."""
+        x, y = key
+        row = self._rows[zoom][y]
+        row[x][0] -= 1
+        if not row[x][0]:
+            del row[x]
+            if not row:
+                del self._rows[zoom][y]
+
+
+def tile(lat: float, lng: float, zoom: int) -> Tile:
+    """Return the Web Mercator tile of a position.
+
+    :param lat: latitude, clipped to the edges of the tiling
+    :param lng: longitude between -180 and 180
+    :param zoom: zoom level
+    :return: (x, y) of the tile
+    """
+    n = 1 << zoom
+    lat = min(max(lat, -MAX_LATITUDE), MAX_LATITUDE)
+    x = int((lng + 180.0) / 360.0 * n)
+    phi = math.radians(lat)
+    y = int((1.0 - math.asinh(math.tan(phi)) / math.pi) / 2.0 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+
+def tiles(
+    lat: FloatArray, lng: FloatArray, zoom: int
+) -> Tuple[npt.NDArray[np.int64], npt.NDArray[np.int64]]:
+    """Return the Web Mercator tiles of positions, like :func:`tile`.
+
+    :param lat: latitudes
+    :param lng: longitudes
+    :param zoom: zoom level
+    :return: x and y of the tiles
+    """
+    n = 1 << zoom
+    phi = np.radians(np.clip(lat, -MAX_LATITUDE, MAX_LATITUDE))
+    x = ((lng + 180.0) / 360.0 * n).astype(np.int64)
+    y = ((1.0 - np.arcsinh(np.tan(phi)) / np.pi) / 2.0 * n).astype(np.int64)
+    return np.clip(x, 0, n - 1), np.clip(y, 0, n - 1)
+
+
+def _keys(items: Dict[int, Any], first: int, last: int) -> List[int]:
+    """Return the keys of a dictionary in a range, in order.
+
+    Visits the range or the keys, whichever is smaller.
+    """
+    if last - first + 1 <= len(items):
+        return [key for key in range(first, last + 1) if key in items]
+    return sorted(key for key in items if first <= key <= last)
@@ -0,0 +1,400 @@
+"""Training module.
+
+.. module:: training
+
+:synopsis: Out-of-core training of the distance models.
+
+.. moduleauthor:: DSIA21
+
+Labelled uplinks are streamed in chunks from JSON lines or Parquet files.
+Features are extracted from the chunks in worker processes. The data is read
+twice: the first pass fits the preprocessor, the second pass fits the linear
+regression incrementally and draws the reservoir sample the gradient boosted
+regression is fitted on, as well as a holdout sample for the error report.
+Only one chunk per worker and the samples are held in memory.
+"""
+
+import json
+import logging
+import os
+import time
+from concurrent.futures import Future
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import Iterable
+from typing import Iterator
+from typing import List
+from typing import Optional
+from typing import Sequence
+from typing import Set
+from typing import Tuple
+
+import joblib
+import numpy as np
+import numpy.typing as npt
+import pandas as pd
+from haversine import Unit
+from haversine import haversine_vector
+from sklearn.ensemble import HistGradientBoostingRegressor
+from sklearn.linear_model import SGDRegressor
+
+
+try:
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover
+    pq = None
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+FloatArray = npt.NDArray[np.float64]
+
+NUMERIC_FEATURES = ("snr", "rssi", "frequency")
+FEATURES = ("snr", "rssi", "datarate", "frequency")
+CHUNK_SIZE = 100000  # uplinks or rows per chunk
+SAMPLE_SIZE = 1000000  # rows of the reservoir sample of the gradient boosting
+HOLDOUT_FRACTION = 0.02  # rows held out for the error report
+HOLDOUT_SIZE = 100000  # maximum rows of the holdout sample
+LATENCY_SAMPLES = 200  # single predictions timed for the latency report
+
+
+class StreamingPreprocessor:
+    """Preprocessor of the distance features that can be fitted in chunks.
+
+    Scales snr, rssi and frequency to zero mean and unit variance and
+    encodes the datarate as ordinal of the sorted datarates seen in
+    training, unknown datarates as -1, like the shipped preprocessor.
+    """
+
+    def __init__(self) -> None:
+        """Create an unfitted preprocessor."""
+        self.n_samples_seen_ = 0
+        self.mean_ = np.zeros(len(NUMERIC_FEATURES))
+        self._m2 = np.zeros(len(NUMERIC_FEATURES))
+        self._datarates: Set[str] = set()
+        self.categories_: List[str] = []
+
+    @property
+    def scale_(self) -> FloatArray:
+        """Return the standard deviation of the numeric features."""
+        var = self._m2 / max(self.n_samples_seen_, 1)
+        return np.where(var > 0, np.sqrt(var), 1.0)
+
+    def partial_fit(self, data: pd.DataFrame) -> "StreamingPreprocessor":
+        """Update the statistics with a chunk of features.
+
+        :param data: features
+        :return: the preprocessor
+        """
+        values = data[list(NUMERIC_FEATURES)].to_numpy(dtype=np.float64)
+        if not len(values):
+            return self
+        # parallel variance update (Chan et al.) of the running statistics
+        n, chunk_n = self.n_samples_seen_, len(values)
+        chunk_mean = values.mean(axis=0)
+        chunk_m2 = ((values - chunk_mean) ** 2).sum(axis=0)
+        delta = chunk_mean - self.mean_
+        total = n + chunk_n
+        self.mean_ = self.mean_ + delta * chunk_n / total
+        self._m2 = self._m2 + chunk_m2 + delta**2 * n * chunk_n / total
+        self.n_samples_seen_ = total
+        self._datarates.update(data["datarate"].astype(str).unique())
+        self.categories_ = sorted(self._datarates)
+        return self
+
+    def transform(self, data: pd.DataFrame) -> FloatArray:
+        """Return the model input of features.
+
+        :param data: features
+        :return: scaled snr, rssi, frequency and encoded datarate
+        """
+        numeric = data[list(NUMERIC_FEATURES)].to_numpy(dtype=np.float64)
+        codes = {datarate: i for i, datarate in enumerate(self.categories_)}
+        datarate = data["datarate"].astype(str).map(codes).fillna(-1).to_numpy()
+        return np.column_stack([(numeric - self.mean_) / self.scale_, datarate])
+
+
+def read_chunks(path: str, chunk_size: int = CHUNK_SIZE) -> Iterator[List[Any]]:
+    """Read labelled uplinks or feature rows from a file in chunks.
+
+    JSON lines files hold one record per line, Parquet files (requires
+    ``pyarrow``) one record per row.
+
+    :param path: ``.jsonl``/``.json`` or ``.parquet`` file
+    :param chunk_size: records per chunk
+    :return: chunks of records
+    """
+    if path.endswith(".parquet"):
+        if pq is None:
+            raise ValueError("Reading Parquet files requires pyarrow.")
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size):
+            yield batch.to_pylist()
+        return
+    with open(path) as file:
+        lines = (line for line in file if line.strip())
+        while chunk := list(islice(lines, chunk_size)):
+            yield chunk
+
+
+def read_paths(paths: Iterable[str]) -> List[str]:
+    """Expand directories to the JSON lines and Parquet files they contain.
+
+    :param paths: files or directories
+    :return: files
+    """
+    files: List[str] = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(
+                os.path.join(path, name)
+                for name in sorted(os.listdir(path))
+                if name.endswith((".jsonl", ".json", ".parquet"))
+            )
+        else:
+            files.append(path)
+    return files
+
+
+def extract_features(records: List[Any]) -> pd.DataFrame:
+    """Return the features and true distances of labelled uplinks.
+
+    A record is either a labelled uplink with the known ``lat`` and ``lng``
+    of the device and its witnessing ``hotspots`` (with their ``lat``,
+    ``lng``, ``snr``, ``rssi``, ``datarate`` and ``frequency``), or a row
+    of features with the true ``distance`` in meters. Rows with missing
+    values are dropped.
+
+    :param records: JSON strings or dicts
+    :return: snr, rssi, datarate, frequency and distance
+    """
+    rows: List[Dict[str, Any]] = []
+    uplinks: List[Dict[str, Any]] = []
+    for record in records:
+        if isinstance(record, str):
+            record = json.loads(record)
+        if "hotspots" in record:
+            for hotspot in record["hotspots"]:
+                uplinks.append(
+                    {
+                        **hotspot,
+                        "device_lat": record["lat"],
+                        "device_lng": record["lng"],
+                    }
+                )
+        else:
+            rows.append(record)
+
+    frames = []
+    if rows:
+        frames.append(pd.DataFrame(rows, columns=[*FEATURES, "distance"]))
+    if uplinks:
+        data = pd.DataFrame(uplinks).dropna(
+            subset=["lat", "lng", "device_lat", "device_lng"]
+        )
+        data["distance"] = haversine_vector(
+            data[["lat", "lng"]].to_numpy(dtype=np.float64),
+            data[["device_lat", "device_lng"]].to_numpy(dtype=np.float64),
+            unit=Unit.METERS,
+        )
+        frames.append(data.reindex(columns=[*FEATURES, "distance"]))
+    if not frames:
+        return pd.DataFrame(columns=[*FEATURES, "distance"])
+    features = pd.concat(frames, ignore_index=True).dropna()
+    features["datarate"] = features["datarate"].astype(str)
+    return features
+
+
+def stream_features(
+    paths: Sequence[str], chunk_size: int = CHUNK_SIZE, n_jobs: int = 1
+) -> Iterator[pd.DataFrame]:
+    """Read files in chunks and extract their features in worker processes.
+
+    At most two chunks per worker are read ahead.
+
+    :param paths: input files
+    :param chunk_size: records per chunk
+    :param n_jobs: number of worker processes, in process if 1
+    :return: features of the chunks in file order
+    """
+    chunks = (chunk for path in paths for chunk in read_chunks(path, chunk_size))
+    if n_jobs <= 1:
+        yield from map(extract_features, chunks)
+        return
+    with ProcessPoolExecutor(n_jobs) as executor:
+        pending: List["Future[pd.DataFrame]"] = []
+        for chunk in chunks:
+            pending.append(executor.submit(extract_features, chunk))
+            if len(pending) >= 2 * n_jobs:
+                yield pending.pop(0).result()
+        for future in pending:
+            yield future.result()
+
+
+def train(
+    paths: Sequence[str],
+    output: str,
+    chunk_size: int = CHUNK_SIZE,
+    n_jobs: int = 1,
+    sample_size: int = SAMPLE_SIZE,
+    epochs: int = 1,
+    seed: int = 0,
+) -> Dict[str, Any]:
+    """Train the preprocessor and the distance models out of core.
+
+    Writes ``preprocessor.joblib``, ``linear_regression.joblib`` and
+    ``gradient_boosting.joblib`` for
+    :func:`helium_positioning_api.distance_prediction.predict_distance`
+    and the returned report as ``training_report.json`` to ``output``.
+
+    :param paths: JSON lines or Parquet files of labelled uplinks
+    :param output: directory of the artifacts
+    :param chunk_size: records per chunk
+    :param n_jobs: number of feature extraction processes
+    :param sample_size: rows of the gradient boosting sample
+    :param epochs: passes of the linear regression over the data
+    :param seed: seed of the sampling and the models
+    :return: report with row counts, timings, holdout errors and latencies
+    """
+    rng = np.random.default_rng(seed)
+    timings: Dict[str, float] = {}
+
+    def features() -> Iterator[pd.DataFrame]:
+        return stream_features(paths, chunk_size, n_jobs)
+
+    start = time.perf_counter()
+    preprocessor = StreamingPreprocessor()
+    for chunk in features():
+        preprocessor.partial_fit(chunk)
+    timings["preprocessor"] = time.perf_counter() - start
+    if not preprocessor.n_samples_seen_:
+        raise ValueError("No labelled uplinks found in the input.")
+
+    start = time.perf_counter()
+    linear_regression = SGDRegressor(random_state=seed)
+    sample = _Reservoir(sample_size, rng)
+    holdout = _Reservoir(HOLDOUT_SIZE, rng)
+    rows = 0
+    for epoch in range(epochs):
+        for index, chunk in enumerate(features()):
+            held_out = _held_out(seed, index, len(chunk))
+            x = preprocessor.transform(chunk)
+            y = chunk["distance"].to_numpy(dtype=np.float64)
+            if epoch == 0:
+                rows += len(chunk)
+                holdout.add(x[held_out], y[held_out])
+                sample.add(x[~held_out], y[~held_out])
+            if (~held_out).any():
+                linear_regression.partial_fit(x[~held_out], y[~held_out])
+    timings["linear_regression"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    sample_x, sample_y = sample.values()
+    gradient_boosting = HistGradientBoostingRegressor(random_state=seed)
+    gradient_boosting.fit(sample_x, sample_y)
+    timings["gradient_boosting"] = time.perf_counter() - start
+
+    os.makedirs(output, exist_ok=True)
+    models = {
+        "linear_regression": linear_regression,
+        "gradient_boosting": gradient_boosting,
+    }
+    joblib.dump(preprocessor, os.path.join(output, "preprocessor.joblib"))
+    for name, model in models.items():
+        joblib.dump(model, os.path.join(output, f"{name}.joblib"))
+
+    holdout_x, holdout_y = holdout.values()
+    report: Dict[str, Any] = {
+        "rows": rows,
+        "sample_rows": len(sample_y),
+        "holdout_rows": len(holdout_y),
+        "training_seconds": timings,
+        "models": {},
+    }
+    for name, model in models.items():
+        report["models"][name] = {
+            **_errors(model.predict, holdout_x, holdout_y),
+            **_latency(preprocessor, model),
+        }
+    with open(os.path.join(output, "training_report.json"), "w") as file:
+        json.dump(report, file, indent=2)
+    return report
+
+
+def _held_out(seed: int, index: int, rows: int) -> npt.NDArray[np.bool_]:
+    """Return the holdout mask of a chunk, the same in every epoch.
+
+    :param seed: seed of the training
+    :param index: position of the chunk in the input
+    :param rows: rows of the chunk
+    :return: boolean mask of the held out rows
+    """
+    return np.random.default_rng([seed, index]).random(rows) < HOLDOUT_FRACTION
+
+
+class _Reservoir:
+    """Uniform sample of fixed size from a stream of rows (algorithm R)."""
+
+    def __init__(self, size: int, rng: np.random.Generator) -> None:
+        """Create an empty sample."""
+        self.size = size
+        self.rng = rng
+        self.seen = 0
+        self.x: Optional[FloatArray] = None
+        self.y = np.empty(size)
+
+    def add(self, x: FloatArray, y: FloatArray) -> None:
+        """Offer rows to the sample."""
+        if self.x is None:
+            self.x = np.empty((self.size, x.shape[1]))
+        free = max(min(self.size - self.seen, len(y)), 0)
+        self.x[self.seen : self.seen + free] = x[:free]
+        self.y[self.seen : self.seen + free] = y[:free]
+        if free < len(y):
+            # row i of the stream replaces a random row with probability size / i
+            positions = self.rng.integers(
+                0, np.arange(self.seen + free, self.seen + len(y)) + 1
+            )
+            replace = positions < self.size
+            self.x[positions[replace]] = x[free:][replace]
+            self.y[positions[replace]] = y[free:][replace]
+        self.seen += len(y)
+
+    def values(self) -> Tuple[FloatArray, FloatArray]:
+        """Return the sampled rows."""
+        n = min(self.seen, self.size)
+        if self.x is None:
+            return np.empty((0, len(FEATURES))), np.empty(0)
+        return self.x[:n], self.y[:n]
+
+
+def _errors(
+    predict: Callable[[FloatArray], FloatArray], x: FloatArray, y: FloatArray
+) -> Dict[str, float]:
+    """Return the holdout errors of a model in meters."""
+    if not len(y):
+        return {}
+    error = predict(x) - y
+    return {
+        "rmse": float(np.sqrt(np.mean(error**2))),
+        "mae": float(np.mean(np.abs(error))),
+    }
+
+
+def _latency(preprocessor: StreamingPreprocessor, model: Any) -> Dict[str, float]:
+    """Return the latency of single predictions including the preprocessing."""
+    features = pd.DataFrame(
+        {"snr": [0.0], "rssi": [-100.0], "datarate": ["SF9BW125"], "frequency": [868.1]}
+    )
+    model.predict(preprocessor.transform(features))
+    latencies = []
+    for _ in range(LATENCY_SAMPLES):
+        start = time.perf_counter()
+        model.predict(preprocessor.transform(features))
+        latencies.append(time.perf_counter() - start)
+    return {
+        "latency_p50_ms": float(np.percentile(latencies, 50) * 1000),
+        "latency_p99_ms": float(np.percentile(latencies, 99) * 1000),
+    }
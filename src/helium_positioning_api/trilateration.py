@@ -3,6 +3,7 @@
 import logging
 from typing import Any
 from typing import List
+from typing import Optional
 from typing import Tuple
 
 from haversine import Unit
@@ -17,6 +18,10 @@ from helium_positioning_api.auxilary import mid
 from helium_positioning_api.DataObjects import Prediction
 from helium_positioning_api.distance_prediction import predict_distance
 from helium_positioning_api.nearest_neighbor import nearest_neighbor
+from helium_positioning_api.triple_selection import CONSISTENCY_TOL
+from helium_positioning_api.triple_selection import range_residual
+from helium_positioning_api.triple_selection import rank_triples
+from helium_positioning_api.witnesses import select_witnesses
 
 
 logging.basicConfig(level=logging.INFO)
@@ -24,40 +29,122 @@ logger = logging.getLogger(__name__)
 
 tol = 25  # tol in meters
 m = Unit.METERS
+MAX_TRIPLE_EVALUATIONS = 10
 
 
-def trilateration(uuid: str, model: str) -> Prediction:
+def trilateration(
+    uuid: str,
+    model: str,
+    max_evaluations: int = MAX_TRIPLE_EVALUATIONS,
+    hotspots: Optional[List[IntegrationHotspot]] = None,
+) -> Prediction:
     """Predicts the location of a given device using trilateration.
 
     :param uuid: Device id
     :param model: Model to use for distance prediction
+    :param max_evaluations: maximum number of hotspot triples to trilaterate
+    :param hotspots: hotspots of the last integration, loaded if not given
 
     :return: coordinates of predicted location
     """
-    hotspots = get_integration_hotspots(uuid)
-    sorted_hotspots = sorted(hotspots, key=lambda h: h.rssi)
+    if hotspots is None:
+        hotspots = get_integration_hotspots(uuid)
+    sorted_hotspots = select_witnesses(hotspots).hotspots
 
     if len(sorted_hotspots) < 3:
         logger.warning(
             "Not enough hotspots to perform trilateration. "
             "Using nearest neighbor model instead."
         )
-        return nearest_neighbor(uuid)
+        return nearest_neighbor(uuid, sorted_hotspots)
 
     longitudes, latitudes, distances = compile_hotspot_info(sorted_hotspots, model)
+    estimated_position = search_trilateration(
+        latitudes, longitudes, distances, uuid, max_evaluations
+    )
+    if estimated_position is None:
+        logger.warning(
+            "No hotspot triple could be trilaterated. "
+            "Using nearest neighbor model instead."
+        )
+        return nearest_neighbor(uuid, sorted_hotspots)
+
+    return Prediction(
+        uuid=uuid,
+        lat=estimated_position[0],
+        lng=estimated_position[1],
+        model=model,
+    )
+
+
+def search_trilateration(
+    latitudes: List[float],
+    longitudes: List[float],
+    distances: List[float],
+    uuid: str,
+    max_evaluations: int = MAX_TRIPLE_EVALUATIONS,
+) -> Optional[Tuple[float, float]]:
+    """Trilaterate the best hotspot triples until a consistent estimate is found.
+
+    Triples are evaluated best first as ranked by
+    :func:`helium_positioning_api.triple_selection.rank_triples`. The search
+    stops at the first estimate whose median relative range residual over all
+    hotspots is below ``CONSISTENCY_TOL``, otherwise the estimate with the
+    lowest residual out of ``max_evaluations`` triples is returned.
+
+    :param latitudes: List of latitudes
+    :param longitudes: List of longitudes
+    :param distances: List of distances
+    :param uuid: Device id
+    :param max_evaluations: maximum number of triples to trilaterate
+
+    :return: estimated position or None if no triple could be trilaterated
+    """
+    best_position, best_residual = None, float("inf")
+    for indices in rank_triples(latitudes, longitudes, distances)[:max_evaluations]:
+        try:
+            estimated_position = trilaterate_triple(
+                latitudes, longitudes, distances, uuid, indices
+            )
+        except ValueError:
+            logger.debug(f"Triple {indices} could not be trilaterated.")
+            continue
+        residual = range_residual(estimated_position, latitudes, longitudes, distances)
+        if residual < best_residual:
+            best_position, best_residual = estimated_position, residual
+        if residual < CONSISTENCY_TOL:
+            break
+    return best_position
+
+
+def trilaterate_triple(
+    latitudes: List[float],
+    longitudes: List[float],
+    distances: List[float],
+    uuid: str,
+    indices: Tuple[int, int, int] = (0, 1, 2),
+) -> Tuple[float, float]:
+    """Estimate the position of a device from one triple of hotspots.
+
+    :param latitudes: List of latitudes
+    :param longitudes: List of longitudes
+    :param distances: List of distances
+    :param uuid: Device id
+    :param indices: indices of the hotspots to trilaterate
+
+    :return: estimated position
+    """
     # calculating intersects
-    centres, intersects = do_intersrect(latitudes, longitudes, distances)
+    centres, intersects = do_intersrect(latitudes, longitudes, distances, indices)
     # classifying intersects
     empty_intersects, two_intersection_points, singular_points = classify_intersects(
         intersects
     )
     # estimation proper
-    estimated_position = estimate_trilateration(
+    return estimate_trilateration(
         empty_intersects, two_intersection_points, singular_points, centres, uuid
     )
 
-    return Prediction(uuid=uuid, lat=estimated_position[0], lng=estimated_position[1])
-
 
 def compile_hotspot_info(
     sorted_hotspots: List[IntegrationHotspot], model: str
@@ -69,20 +156,19 @@ def compile_hotspot_info(
 
     :return: longitudes, latitudes, distances of said hotspots as list
     """
-    distances, longitudes, latitudes = [], [], []
-    for hotspot in sorted_hotspots:
-        dist = predict_distance(
-            model,
-            {
-                "snr": [hotspot.snr],
-                "rssi": [hotspot.rssi],
-                "datarate": [hotspot.datarate],
-                "frequency": [hotspot.frequency],
-            },
-        )
-        longitudes.append(hotspot.lng)
-        latitudes.append(hotspot.lat)
-        distances.append(dist)
+    # one prediction for all hotspots, the per-call overhead dominates
+    predicted = predict_distance(
+        model,
+        {
+            "snr": [hotspot.snr for hotspot in sorted_hotspots],
+            "rssi": [hotspot.rssi for hotspot in sorted_hotspots],
+            "datarate": [hotspot.datarate for hotspot in sorted_hotspots],
+            "frequency": [hotspot.frequency for hotspot in sorted_hotspots],
+        },
+    )
+    longitudes = [hotspot.lng for hotspot in sorted_hotspots]
+    latitudes = [hotspot.lat for hotspot in sorted_hotspots]
+    distances = [float(dist) for dist in predicted]
 
     # hotspots = zip(latitudes, longitudes, distances, strict=False)
     return longitudes, latitudes, distances
@@ -186,7 +272,7 @@ def estimate_trilateration(
 
     :return: Prediction
     """
-    if len(singular_points) == 1 & len(two_intersection_points) == 0:
+    if len(singular_points) == 1 and len(two_intersection_points) == 0:
         estimated_position = singular_points[0]
 
     elif len(singular_points) == 2:
@@ -203,7 +289,9 @@ def estimate_trilateration(
     elif len(two_intersection_points) == 1:
         estimated_position = singular_two_int_handler(two_intersection_points, centres)
 
-    # TODO en(empty_intersects) == 3 INTERSECTIONS over other indices
+    else:
+        # other triples are tried by search_trilateration
+        raise ValueError("The circles of the triple have no usable intersections")
     return estimated_position
 
 
@@ -217,6 +305,7 @@ def two_singular_handler(
 
     :return: position estimation
     """
+    estimated_position = None
     if haversine(singular_points[0], singular_points[1], unit=m) < tol:
         estimated_position = mid(singular_points[0], singular_points[1])
     else:
@@ -225,6 +314,8 @@ def two_singular_handler(
                 for i in range(2):
                     if haversine(singular, two_int[i], unit=m):
                         estimated_position = mid(singular, two_int[i])
+    if estimated_position is None:
+        raise ValueError("The singular intersections are apart and alone")
     return estimated_position
 
 
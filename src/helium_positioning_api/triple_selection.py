@@ -0,0 +1,143 @@
+"""Triple selection for trilateration.
+
+Ranks candidate hotspot triples by geometric quality and by the reliability
+of their predicted distances, so trilateration can evaluate the most
+promising triples first instead of always using the first three hotspots.
+"""
+
+from itertools import combinations
+from math import cos
+from math import radians
+from typing import List
+from typing import Sequence
+from typing import Tuple
+
+import numpy as np
+import numpy.typing as npt
+from haversine import Unit
+from haversine import haversine
+
+
+FloatArray = npt.NDArray[np.float64]
+
+m = Unit.METERS
+earth_radius = 6371008.8  # mean earth radius in meters
+
+# hotspots considered for triples, bounds the number of candidates to C(12, 3)
+MAX_HOTSPOTS = 12
+# triples with a worse dilution of precision are pruned
+MAX_DOP = 10.0
+# distance at which the reliability of a predicted distance has halved
+RELIABILITY_DISTANCE = 1000.0
+# relative range residual below which a trilateration is considered consistent
+CONSISTENCY_TOL = 0.1
+
+
+def rank_triples(
+    latitudes: Sequence[float],
+    longitudes: Sequence[float],
+    distances: Sequence[float],
+    max_hotspots: int = MAX_HOTSPOTS,
+    max_dop: float = MAX_DOP,
+) -> List[Tuple[int, int, int]]:
+    """Return candidate hotspot triples, best first.
+
+    Only the ``max_hotspots`` hotspots with the most reliable (shortest)
+    predicted distances are combined. Every triple is scored by the product
+    of its distance reliabilities divided by its dilution of precision;
+    degenerate triples (collinear or coincident hotspots) are pruned.
+
+    :param latitudes: latitudes of the hotspots
+    :param longitudes: longitudes of the hotspots
+    :param distances: predicted distances to the hotspots in meters
+    :param max_hotspots: number of hotspots considered for triples
+    :param max_dop: maximum dilution of precision of a triple
+
+    :return: indices of the hotspot triples sorted by descending quality
+    """
+    dist = np.asarray(distances, dtype=np.float64).reshape(-1)
+    if len(dist) < 3:
+        return []
+
+    reliability = 1 / (1 + dist / RELIABILITY_DISTANCE)
+    # stable sort keeps the original hotspot order for equal distances
+    considered = np.argsort(-reliability, kind="stable")[:max_hotspots]
+    x, y = _local_coordinates(latitudes, longitudes)
+
+    triples = np.array(list(combinations(sorted(considered), 3)))
+    dop = dilution_of_precision(x[triples], y[triples], dist[triples])
+    score = reliability[triples].prod(axis=1) / dop
+
+    keep = dop <= max_dop
+    order = np.argsort(-score[keep], kind="stable")
+    return [(int(i), int(j), int(k)) for i, j, k in triples[keep][order]]
+
+
+def dilution_of_precision(
+    x: FloatArray, y: FloatArray, distances: FloatArray
+) -> FloatArray:
+    """Return the horizontal dilution of precision of hotspot triples.
+
+    The device position is approximated by the centroid of the triple
+    weighted with the inverse predicted distances. Triples whose unit
+    vectors towards that position do not span the plane get ``inf``.
+
+    :param x: easting of the hotspots in meters, shape (triples, 3)
+    :param y: northing of the hotspots in meters, shape (triples, 3)
+    :param distances: predicted distances in meters, shape (triples, 3)
+
+    :return: dilution of precision per triple
+    """
+    weights = 1 / np.maximum(distances, 1.0)
+    x_0 = (x * weights).sum(axis=1, keepdims=True) / weights.sum(axis=1, keepdims=True)
+    y_0 = (y * weights).sum(axis=1, keepdims=True) / weights.sum(axis=1, keepdims=True)
+
+    dx, dy = x - x_0, y - y_0
+    norm = np.hypot(dx, dy)
+    norm[norm == 0] = np.inf
+    ux, uy = dx / norm, dy / norm
+
+    # entries of H^T H for the geometry matrix H = [ux, uy]
+    a, b, c = (ux * ux).sum(axis=1), (ux * uy).sum(axis=1), (uy * uy).sum(axis=1)
+    det = a * c - b * b
+    with np.errstate(divide="ignore", invalid="ignore"):
+        dop = np.sqrt((a + c) / det)
+    return np.where(det > 1e-9, dop, np.inf)
+
+
+def range_residual(
+    position: Sequence[float],
+    latitudes: Sequence[float],
+    longitudes: Sequence[float],
+    distances: Sequence[float],
+) -> float:
+    """Return the median relative range residual of a position estimate.
+
+    The median keeps a single hotspot with a bad distance prediction from
+    dominating the residual.
+
+    :param position: estimated position (lat, lng)
+    :param latitudes: latitudes of the hotspots
+    :param longitudes: longitudes of the hotspots
+    :param distances: predicted distances to the hotspots in meters
+
+    :return: median of ``|range - predicted distance| / predicted distance``
+    """
+    residuals = []
+    for lat, lng, dist in zip(latitudes, longitudes, distances):
+        dist = float(np.asarray(dist).reshape(-1)[0])
+        measured = haversine((position[0], position[1]), (lat, lng), unit=m)
+        residuals.append(abs(measured - dist) / max(dist, 1.0))
+    return float(np.median(residuals))
+
+
+def _local_coordinates(
+    latitudes: Sequence[float], longitudes: Sequence[float]
+) -> Tuple[FloatArray, FloatArray]:
+    """Project hotspot locations into a local plane around their centroid."""
+    lat = np.asarray(latitudes, dtype=np.float64)
+    lng = np.asarray(longitudes, dtype=np.float64)
+    lat_0 = float(lat.mean())
+    x = np.radians(lng - lng.mean()) * earth_radius * cos(radians(lat_0))
+    y = np.radians(lat - lat_0) * earth_radius
+    return x, y
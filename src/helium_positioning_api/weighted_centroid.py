@@ -0,0 +1,91 @@
+"""Weighted centroid prediction for the positioning API."""
+
+import logging
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+import numpy as np
+import numpy.typing as npt
+from helium_api_wrapper.DataObjects import IntegrationHotspot
+
+from helium_positioning_api.auxilary import get_integration_hotspots
+from helium_positioning_api.DataObjects import Prediction
+from helium_positioning_api.witnesses import select_witnesses
+
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+FloatArray = npt.NDArray[np.float64]
+
+WEIGHTINGS = ("power", "offset")
+DBM_OFFSET = 140.0  # dB added to the rssi by the offset weighting
+
+
+def weighted_centroid(
+    uuid: str,
+    hotspots: Optional[List[IntegrationHotspot]] = None,
+    weighting: str = "power",
+    top_k: Optional[int] = None,
+    offset: float = DBM_OFFSET,
+) -> Prediction:
+    """This model predicts the location of a given device.
+
+    It takes the centroid of all witnesses, weighted by the rssi they
+    received. The ``power`` weighting uses the received power in mW, so the
+    strongest witnesses dominate; the ``offset`` weighting uses the rssi
+    plus ``offset`` dB, which spreads the weight over more witnesses.
+
+    :param uuid: Device id
+    :param hotspots: hotspots of the last integration, loaded if not given
+    :param weighting: ``power`` or ``offset``
+    :param top_k: only use the k strongest witnesses, all if None
+    :param offset: dB added to the rssi by the ``offset`` weighting
+
+    :return: coordinates of predicted location
+    """
+    if hotspots is None:
+        hotspots = get_integration_hotspots(uuid)
+    witnesses = select_witnesses(hotspots, top_k)
+    if not len(witnesses):
+        raise ValueError(f"No hotspots with a location found for device {uuid}")
+    lat, lng = centroid(witnesses.lat, witnesses.lng, witnesses.rssi, weighting, offset)
+    return Prediction(uuid=uuid, lat=lat, lng=lng, model="weighted_centroid")
+
+
+def centroid(
+    lat: FloatArray,
+    lng: FloatArray,
+    rssi: FloatArray,
+    weighting: str = "power",
+    offset: float = DBM_OFFSET,
+) -> Tuple[float, float]:
+    """Return the rssi-weighted geographic centroid of positions.
+
+    The positions are averaged as unit vectors, so the centroid is correct
+    across the antimeridian.
+
+    :param lat: latitudes in degrees
+    :param lng: longitudes in degrees
+    :param rssi: rssi in dBm
+    :param weighting: ``power`` or ``offset``
+    :param offset: dB added to the rssi by the ``offset`` weighting
+    :return: (lat, lng) in degrees
+    """
+    if weighting not in WEIGHTINGS:
+        raise ValueError(f"Weighting {weighting} not implemented.")
+    if weighting == "power":
+        # relative to the strongest witness, 10 ** (rssi / 10) mW would underflow
+        weights = 10 ** ((rssi - rssi.max()) / 10)
+    else:
+        weights = np.maximum(rssi + offset, 1e-3)
+
+    phi, lam = np.radians(lat), np.radians(lng)
+    x = np.dot(weights, np.cos(phi) * np.cos(lam))
+    y = np.dot(weights, np.cos(phi) * np.sin(lam))
+    z = np.dot(weights, np.sin(phi))
+    return (
+        float(np.degrees(np.arctan2(z, np.hypot(x, y)))),
+        float(np.degrees(np.arctan2(y, x))),
+    )
@@ -0,0 +1,148 @@
+"""Witnesses module.
+
+.. module:: witnesses
+
+:synopsis: Shared filtering and top-k selection of the witnesses of an uplink.
+
+.. moduleauthor:: DSIA21
+
+Every model predicts from the witnesses selected here. Missing or stale
+locations are completed from the hotspot store if one is configured, and
+the hotspots of an integration are converted to arrays once; witnesses
+without a location are dropped, hotspots reported more than once are only
+kept with their strongest report, and reports with an rssi or snr outside
+of what a LoRa receiver can report are rejected as outliers. The
+``top_k`` strongest witnesses are selected with a partial selection, and
+the witnesses are returned strongest first.
+"""
+
+import logging
+from dataclasses import dataclass
+from typing import Dict
+from typing import List
+from typing import Optional
+
+import numpy as np
+import numpy.typing as npt
+from helium_api_wrapper.DataObjects import IntegrationHotspot
+
+from helium_positioning_api.hotspot_store import fill_locations
+
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+FloatArray = npt.NDArray[np.float64]
+IndexArray = npt.NDArray[np.intp]
+
+# rssi in dBm below the sensitivity and above the saturation of a receiver
+MIN_RSSI = -150.0
+MAX_RSSI = 0.0
+# snr in dB outside of what a LoRa demodulator reports
+MIN_SNR = -30.0
+MAX_SNR = 30.0
+
+
+@dataclass(frozen=True)
+class Witnesses:
+    """Selected witnesses of an uplink, strongest first."""
+
+    hotspots: List[IntegrationHotspot]
+    lat: FloatArray
+    lng: FloatArray
+    rssi: FloatArray
+    snr: FloatArray
+
+    def __len__(self) -> int:
+        """Return the number of witnesses."""
+        return len(self.hotspots)
+
+
+def select_witnesses(
+    hotspots: List[IntegrationHotspot],
+    top_k: Optional[int] = None,
+    located: bool = True,
+    min_rssi: float = MIN_RSSI,
+    max_rssi: float = MAX_RSSI,
+    min_snr: float = MIN_SNR,
+    max_snr: float = MAX_SNR,
+) -> Witnesses:
+    """Return the valid witnesses of an uplink, strongest first.
+
+    Witnesses without an snr are not rejected by the snr bounds. Of equally
+    strong witnesses, the one reported first comes first.
+
+    :param hotspots: hotspots of an integration
+    :param top_k: number of strongest witnesses to keep, all if None
+    :param located: whether to drop witnesses without a location
+    :param min_rssi: lowest plausible rssi in dBm
+    :param max_rssi: highest plausible rssi in dBm
+    :param min_snr: lowest plausible snr in dB
+    :param max_snr: highest plausible snr in dB
+    :return: Witnesses
+    """
+    if top_k is not None and top_k < 1:
+        raise ValueError(f"top_k must be at least 1, not {top_k}.")
+    hotspots = fill_locations(hotspots)
+    lat, lng, rssi, snr = _columns(hotspots)
+
+    valid = (rssi >= min_rssi) & (rssi <= max_rssi)
+    valid &= ~((snr < min_snr) | (snr > max_snr))
+    if located:
+        valid &= ~(np.isnan(lat) | np.isnan(lng))
+    candidates = _deduplicate(hotspots, np.flatnonzero(valid), rssi)
+    if top_k is not None and top_k < len(candidates):
+        candidates = _strongest(candidates, rssi, top_k)
+    # strongest first, the first report of equally strong ones first
+    candidates = candidates[np.argsort(-rssi[candidates], kind="stable")]
+
+    return Witnesses(
+        hotspots=[hotspots[i] for i in candidates],
+        lat=lat[candidates],
+        lng=lng[candidates],
+        rssi=rssi[candidates],
+        snr=snr[candidates],
+    )
+
+
+def _columns(hotspots: List[IntegrationHotspot]) -> FloatArray:
+    """Return lat, lng, rssi and snr of the hotspots, NaN if missing."""
+    rows = [
+        tuple(getattr(hotspot, name, None) for name in ("lat", "lng", "rssi", "snr"))
+        for hotspot in hotspots
+    ]
+    # None is converted to NaN
+    return np.array(rows, dtype=np.float64).reshape(-1, 4).T
+
+
+def _deduplicate(
+    hotspots: List[IntegrationHotspot], candidates: IndexArray, rssi: FloatArray
+) -> IndexArray:
+    """Keep the strongest report of every hotspot, in the reported order."""
+    strongest: Dict[str, int] = {}
+    keep = []
+    for i in candidates.tolist():
+        hotspot = hotspots[i]
+        key = getattr(hotspot, "address", None) or getattr(hotspot, "name", None)
+        if key is None:
+            keep.append(i)
+        elif key not in strongest or rssi[i] > rssi[strongest[key]]:
+            strongest[key] = i
+    if len(keep) + len(strongest) == len(candidates):
+        return candidates
+    return np.sort(np.asarray(keep + list(strongest.values()), dtype=np.int64))
+
+
+def _strongest(candidates: IndexArray, rssi: FloatArray, k: int) -> IndexArray:
+    """Select the k strongest candidates without sorting them.
+
+    Of the witnesses as strong as the k-th strongest, the first reported
+    ones are selected.
+    """
+    values = rssi[candidates]
+    kth = -np.partition(-values, k - 1)[k - 1]
+    stronger = values > kth
+    ties = np.flatnonzero(values == kth)[: k - int(stronger.sum())]
+    stronger[ties] = True
+    selected: IndexArray = candidates[stronger]
+    return selected
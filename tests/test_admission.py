@@ -0,0 +1,86 @@
+"""Test cases for the admission module."""
+import asyncio
+
+import pytest
+
+from helium_positioning_api import admission
+from helium_positioning_api.admission import BATCH_CONCURRENCY
+from helium_positioning_api.admission import AdmissionController
+from helium_positioning_api.admission import Overloaded
+from helium_positioning_api.admission import model_class
+from helium_positioning_api.deadline import MAX_WORKERS
+
+
+LIMITS = {"cheap": (1, 1, 0.05), "expensive": (1, 1, 0.05)}
+
+
+def test_model_class() -> None:
+    """Test that the cheap models are separated from the others."""
+    assert model_class("nearest_neighbor") == "cheap"
+    assert model_class("midpoint") == "cheap"
+    assert model_class("gradient_boosting") == "expensive"
+
+
+def test_limits_fit_the_worker_threads() -> None:
+    """Test that the admitted predictions never exceed the prediction threads."""
+    cheap, expensive, batch = (
+        admission.LIMITS[name][0] for name in ("cheap", "expensive", "batch")
+    )
+
+    assert min(cheap, expensive, batch) >= 1
+    assert cheap + expensive + batch * BATCH_CONCURRENCY <= MAX_WORKERS
+
+
+def test_admission() -> None:
+    """Test queueing, rejection and the reserved capacity of the classes."""
+
+    async def scenario() -> None:
+        controller = AdmissionController(LIMITS)
+        release = asyncio.Event()
+
+        async def hold(name: str) -> None:
+            async with controller.admit(name):
+                await release.wait()
+
+        running = asyncio.ensure_future(hold("expensive"))
+        queued = asyncio.ensure_future(hold("expensive"))
+        await asyncio.sleep(0)
+        assert controller.stats()["expensive"] == {
+            "in_flight": 1,
+            "queued": 1,
+            "rejected": 0,
+        }
+
+        # the queue is full
+        with pytest.raises(Overloaded) as rejected:
+            async with controller.admit("expensive"):
+                pass
+        assert rejected.value.status_code == 429
+        assert rejected.value.retry_after >= 1
+
+        # cheap requests are not held up by the expensive ones
+        async with controller.admit("cheap"):
+            pass
+
+        release.set()
+        await asyncio.gather(running, queued)
+        assert controller.stats()["expensive"]["in_flight"] == 0
+
+        # a request that waits longer than the queue timeout is rejected
+        release.clear()
+        running = asyncio.ensure_future(hold("cheap"))
+        await asyncio.sleep(0)
+        with pytest.raises(Overloaded) as timed_out:
+            async with controller.admit("cheap"):
+                pass
+        assert timed_out.value.status_code == 503
+        assert controller.stats()["cheap"] == {
+            "in_flight": 1,
+            "queued": 0,
+            "rejected": 1,
+        }
+        release.set()
+        await running
+        assert controller.stats()["cheap"]["in_flight"] == 0
+
+    asyncio.run(scenario())
@@ -0,0 +1,178 @@
+"""Test cases for the api module."""
+import threading
+import time
+
+import msgpack
+import pytest
+from fastapi.testclient import TestClient
+from pytest_mock import MockFixture
+
+from helium_positioning_api import api
+from helium_positioning_api.binary_protocol import MEDIA_TYPE
+from helium_positioning_api.binary_protocol import decode_prediction
+from helium_positioning_api.binary_protocol import decode_predictions
+from helium_positioning_api.DataObjects import Prediction
+from helium_positioning_api.deadline import Deadline
+from helium_positioning_api.deadline import DeadlineExceeded
+
+
+UUID = "92f23793-6647-40aa-b255-fa1d4baec75d"
+
+
+@pytest.fixture
+def client(mocker: MockFixture) -> TestClient:
+    """Return a client of the api, predicting without the Console.
+
+    :param mocker: mocker
+    :return: TestClient
+    """
+    mocker.patch.object(api, "cluster", None)
+    mocker.patch.object(api, "prediction_cache", api.PredictionCache())
+    predict = mocker.patch.object(api, "predict_within")
+    predict.side_effect = lambda uuid, model, deadline: Prediction(
+        uuid=uuid, lat=47.4777, lng=12.0531, model=model
+    )
+    return TestClient(api.app)
+
+
+def test_json_request(client: TestClient) -> None:
+    """Test that JSON requests are answered with JSON.
+
+    :param client: client of the api
+    """
+    response = client.post("/predict_mp/", json={"uuid": UUID})
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/json"
+    assert response.json()["lat"] == 47.4777
+    assert response.json()["model"] == "midpoint"
+
+
+def test_msgpack_request_and_response(client: TestClient) -> None:
+    """Test that a MessagePack body is read and the Accept header is honoured.
+
+    :param client: client of the api
+    """
+    response = client.post(
+        "/predict_mp/",
+        content=msgpack.packb({"uuid": UUID, "deadline_ms": 500}),
+        headers={"content-type": MEDIA_TYPE, "accept": MEDIA_TYPE},
+    )
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == MEDIA_TYPE
+    assert response.headers["x-model"] == "midpoint"
+    prediction = decode_prediction(response.content)
+    assert prediction.uuid == UUID
+    assert prediction.lat == pytest.approx(47.4777)
+    assert prediction.model == "midpoint"
+
+
+def test_rejected_bodies(client: TestClient) -> None:
+    """Test that unsupported media types and invalid bodies are rejected.
+
+    :param client: client of the api
+    """
+    text = client.post(
+        "/predict_mp/", content=UUID, headers={"content-type": "text/plain"}
+    )
+    number = client.post(
+        "/predict_mp/",
+        content=msgpack.packb({"uuid": 1}),
+        headers={"content-type": MEDIA_TYPE},
+    )
+    broken = client.post(
+        "/predict_mp/", content=b"\xc1", headers={"content-type": MEDIA_TYPE}
+    )
+
+    assert text.status_code == 415
+    assert number.status_code == 422
+    assert broken.status_code == 400
+    assert client.post("/predict_mp/", json={"id": UUID}).status_code == 422
+
+
+def test_batch_keeps_order(client: TestClient, mocker: MockFixture) -> None:
+    """Test that a batch is predicted concurrently and answered in order.
+
+    :param client: client of the api
+    :param mocker: mocker
+    """
+    mocker.patch.object(api, "BATCH_CONCURRENCY", 2)
+    uuids = [f"{i:08x}-0000-4000-8000-000000000000" for i in range(5)]
+    lock = threading.Lock()
+    running = [0, 0]  # (now, at most)
+
+    def predict(uuid: str, model: str, deadline: Deadline) -> Prediction:
+        with lock:
+            running[0] += 1
+            running[1] = max(running)
+        time.sleep(0.05)
+        with lock:
+            running[0] -= 1
+        if uuid == uuids[2]:
+            raise ValueError("No hotspots found")
+        return Prediction(uuid=uuid, lat=float(uuids.index(uuid)), lng=1.0)
+
+    api.predict_within.side_effect = predict  # type: ignore[attr-defined]
+    response = client.post(
+        "/predict_batch/",
+        content=msgpack.packb({"uuids": uuids, "model": "midpoint"}),
+        headers={"content-type": MEDIA_TYPE, "accept": MEDIA_TYPE},
+    )
+
+    assert response.status_code == 200
+    predictions = decode_predictions(response.content)
+    assert [prediction.uuid for prediction in predictions] == uuids
+    assert [prediction.lat for prediction in predictions] == [0.0, 1.0, None, 3.0, 4.0]
+    assert running[1] == 2
+    unknown = client.post("/predict_batch/", json={"uuids": uuids, "model": "x"})
+    assert unknown.status_code == 404
+
+
+def test_nearest_devices_need_k(client: TestClient) -> None:
+    """Test that the number of nearest devices is validated.
+
+    :param client: client of the api
+    """
+    assert client.get("/devices/nearest?lat=47&lng=12&k=0").status_code == 422
+    assert client.get("/devices/nearest?lat=47&lng=12&k=1").status_code == 200
+
+
+def test_fingerprinting_needs_an_index(client: TestClient, mocker: MockFixture) -> None:
+    """Test that fingerprinting without an index fails with 503, not 500.
+
+    :param client: client of the api
+    :param mocker: mocker
+    """
+    mocker.patch.dict("os.environ", {"FINGERPRINT_PATH": ""})
+
+    response = client.post("/predict_fp/", json={"uuid": UUID})
+
+    assert response.status_code == 503
+    assert "FINGERPRINT_PATH" in response.json()["detail"]
+    api.predict_within.assert_not_called()  # type: ignore[attr-defined]
+
+
+def test_observation_errors(client: TestClient) -> None:
+    """Test that timeouts and unusable observations are not server errors.
+
+    :param client: client of the api
+    """
+    observation = {
+        "lat": 47.0,
+        "lng": 12.0,
+        "rssi": -100.0,
+        "snr": 5.0,
+        "datarate": "SF9BW125",
+        "frequency": 868.1,
+    }
+    body = {"model": "midpoint", "observations": [observation], "deadline_ms": 1}
+
+    api.predict_within.side_effect = DeadlineExceeded("Deadline of 1 ms exceeded.")
+    timeout = client.post("/predict_observations/", json=body)
+    api.predict_within.side_effect = ValueError("No hotspots found")
+    invalid = client.post("/predict_observations/", json=body)
+
+    assert timeout.status_code == 504
+    assert invalid.status_code == 422
+    assert invalid.json()["detail"] == "No hotspots found"
@@ -0,0 +1,60 @@
+"""Test cases for the batch trilateration module."""
+import numpy as np
+import pytest
+from haversine import Unit
+from haversine import haversine
+
+from helium_positioning_api.batch_trilateration import batch_trilateration
+from helium_positioning_api.trilateration import classify_intersects
+from helium_positioning_api.trilateration import do_intersrect
+from helium_positioning_api.trilateration import estimate_trilateration
+
+
+def scalar_trilateration(latitude: list, longitude: list, distance: list) -> tuple:
+    """Run the scalar trilateration pipeline on a single device.
+
+    :param latitude: latitudes of three hotspots
+    :param longitude: longitudes of three hotspots
+    :param distance: distances to three hotspots
+
+    :return: estimated position
+    """
+    centres, intersects = do_intersrect(latitude, longitude, distance)
+    empty_intersects, two_intersection_points, singular_points = classify_intersects(
+        intersects
+    )
+    return estimate_trilateration(
+        empty_intersects, two_intersection_points, singular_points, centres, "uuid"
+    )
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_batch_trilateration_matches_scalar_path(seed: int) -> None:
+    """Test that the batch engine returns the scalar estimates on random inputs.
+
+    :param seed: random seed
+    """
+    rng = np.random.default_rng(seed)
+    devices = 200
+    latitudes = 47.47 + rng.uniform(-0.05, 0.05, size=(devices, 3))
+    longitudes = 12.05 + rng.uniform(-0.05, 0.05, size=(devices, 3))
+    distances = rng.uniform(100, 6000, size=(devices, 3))
+
+    estimated = batch_trilateration(latitudes, longitudes, distances)
+
+    assert estimated.shape == (devices, 2)
+    for row in range(devices):
+        try:
+            expected = scalar_trilateration(
+                list(latitudes[row]), list(longitudes[row]), list(distances[row])
+            )
+        except (ValueError, NameError):
+            assert np.isnan(estimated[row]).all()
+            continue
+        assert haversine(tuple(estimated[row]), tuple(expected), Unit.METERS) < 1e-3
+
+
+def test_batch_trilateration_rejects_wrong_shape() -> None:
+    """Test that inputs must be stacked as (devices, 3)."""
+    with pytest.raises(ValueError):
+        batch_trilateration([[47.0, 47.1]], [[12.0, 12.1]], [[100.0, 200.0]])
@@ -0,0 +1,67 @@
+"""Test cases for the batching module."""
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from helium_positioning_api import metrics
+from helium_positioning_api.batching import DistanceBatcher
+
+
+def features(rssi: List[float]) -> dict:
+    """Return distance features with the given rssi values.
+
+    :param rssi: rssi of the rows
+    :return: feature columns
+    """
+    n = len(rssi)
+    return {
+        "snr": [0.0] * n,
+        "rssi": rssi,
+        "datarate": ["SF9BW125"] * n,
+        "frequency": [868.1] * n,
+    }
+
+
+def test_concurrent_jobs_are_batched() -> None:
+    """Test that concurrent jobs share batches and get their own rows back."""
+    batches = []
+
+    def predict(model: str, data: pd.DataFrame) -> np.ndarray:
+        batches.append((model, len(data)))
+        return -data["rssi"].to_numpy() * (2 if model == "b" else 1)
+
+    batcher = DistanceBatcher(predict, window=0.05, max_rows=64)
+    jobs = [("a" if i % 2 else "b", [-float(i), -float(i) - 0.5]) for i in range(40)]
+    with ThreadPoolExecutor(40) as executor:
+        results = list(
+            executor.map(lambda job: batcher.submit(job[0], features(job[1])), jobs)
+        )
+    batcher.close()
+
+    for (model, rssi), distances in zip(jobs, results):
+        factor = 2 if model == "b" else 1
+        np.testing.assert_array_equal(distances, -np.array(rssi) * factor)
+    assert len(batches) < len(jobs)
+    assert all(rows <= 64 for _, rows in batches)
+    assert sum(rows for _, rows in batches) == 80
+
+    text = metrics.render()
+    assert 'distance_batch_rows_count{model="a"}' in text
+    assert "distance_batch_window_seconds 0.05" in text
+
+
+def test_failed_batch_raises_in_every_job() -> None:
+    """Test that an exception of the model is raised in the waiting requests."""
+
+    def predict(model: str, data: pd.DataFrame) -> np.ndarray:
+        raise ValueError("unknown datarate")
+
+    batcher = DistanceBatcher(predict, window=0.001)
+    with pytest.raises(ValueError):
+        batcher.submit("a", features([-100.0]))
+    batcher.close()
+    with pytest.raises(RuntimeError):
+        batcher.submit("a", features([-100.0]))
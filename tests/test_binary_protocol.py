@@ -0,0 +1,41 @@
+"""Test cases for the binary protocol module."""
+import msgpack
+
+from helium_positioning_api.binary_protocol import decode_prediction
+from helium_positioning_api.binary_protocol import decode_predictions
+from helium_positioning_api.binary_protocol import encode_prediction
+from helium_positioning_api.binary_protocol import encode_predictions
+from helium_positioning_api.binary_protocol import is_msgpack
+from helium_positioning_api.DataObjects import Prediction
+
+
+def test_prediction_round_trip() -> None:
+    """Test that a prediction is encoded with a fixed 24 byte position."""
+    prediction = Prediction(
+        uuid="uuid", lat=47.4777, lng=12.0531, conf=0.5, model="midpoint"
+    )
+
+    message = encode_prediction(prediction)
+
+    assert len(msgpack.unpackb(message)[1]) == 24
+    assert msgpack.unpackb(message)[2] == "midpoint"
+    assert decode_prediction(message) == prediction
+
+
+def test_batch_round_trip_keeps_missing_coordinates() -> None:
+    """Test that a batch keeps order, models and unsuccessful predictions."""
+    predictions = [
+        Prediction(uuid="a", lat=1.0, lng=2.0, model="trilateration"),
+        Prediction(uuid="b"),
+        Prediction(uuid="c", lat=-3.5, lng=4.25, conf=1.0, model="midpoint"),
+    ]
+
+    assert decode_predictions(encode_predictions(predictions)) == predictions
+
+
+def test_content_negotiation() -> None:
+    """Test that MessagePack is detected in Accept and Content-Type headers."""
+    assert is_msgpack("application/msgpack")
+    assert is_msgpack("text/html, application/x-msgpack;q=0.9")
+    assert not is_msgpack("application/json")
+    assert not is_msgpack(None)
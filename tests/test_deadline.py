@@ -0,0 +1,77 @@
+"""Test cases for the deadline module."""
+import time
+from typing import Any
+
+from pytest_mock import MockFixture
+
+from helium_positioning_api import deadline
+from helium_positioning_api.DataObjects import Prediction
+from helium_positioning_api.deadline import Deadline
+from helium_positioning_api.deadline import fallback_chain
+from helium_positioning_api.deadline import predict_within
+
+
+def fake_predict(
+    uuid: str, model: str, hotspots: Any = None, record: bool = True
+) -> Prediction:
+    """Slow trilateration and fast fallback models.
+
+    :param uuid: Device id
+    :param model: name of the model
+    :param hotspots: ignored
+    :param record: ignored
+    :return: Prediction naming the model
+    """
+    if model == "gradient_boosting":
+        time.sleep(0.5)
+    return Prediction(uuid=uuid, lat=47.0, lng=12.0, model=model)
+
+
+def test_fallback_chain() -> None:
+    """Test that models fall back to midpoint and nearest neighbor."""
+    assert fallback_chain("gradient_boosting") == [
+        "gradient_boosting",
+        "midpoint",
+        "nearest_neighbor",
+    ]
+    assert fallback_chain("midpoint") == ["midpoint", "nearest_neighbor"]
+    assert fallback_chain("nearest_neighbor") == ["nearest_neighbor"]
+
+
+def test_predict_within_falls_back_on_overrun(mocker: MockFixture) -> None:
+    """Test that an overrunning model is replaced by the nearest neighbor model.
+
+    Only the returned prediction is passed on to the listeners, not the one
+    of the abandoned model.
+
+    :param mocker: Mocker
+    """
+    predict = mocker.patch.object(deadline, "predict", side_effect=fake_predict)
+    notify = mocker.patch.object(deadline, "notify")
+
+    start = time.monotonic()
+    prediction = predict_within("uuid", "gradient_boosting", Deadline(100), [])
+
+    assert time.monotonic() - start < 0.3
+    assert prediction.model == "nearest_neighbor"
+    assert [call.args[1:] for call in predict.call_args_list] == [
+        ("gradient_boosting", [], False),
+        ("nearest_neighbor", [], True),
+    ]
+    assert predict_within("uuid", "midpoint", Deadline(100), []).model == "midpoint"
+    notify.assert_called_once()
+    assert notify.call_args.args[1] == "midpoint"
+
+
+def test_predict_within_skips_expensive_model(mocker: MockFixture) -> None:
+    """Test that a model expected to overrun the budget is not started.
+
+    :param mocker: Mocker
+    """
+    predict = mocker.patch.object(deadline, "predict", side_effect=fake_predict)
+    mocker.patch.dict(deadline._costs, {"gradient_boosting": 1.0})
+
+    prediction = predict_within("uuid", "gradient_boosting", Deadline(100), [])
+
+    assert prediction.model == "midpoint"
+    assert [call.args[1] for call in predict.call_args_list] == ["midpoint"]
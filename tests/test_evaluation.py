@@ -0,0 +1,134 @@
+"""Test cases for the evaluation module."""
+import json
+from itertools import count
+from pathlib import Path
+from typing import Any
+from typing import List
+
+import numpy as np
+import pytest
+from pytest_mock import MockFixture
+
+from helium_positioning_api.DataObjects import Prediction
+from helium_positioning_api.evaluation import evaluate
+from helium_positioning_api.models import MODELS
+from helium_positioning_api.synthetic import SyntheticNetwork
+from helium_positioning_api.synthetic import generate_uplinks
+from helium_positioning_api.synthetic import write_events
+
+
+region = (47.0, 12.0, 47.1, 12.1)
+
+
+@pytest.fixture
+def events(tmp_path: Path) -> str:
+    """Write labelled integration events of a synthetic network.
+
+    :param tmp_path: temporary directory
+    :return: path of the events
+    """
+    rng = np.random.default_rng(0)
+    network = SyntheticNetwork.generate(30, region, rng)
+    path = str(tmp_path / "events.jsonl")
+    write_events(path, generate_uplinks(network, 60, region, rng))
+    return path
+
+
+def test_evaluate_reports_errors_and_costs(events: str, tmp_path: Path) -> None:
+    """Test that every model gets error, CPU and memory statistics.
+
+    :param events: path of labelled events
+    :param tmp_path: temporary directory
+    """
+    models = ["nearest_neighbor", "weighted_centroid"]
+    report = evaluate([events], str(tmp_path / "report"), models, chunk_size=25)
+
+    assert 0 < report["events"] <= 60
+    assert list(report["models"]) == models
+    for summary in report["models"].values():
+        assert summary["fallbacks"] == 0
+        assert summary["predictions"] + summary["failures"] == report["events"]
+        assert summary["error_m"]["median"] <= summary["error_m"]["p90"]
+        assert summary["cpu_ms"]["mean"] >= 0
+        assert summary["memory"]["peak_kib"] > 0
+    assert any(summary["pareto"] for summary in report["models"].values())
+    written = json.loads((tmp_path / "report" / "evaluation.json").read_text())
+    assert written["models"].keys() == report["models"].keys()
+    markdown = (tmp_path / "report" / "evaluation.md").read_text()
+    assert "| weighted_centroid |" in markdown
+
+
+def test_evaluate_in_worker_processes(events: str) -> None:
+    """Test that workers give the errors of the in-process evaluation.
+
+    :param events: path of labelled events
+    """
+    models = ["midpoint"]
+    single = evaluate([events], models=models, chunk_size=20, limit=50)
+    parallel = evaluate([events], models=models, chunk_size=20, n_jobs=2, limit=50)
+
+    assert single["events"] == parallel["events"] == 50
+    assert single["models"]["midpoint"]["error_m"] == pytest.approx(
+        parallel["models"]["midpoint"]["error_m"]
+    )
+
+
+def test_unconfigured_model_is_unavailable(events: str) -> None:
+    """Test that a model failing on every event is reported as unavailable.
+
+    :param events: path of labelled events
+    """
+    report = evaluate([events], models=["fingerprinting"], limit=10)
+
+    assert "FINGERPRINT_PATH" in report["models"]["fingerprinting"]["unavailable"]
+    assert not report["models"]["fingerprinting"]["pareto"]
+
+
+def test_fallbacks_are_reported_apart(events: str, mocker: MockFixture) -> None:
+    """Test that predictions of a fallback model are not scored as the model.
+
+    :param events: path of labelled events
+    :param mocker: mocker
+    """
+    calls = count()
+
+    def picky(uuid: str, hotspots: List[Any]) -> Prediction:
+        if next(calls) % 5 == 4:
+            raise FileNotFoundError("artifacts missing")
+        model = "picky" if len(hotspots) >= 4 else "nearest_neighbor"
+        return Prediction(uuid=uuid, lat=47.05, lng=12.05, model=model)
+
+    mocker.patch.dict(MODELS, {"picky": picky})
+    report = evaluate([events], models=["picky"], chunk_size=1000)
+    summary = report["models"]["picky"]
+
+    assert summary["fallbacks"] > 0
+    assert summary["failures"] > 0
+    assert summary["predictions"] + summary["fallbacks"] + summary["failures"] == (
+        report["events"]
+    )
+    assert summary["fallback_error_m"]["median"] is not None
+
+
+def test_unavailable_after_the_first_event(events: str, mocker: MockFixture) -> None:
+    """Test that missing artifacts are detected on any event, not only the first.
+
+    :param events: path of labelled events
+    :param mocker: mocker
+    """
+    calls = count()
+
+    def lazy(uuid: str, hotspots: List[Any]) -> Prediction:
+        call = next(calls)
+        if call == 1:
+            raise ValueError("No hotspots found")
+        if call > 1:
+            raise FileNotFoundError("artifacts missing")
+        return Prediction(uuid=uuid, lat=47.05, lng=12.05, model="lazy")
+
+    mocker.patch.dict(MODELS, {"lazy": lazy})
+    report = evaluate([events], models=["lazy"], limit=10)
+
+    assert report["models"]["lazy"]["unavailable"] == (
+        "FileNotFoundError: artifacts missing"
+    )
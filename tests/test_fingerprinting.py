@@ -0,0 +1,48 @@
+"""Test cases for the fingerprinting module."""
+from pathlib import Path
+
+import numpy as np
+
+from helium_positioning_api.fingerprinting import FingerprintIndex
+
+
+def synthetic_fingerprints(n: int) -> list:
+    """Return labelled uplinks on a line between two hotspots.
+
+    :param n: number of uplinks
+    :return: fingerprints
+    """
+    fingerprints = []
+    for lat in np.linspace(47.0, 47.1, n):
+        position = (lat - 47.0) / 0.1
+        witnesses = {"a": -60 - 60 * position, "b": -120 + 60 * position}
+        if position > 0.5:
+            witnesses["c"] = -110.0
+        fingerprints.append((float(lat), 12.0, witnesses))
+    return fingerprints
+
+
+def test_fingerprint_neighbors_and_round_trip(tmp_path: Path) -> None:
+    """Test that the nearest fingerprints are found after save and load.
+
+    :param tmp_path: temporary directory
+    """
+    index = FingerprintIndex.build(synthetic_fingerprints(101))
+    index.save(str(tmp_path / "fingerprints.npz"))
+    index = FingerprintIndex.load(str(tmp_path / "fingerprints.npz"))
+
+    ids, distances = index.neighbors({"a": -78.0, "b": -102.0, "x": -80.0}, k=3)
+
+    assert ids[0] == 30
+    assert distances[0] < 1e-3
+    assert sorted(ids[1:]) == [29, 31]
+    lat, lng = index.locate({"a": -78.0, "b": -102.0})
+    assert abs(lat - 47.03) < 1e-3
+    assert lng == 12.0
+
+
+def test_fingerprint_without_shared_witness() -> None:
+    """Test that an uplink without a known witness cannot be located."""
+    index = FingerprintIndex.build(synthetic_fingerprints(11))
+
+    assert index.locate({"x": -80.0}) is None
@@ -0,0 +1,87 @@
+"""Test cases for the geofence module."""
+import random
+
+import pytest
+
+from helium_positioning_api.DataObjects import Prediction
+from helium_positioning_api.geofence import Geofence
+from helium_positioning_api.geofence import GeofenceEngine
+
+
+SQUARE = [(47.0, 12.0), (47.0, 12.1), (47.1, 12.1), (47.1, 12.0)]
+# concave polygon around the square
+U_SHAPE = [
+    (46.9, 11.9),
+    (46.9, 12.2),
+    (47.2, 12.2),
+    (47.2, 12.15),
+    (46.95, 12.15),
+    (46.95, 11.95),
+    (47.2, 11.95),
+    (47.2, 11.9),
+]
+
+
+def test_contains_matches_brute_force() -> None:
+    """Test the prepared polygon against a scalar ray casting."""
+    fence = Geofence("u", U_SHAPE)
+    rng = random.Random(0)
+    for _ in range(1000):
+        lat, lng = rng.uniform(46.85, 47.25), rng.uniform(11.85, 12.25)
+        inside = False
+        for (lat0, lng0), (lat1, lng1) in zip(U_SHAPE, U_SHAPE[1:] + U_SHAPE[:1]):
+            if (lat0 > lat) != (lat1 > lat):
+                if lng < lng0 + (lat - lat0) * (lng1 - lng0) / (lat1 - lat0):
+                    inside = not inside
+        assert fence.contains(lat, lng) == inside
+
+
+def test_enter_and_exit_events() -> None:
+    """Test that only changes of the containing fences are emitted."""
+    engine = GeofenceEngine(cell_size=0.05)
+    engine.add("square", SQUARE)
+    engine.add("u", U_SHAPE)
+    received = []
+    engine.add_callback(received.append)
+
+    def kinds(lat: float, lng: float) -> list:
+        return [(e.fence, e.event) for e in engine.evaluate("d", lat, lng, 0)]
+
+    assert kinds(47.05, 12.05) == [("square", "enter")]
+    assert kinds(47.06, 12.06) == []
+    assert kinds(46.92, 12.05) == [("square", "exit"), ("u", "enter")]
+    assert kinds(47.5, 12.5) == [("u", "exit")]
+    assert engine.inside("d") == set()
+    assert [e.sequence for e in engine.events(since=2)] == [3, 4]
+    assert len(received) == 4
+
+    engine.update_prediction(Prediction(uuid="d", lat=47.05, lng=12.05), "midpoint")
+    assert engine.inside("d") == {"square"}
+    # unsuccessful predictions keep the last state
+    engine.update_prediction(Prediction(uuid="d"), "midpoint")
+    assert engine.inside("d") == {"square"}
+
+
+def test_candidates_are_local() -> None:
+    """Test that only fences around a position are evaluated."""
+    engine = GeofenceEngine(cell_size=0.05)
+    for i in range(100):
+        for j in range(100):
+            lat, lng = 40 + i * 0.1, 10 + j * 0.1
+            square = [(lat, lng), (lat, lng + 0.01), (lat + 0.01, lng + 0.01)]
+            engine.add(f"{i}-{j}", square + [(lat + 0.01, lng)])
+    assert len(engine) == 10000
+    assert engine.candidates(45.005, 15.005) == {"50-50"}
+    assert [e.fence for e in engine.evaluate("d", 45.005, 15.005)] == ["50-50"]
+
+    engine.remove("50-50")
+    assert engine.candidates(45.005, 15.005) == set()
+    assert engine.inside("d") == set()
+    with pytest.raises(KeyError):
+        engine.remove("50-50")
+
+
+def test_invalid_polygon() -> None:
+    """Test that polygons need three distinct vertices."""
+    with pytest.raises(ValueError):
+        Geofence("line", [(47.0, 12.0), (47.1, 12.1), (47.0, 12.0)])
@@ -0,0 +1,71 @@
+"""Test cases for the position history module."""
+from pathlib import Path
+
+from pytest_mock import MockFixture
+
+from helium_positioning_api.history import PositionHistory
+
+
+def test_track_reads_segments_and_buffer(tmp_path: Path) -> None:
+    """Test that a time range query combines sealed and buffered positions.
+
+    :param tmp_path: temporary directory
+    """
+    history = PositionHistory(str(tmp_path), segment_size=3)
+    history.append("a", 1000, 47.0, 12.0, None, "midpoint")
+    history.append("b", 1500, 48.0, 13.0, 0.5, "nearest_neighbor")
+    history.append("a", 2000, 47.1, 12.1, None, "midpoint")  # seals the segment
+    history.append("a", 3000, 47.2, 12.2, 0.9, "gradient_boosting")
+
+    track = history.track("a", start=1500, end=4000)
+
+    assert list(track["timestamp"]) == [2000, 3000]
+    assert list(track["lat"]) == [47.1, 47.2]
+    assert list(track["model"]) == ["midpoint", "gradient_boosting"]
+    assert len(history.track("c")["timestamp"]) == 0
+
+
+def test_compact_merges_segments(tmp_path: Path) -> None:
+    """Test that compaction keeps all positions in a single segment.
+
+    :param tmp_path: temporary directory
+    """
+    history = PositionHistory(str(tmp_path), segment_size=2)
+    for i in range(6):
+        history.append(f"device-{i % 2}", 1000 * i, 47.0 + i, 12.0, None, "midpoint")
+
+    assert history.compact() == 3
+    assert len([p for p in tmp_path.iterdir() if not p.name.startswith(".")]) == 1
+    assert list(PositionHistory(str(tmp_path)).track("device-1")["timestamp"]) == [
+        1000,
+        3000,
+        5000,
+    ]
+
+
+def test_compact_hides_merged_segments_first(
+    tmp_path: Path, mocker: MockFixture
+) -> None:
+    """Test that a track read during compaction never returns a row twice.
+
+    :param tmp_path: temporary directory
+    :param mocker: mocker
+    """
+    history = PositionHistory(str(tmp_path), segment_size=2)
+    for i in range(4):
+        history.append("a", 1000 * i, 47.0 + i, 12.0, None, "midpoint")
+    reader = PositionHistory(str(tmp_path))
+    assert len(reader.track("a")["timestamp"]) == 4
+    seen = []
+    publish = history._publish
+
+    def read_and_publish(tmp_path: str) -> None:
+        seen.append(list(reader.track("a")["timestamp"]))
+        publish(tmp_path)
+        seen.append(list(reader.track("a")["timestamp"]))
+
+    mocker.patch.object(history, "_publish", side_effect=read_and_publish)
+
+    assert history.compact() == 2
+    assert seen == [[], [0, 1000, 2000, 3000]]
+    assert history.compact() == 0
@@ -0,0 +1,71 @@
+"""Test cases for the hotspot store module."""
+import json
+from pathlib import Path
+
+from helium_api_wrapper.DataObjects import IntegrationHotspot
+from pytest_mock import MockFixture
+
+from helium_positioning_api import hotspot_store
+from helium_positioning_api.hotspot_store import HotspotStore
+from helium_positioning_api.nearest_neighbor import nearest_neighbor
+
+
+def test_import_and_lookup(tmp_path: Path) -> None:
+    """Test that dumps are imported, newer assertions win and persist.
+
+    :param tmp_path: temporary directory
+    """
+    dump = tmp_path / "hotspots.jsonl"
+    records = [
+        {"address": "a", "lat": 47.0, "lng": 12.0, "gain": 12, "block": 100},
+        {"address": "b", "lat": 48.0, "lng": 11.0, "elevation": 5},
+        {"address": "a", "lat": 47.5, "lng": 12.5, "block": 200},
+        {"address": "a", "lat": 46.0, "lng": 13.0, "block": 150},
+        {"name": "no address"},
+    ]
+    dump.write_text("\n".join(json.dumps(record) for record in records))
+    (tmp_path / "hotspots.csv").write_text("address,lat,lng,block\nc,45.0,10.0,\n")
+    store = HotspotStore(str(tmp_path / "store.db"))
+
+    assert store.import_file(str(dump)) == 4
+    assert store.import_file(str(tmp_path / "hotspots.csv")) == 1
+    store.import_file(str(dump))
+    store.close()
+
+    store = HotspotStore(str(tmp_path / "store.db"))
+    assert len(store) == 3
+    a = store.get("a")
+    assert a is not None
+    assert (a.lat, a.lng, a.block) == (47.5, 12.5, 200)
+    assert a.zone_number == 33 and a.northing > 5e6
+    assert [change.block for change in store.history("a")] == [100, 150, 200]
+    assert store.get("c").lat == 45.0  # type: ignore[union-attr]
+    assert store.get("unknown") is None
+    assert set(store.get_many(["a", "b", "unknown"])) == {"a", "b"}
+
+
+def test_fill_missing_and_stale_locations(mocker: MockFixture) -> None:
+    """Test that predictions use the stored locations of witnesses.
+
+    :param mocker: mocker
+    """
+    store = HotspotStore(":memory:")
+    store.upsert(
+        [
+            {"address": "missing", "lat": 47.0, "lng": 12.0, "block": 10},
+            {"address": "stale", "lat": 48.0, "lng": 11.0, "block": 20},
+        ]
+    )
+    mocker.patch.object(hotspot_store, "_store", store)
+    mocker.patch.object(hotspot_store, "_resolved", True)
+
+    def hotspot(address: str, **fields: object) -> IntegrationHotspot:
+        return IntegrationHotspot.construct(
+            **{"address": address, "lat": None, "lng": None, "rssi": -90, **fields}
+        )
+
+    current = hotspot("stale", lat=40.0, lng=10.0, block=20)
+    filled = store.fill([hotspot("missing"), hotspot("stale", lat=40.0, block=5)])
+    assert [(h.lat, h.lng) for h in filled] == [(47.0, 12.0), (48.0, 11.0)]
+    assert store.fill([current])[0] is current
+    assert nearest_neighbor("uuid", [hotspot("missing")]).lat == 47.0
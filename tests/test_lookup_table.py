@@ -0,0 +1,60 @@
+"""Test cases for the lookup table module."""
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from helium_positioning_api.lookup_table import DistanceLookupTable
+
+
+def path_loss(features: pd.DataFrame) -> np.ndarray:
+    """Log-distance path loss model, shifted by snr, datarate and frequency.
+
+    Distances span from meters to more than 20 km over the rssi grid.
+
+    :param features: feature data frame
+    :return: distances
+    """
+    offset = features["datarate"].map({"SF7BW125": 0.0, "SF12BW125": 3.0})
+    loss = -40 - features["rssi"] - features["snr"] / 2 + offset
+    return (10 ** (loss / 30) * 10 * features["frequency"] / 868).to_numpy()
+
+
+def test_lookup_table_error_and_round_trip(tmp_path: Path) -> None:
+    """Test that the table stays close to the model and survives save/load.
+
+    :param tmp_path: temporary directory
+    """
+    table = DistanceLookupTable.build(
+        path_loss,
+        source_model="path_loss",
+        datarates=["SF7BW125", "SF12BW125"],
+        frequencies=[868.1, 868.3],
+        n_samples=2000,
+    )
+    rng = np.random.default_rng(1)
+    samples = pd.DataFrame(
+        {
+            "snr": rng.uniform(-25, 15, 2000),
+            "rssi": rng.uniform(-140, -30, 2000),
+            "datarate": rng.choice(["SF7BW125", "SF12BW125"], 2000),
+            "frequency": rng.choice([868.1, 868.3], 2000),
+        }
+    )
+    expected = path_loss(samples)
+    predicted = table.predict(samples.to_dict(orient="list"))
+    assert expected.max() > 20000
+    assert np.max(np.abs(predicted - expected) / expected) < 0.001
+
+    table.save(str(tmp_path / "path_loss_lut.npz"))
+    loaded = DistanceLookupTable.load(str(tmp_path / "path_loss_lut.npz"))
+    features = {
+        "snr": [3.25],
+        "rssi": [-100.5],
+        "datarate": ["SF12BW125"],
+        "frequency": [868.1],
+    }
+    assert np.allclose(
+        loaded.predict(features), path_loss(pd.DataFrame(features)), rtol=0.001
+    )
+    assert loaded.max_error == table.max_error
@@ -0,0 +1,62 @@
+"""Test cases for predictions from hotspot observations."""
+import pytest
+from pytest_mock import MockFixture
+
+from helium_positioning_api import midpoint
+from helium_positioning_api import nearest_neighbor
+from helium_positioning_api import weighted_centroid
+from helium_positioning_api.DataObjects import Observation
+from helium_positioning_api.listeners import add_listener
+from helium_positioning_api.listeners import remove_listener
+from helium_positioning_api.models import predict_observations
+
+
+observations = [
+    Observation(
+        lat=47.47, lng=12.04, rssi=-110, snr=-5, datarate="SF9BW125", frequency=868.1
+    ),
+    Observation(
+        lat=47.49, lng=12.06, rssi=-120, snr=-8, datarate="SF9BW125", frequency=868.1
+    ),
+]
+
+
+def test_predict_observations_without_console(mocker: MockFixture) -> None:
+    """Test that models run on observations and are not recorded without uuid.
+
+    :param mocker: mocker
+    """
+    console = [
+        mocker.patch.object(module, "get_integration_hotspots")
+        for module in (nearest_neighbor, midpoint, weighted_centroid)
+    ]
+    recorded = []
+
+    def listener(prediction: object, model: str) -> None:
+        recorded.append(model)
+
+    add_listener(listener)
+    try:
+        nearest = predict_observations(observations, "nearest_neighbor")
+        middle = predict_observations(observations, "midpoint", uuid="device")
+        centroid = predict_observations(observations, "weighted_centroid")
+    finally:
+        remove_listener(listener)
+
+    assert nearest.model == "nearest_neighbor"
+    assert (nearest.lat, nearest.lng) == (47.47, 12.04)
+    assert middle.uuid == "device"
+    assert middle.lat == pytest.approx(47.48, abs=1e-3)
+    assert middle.lng == pytest.approx(12.05, abs=1e-3)
+    # the power weighting gives the stronger witness ten times the weight
+    assert centroid.lat == pytest.approx((10 * 47.47 + 47.49) / 11, abs=1e-4)
+    assert centroid.lng == pytest.approx((10 * 12.04 + 12.06) / 11, abs=1e-4)
+    assert recorded == ["midpoint"]
+    for get_integration_hotspots in console:
+        get_integration_hotspots.assert_not_called()
+
+
+def test_predict_observations_requires_observations() -> None:
+    """Test that an empty observation list is rejected."""
+    with pytest.raises(ValueError):
+        predict_observations([], "nearest_neighbor")
@@ -0,0 +1,136 @@
+"""Test cases for the prefetch module."""
+from typing import List
+
+from helium_api_wrapper.DataObjects import IntegrationHotspot
+from pytest_mock import MockFixture
+
+from helium_positioning_api import prefetch
+from helium_positioning_api.DataObjects import Prediction
+from helium_positioning_api.prefetch import PredictionCache
+from helium_positioning_api.prefetch import Prefetcher
+
+
+def test_cache_serves_until_expiry(mocker: MockFixture) -> None:
+    """Test that cached predictions expire and keep their access counts.
+
+    :param mocker: mocker
+    """
+    clock = mocker.patch.object(prefetch, "time")
+    clock.monotonic.return_value = 100.0
+    cache = PredictionCache(ttl=10.0, max_entries=2)
+    prediction = Prediction(uuid="a", lat=47.0, lng=12.0, model="midpoint")
+
+    assert cache.get("a", "midpoint") is None
+    cache.put("a", "midpoint", prediction)
+    cache.put("b", "midpoint", prediction)
+    assert cache.get("a", "midpoint") == prediction
+    cache.put("c", "midpoint", prediction)
+    assert cache.previous("b", "midpoint") is None
+    assert len(cache) == 2
+
+    clock.monotonic.return_value = 107.0
+    assert cache.due(lead=2.0, min_rate=0.0) == []
+    clock.monotonic.return_value = 111.0
+    assert cache.get("a", "midpoint") is None
+    assert [uuid for uuid, _ in cache.due(lead=2.0, min_rate=0.0)] == ["a", "c"]
+    assert PredictionCache().get("a", "midpoint") is None
+
+
+def test_prefetcher_refreshes_hot_devices_within_budget(mocker: MockFixture) -> None:
+    """Test that the hottest due devices are refreshed first, within the budget.
+
+    :param mocker: mocker
+    """
+    clock = mocker.patch.object(prefetch, "time")
+    clock.monotonic.return_value = 0.0
+    hotspots: List[IntegrationHotspot] = []
+    load = mocker.patch.object(prefetch, "get_integration_hotspots")
+    load.return_value = hotspots
+    predict = mocker.patch.object(prefetch, "predict")
+    notify = mocker.patch.object(prefetch, "notify")
+    cache = PredictionCache(ttl=10.0)
+    for uuid, polls in (("cold", 0), ("warm", 3), ("hot", 6)):
+        for model in ("midpoint", "nearest_neighbor"):
+            cache.put(uuid, model, Prediction(uuid=uuid, lat=1.0, lng=1.0))
+            for _ in range(polls):
+                cache.get(uuid, model)
+    prefetcher = Prefetcher(cache, budget=1.0)
+
+    predict.side_effect = lambda uuid, model, *args, **kwargs: Prediction(
+        uuid=uuid, lat=2.0 if model == "midpoint" else 1.0, lng=1.0
+    )
+    clock.monotonic.return_value = 5.0
+    assert prefetcher.refresh_due() == 0
+    clock.monotonic.return_value = 8.5
+    assert prefetcher.refresh_due() == 1
+    load.assert_called_once_with("hot")
+    assert [call.args[1] for call in notify.call_args_list] == ["midpoint"]
+    assert cache.get("hot", "midpoint").lat == 2.0  # type: ignore[union-attr]
+
+    clock.monotonic.return_value = 9.5
+    assert prefetcher.refresh_due() == 1
+    load.assert_called_with("warm")
+    assert prefetcher.refresh_due() == 0
+    clock.monotonic.return_value = 10.5
+    assert cache.get("cold", "midpoint") is None
+
+
+def test_failed_refresh_is_postponed(mocker: MockFixture) -> None:
+    """Test that a device whose refresh failed is not retried right away.
+
+    :param mocker: mocker
+    """
+    clock = mocker.patch.object(prefetch, "time")
+    clock.monotonic.return_value = 0.0
+    load = mocker.patch.object(prefetch, "get_integration_hotspots")
+    load.side_effect = ValueError("No hotspots found")
+    cache = PredictionCache(ttl=10.0)
+    cache.put("a", "midpoint", Prediction(uuid="a"))
+    for _ in range(5):
+        cache.get("a", "midpoint")
+    prefetcher = Prefetcher(cache, budget=100.0, lead=2.0)
+
+    clock.monotonic.return_value = 9.0
+    assert prefetcher.refresh_due() == 0
+    assert prefetcher.refresh_due() == 0
+    assert load.call_count == 1
+    clock.monotonic.return_value = 11.5
+    prefetcher.refresh_due()
+    assert load.call_count == 2
+
+
+def test_due_does_not_block_lookups(mocker: MockFixture) -> None:
+    """Test that due entries are rated without holding the lock of the cache.
+
+    :param mocker: mocker
+    """
+    clock = mocker.patch.object(prefetch, "time")
+    clock.monotonic.return_value = 0.0
+    cache = PredictionCache(ttl=10.0)
+    cache.put("a", "midpoint", Prediction(uuid="a"))
+    locked = []
+    access_rate = prefetch.Entry.access_rate
+
+    def rate(entry: prefetch.Entry, now: float) -> float:
+        locked.append(cache._lock.locked())
+        return access_rate(entry, now)
+
+    mocker.patch.object(prefetch.Entry, "access_rate", rate)
+    clock.monotonic.return_value = 9.0
+
+    assert cache.due(lead=2.0, min_rate=0.0) == [("a", ["midpoint"])]
+    assert locked == [False]
+
+
+def test_budget_is_shared_by_the_workers(mocker: MockFixture) -> None:
+    """Test that every worker refreshes with its share of the budget.
+
+    :param mocker: mocker
+    """
+    mocker.patch.dict("os.environ", {"PREFETCH_BUDGET": "12"})
+    mocker.patch.object(prefetch, "worker_count").return_value = 4
+
+    prefetcher = prefetch.configured_prefetcher(PredictionCache(ttl=10.0))
+
+    assert prefetcher is not None
+    assert prefetcher.budget == 3.0
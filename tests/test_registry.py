@@ -0,0 +1,98 @@
+"""Test cases for the registry module."""
+import subprocess  # noqa: S404
+import sys
+import uuid as uuid_lib
+from pathlib import Path
+
+import numpy as np
+import pytest
+from pytest_mock import MockFixture
+
+from helium_positioning_api import registry as registry_module
+from helium_positioning_api.DataObjects import Prediction
+from helium_positioning_api.registry import PositionRegistry
+
+
+def test_update_and_get(mocker: MockFixture) -> None:
+    """Test that devices keep their slots while the columns and table grow."""
+    mocker.patch.object(registry_module, "CHUNK", 16)
+    registry = PositionRegistry()
+    uuids = [str(uuid_lib.UUID(int=(i * 2654435761) << 64 | i)) for i in range(500)]
+    for i, uuid in enumerate(uuids):
+        registry.update(uuid, i, -i, model="midpoint", timestamp=i)
+    registry.update("not-a-uuid", 1.0, 2.0, conf=0.5)
+    registry.update(uuids[7], 70.0, 12.0, model="gradient_boosting", timestamp=9)
+
+    assert len(registry) == 501
+    assert uuids[499] in registry and uuids[499].upper() not in registry
+    assert registry.get(uuids[7]) == Prediction(
+        uuid=uuids[7], lat=70.0, lng=12.0, model="gradient_boosting"
+    )
+    assert registry.timestamp(uuids[7]) == 9
+    assert registry.get("not-a-uuid").conf == 0.5  # type: ignore[union-attr]
+    assert registry.get("unknown") is None
+
+    snapshot = registry.snapshot()
+    assert list(snapshot["uuid"]) == uuids + ["not-a-uuid"]
+    np.testing.assert_array_equal(snapshot["lat"][:5], [0, 1, 2, 3, 4])
+    assert snapshot["model"][7] == "gradient_boosting"
+    assert snapshot["model"][500] is None
+
+
+def test_persistence(tmp_path: Path) -> None:
+    """Test that a flushed registry is opened with all devices."""
+    path = str(tmp_path / "registry")
+    registry = PositionRegistry(path)
+    uuid = str(uuid_lib.uuid4())
+    registry.update_prediction(
+        Prediction(uuid=uuid, lat=47.5, lng=12.1, model="midpoint"), "midpoint"
+    )
+    registry.update_prediction(Prediction(uuid="failed"), "midpoint")
+    registry.update("device", 1.0, 2.0)
+    registry.close()
+
+    reopened = PositionRegistry(path)
+    assert len(reopened) == 2
+    assert reopened.get(uuid) == Prediction(
+        uuid=uuid, lat=47.5, lng=12.1, model="midpoint"
+    )
+    assert reopened.get("device").lat == 1.0  # type: ignore[union-attr]
+    reopened.update(str(uuid_lib.uuid4()), 0.0, 0.0)
+    assert len(reopened) == 3
+
+
+def open_in_process(path: str) -> subprocess.CompletedProcess:  # type: ignore[type-arg]
+    """Open a registry in another process and print its number of devices.
+
+    :param path: directory of the registry
+    :return: finished process
+    """
+    script = (
+        "import sys\n"
+        "from helium_positioning_api.registry import PositionRegistry\n"
+        "print(len(PositionRegistry(sys.argv[1])))\n"
+    )
+    return subprocess.run(  # noqa: S603
+        [sys.executable, "-c", script, path], capture_output=True, text=True
+    )
+
+
+def test_single_writer(tmp_path: Path) -> None:
+    """Test that a persisted registry is only opened by one process at a time.
+
+    :param tmp_path: temporary directory
+    """
+    path = str(tmp_path / "registry")
+    registry = PositionRegistry(path)
+    registry.update(str(uuid_lib.uuid4()), 47.5, 12.1)
+
+    refused = open_in_process(path)
+    with pytest.raises(ValueError):
+        PositionRegistry(path)
+    registry.close()
+    opened = open_in_process(path)
+
+    assert refused.returncode != 0
+    assert "used by another process" in refused.stderr
+    assert opened.returncode == 0
+    assert opened.stdout.strip() == "1"
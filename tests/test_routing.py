@@ -0,0 +1,111 @@
+"""Test cases for the routing module."""
+import pytest
+from click.testing import CliRunner
+from helium_api_wrapper.DataObjects import IntegrationHotspot
+from pytest_mock import MockFixture
+
+from helium_positioning_api import __main__
+from helium_positioning_api import distance_prediction
+from helium_positioning_api import routing
+from helium_positioning_api.DataObjects import Prediction
+from helium_positioning_api.routing import WitnessGeometry
+from helium_positioning_api.routing import auto
+from helium_positioning_api.routing import route
+from helium_positioning_api.routing import witness_geometry
+
+
+def hotspot(lat: float, lng: float, rssi: float) -> IntegrationHotspot:
+    """Return a witness of an uplink.
+
+    :param lat: latitude
+    :param lng: longitude
+    :param rssi: received signal strength
+    :return: IntegrationHotspot
+    """
+    return IntegrationHotspot.construct(
+        lat=lat, lng=lng, rssi=rssi, snr=0.0, datarate="SF9BW125", frequency=868.1
+    )
+
+
+def test_witness_geometry() -> None:
+    """Test spread, collinearity and rssi spread of witnesses."""
+    line = witness_geometry(
+        [
+            hotspot(47.0, 12.0, -100),
+            hotspot(47.01, 12.0, -110),
+            hotspot(47.02, 12.0, -90),
+        ]
+    )
+    assert line.count == 3
+    assert line.spread == pytest.approx(1112, rel=0.01)
+    assert line.collinearity == pytest.approx(0.0, abs=1e-6)
+    assert line.rssi_spread == 20
+
+    triangle = witness_geometry(
+        [
+            hotspot(47.0, 12.0, -100),
+            hotspot(47.0, 12.02, -110),
+            hotspot(47.02, 12.01, -90),
+        ]
+    )
+    assert triangle.collinearity > 0.5
+    assert witness_geometry([hotspot(None, None, -80)]).count == 0  # type: ignore
+
+
+def test_route() -> None:
+    """Test that the cheapest model meeting the target accuracy is chosen."""
+    wide = WitnessGeometry(count=5, spread=3000, collinearity=0.8, rssi_spread=20)
+    single = WitnessGeometry(1, 0.0, 0.0, 0.0)
+    assert route(single, 5000) == ("nearest_neighbor", "single_witness")
+    assert route(single, 500) == ("nearest_neighbor", "best_effort")
+    assert route(WitnessGeometry(4, 300, 0.8, 20), 500) == (
+        "nearest_neighbor",
+        "spread",
+    )
+    assert route(WitnessGeometry(4, 800, 0.8, 20), 500) == (
+        "weighted_centroid",
+        "spread",
+    )
+    assert route(wide, 500, "gradient_boosting") == ("gradient_boosting", "geometry")
+    # no distance model, or witnesses on a line
+    assert route(wide, 500) == ("weighted_centroid", "best_effort")
+    collinear = WitnessGeometry(count=5, spread=3000, collinearity=0.01, rssi_spread=20)
+    assert route(collinear, 500, "gradient_boosting")[0] == "weighted_centroid"
+    with pytest.raises(ValueError):
+        route(WitnessGeometry(0, 0.0, 0.0, 0.0))
+
+
+def test_auto_runs_the_routed_model(mocker: MockFixture) -> None:
+    """Test that the auto model runs the routed model on the same hotspots."""
+    trilateration = mocker.Mock(
+        return_value=Prediction(uuid="d", lat=1.0, lng=2.0, model="gradient_boosting")
+    )
+    mocker.patch.dict(routing.ROUTES, {"gradient_boosting": trilateration})
+    mocker.patch.object(
+        routing, "available_trilateration_model", return_value="gradient_boosting"
+    )
+    hotspots = [
+        hotspot(47.0, 12.0, -100),
+        hotspot(47.0, 12.05, -110),
+        hotspot(47.04, 12.02, -90),
+    ]
+    assert auto("d", hotspots).model == "gradient_boosting"
+    trilateration.assert_called_once_with("d", hotspots=hotspots)
+    assert auto("d", hotspots, target_accuracy=5000).model == "nearest_neighbor"
+
+
+def test_lookup_table_needs_no_preprocessor(mocker: MockFixture) -> None:
+    """Test that a lookup table alone is routed to, and loaded by the CLI.
+
+    :param mocker: mocker
+    """
+    mocker.patch.dict(distance_prediction._models, clear=True)
+    assert routing.available_trilateration_model() is None
+    distance_prediction._models["gradient_boosting_lut"] = object()
+    assert routing.available_trilateration_model() == "gradient_boosting_lut"
+
+    load = mocker.patch.object(__main__, "load_available_models")
+    mocker.patch.object(__main__, "predict_within").return_value = Prediction(uuid="d")
+    result = CliRunner().invoke(__main__.predict, ["--uuid", "d", "--model", "auto"])
+    assert result.exit_code == 0
+    load.assert_called_once_with()
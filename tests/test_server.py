@@ -0,0 +1,46 @@
+"""Test cases for the server module."""
+import socket
+
+import pytest
+from pytest_mock import MockFixture
+
+from helium_positioning_api import server
+from helium_positioning_api.server import WorkerPool
+from helium_positioning_api.server import serve_production
+
+
+def test_crashing_worker_is_replaced_with_backoff(mocker: MockFixture) -> None:
+    """Test that the respawn delay doubles for crashes in a row and resets.
+
+    :param mocker: mocker
+    """
+    clock = mocker.patch.object(server, "time")
+    clock.monotonic.return_value = 0.0
+    mocker.patch.object(server.os, "fork", return_value=1234)
+    pool = WorkerPool(mocker.Mock(), socket.socket(), drain_delay=0.0)
+
+    delays = []
+    for _ in range(8):
+        pool.spawn(0)
+        delays.append(pool.respawn_delay(0))
+    assert delays == [1.0, 2.0, 4.0, 8.0, 16.0, 32.0, 60.0, 60.0]
+
+    pool.spawn(0)
+    clock.monotonic.return_value = server.STABLE_UPTIME
+    assert pool.respawn_delay(0) == 0.0
+    pool.spawn(0)
+    assert pool.respawn_delay(0) == 1.0
+    pool.sock.close()
+
+
+def test_per_process_settings_need_a_single_worker(mocker: MockFixture) -> None:
+    """Test that workers are not forked for settings written by every worker.
+
+    :param mocker: mocker
+    """
+    mocker.patch.dict(server.os.environ, {"REGISTRY_PATH": "/tmp/registry"})
+    warm_up = mocker.patch.object(server, "warm_up")
+
+    with pytest.raises(ValueError):
+        serve_production(workers=2)
+    warm_up.assert_not_called()
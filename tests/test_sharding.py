@@ -0,0 +1,255 @@
+"""Test cases for the sharding module."""
+import json
+import os
+import signal
+import socket
+import subprocess  # noqa: S404
+import sys
+import time
+from collections import Counter
+from typing import Any
+from typing import Dict
+from typing import Iterator
+from typing import List
+from typing import Optional
+from typing import Tuple
+from urllib.error import HTTPError
+from urllib.error import URLError
+from urllib.request import HTTPRedirectHandler
+from urllib.request import Request
+from urllib.request import build_opener
+
+import numpy as np
+import pytest
+
+from helium_positioning_api.sharding import FORWARDED_HEADER
+from helium_positioning_api.sharding import REDIRECT
+from helium_positioning_api.sharding import TOKEN_HEADER
+from helium_positioning_api.sharding import Cluster
+from helium_positioning_api.sharding import HashRing
+
+
+UUIDS = [f"{i:08x}-0000-4000-8000-000000000000" for i in range(4000)]
+MEMBERS = [f"http://10.0.0.{i}:8000" for i in range(1, 5)]
+TOKEN = "shared-secret"
+
+
+def test_ring_spreads_devices_evenly() -> None:
+    """Test that every member owns about the same share of the devices."""
+    ring = HashRing(MEMBERS)
+    owners = ring.owners(UUIDS)
+
+    assert list(owners[:100]) == [ring.owner(uuid) for uuid in UUIDS[:100]]
+    shares = Counter(owners)
+    assert set(shares) == set(MEMBERS)
+    assert max(shares.values()) < 1.35 * len(UUIDS) / len(MEMBERS)
+    assert HashRing().owner(UUIDS[0]) is None
+
+
+def test_only_devices_of_changed_members_move() -> None:
+    """Test that a join or leave only moves devices to or from that member."""
+    ring = HashRing(MEMBERS[:3])
+    before = ring.owners(UUIDS)
+    version = ring.version
+
+    assert ring.add(MEMBERS[3]) and not ring.add(MEMBERS[3])
+    after = ring.owners(UUIDS)
+    moved = before != after
+    assert ring.version == version + 1
+    assert set(after[moved]) == {MEMBERS[3]}
+    assert 0.15 < moved.mean() < 0.35
+
+    assert ring.remove(MEMBERS[3])
+    assert np.array_equal(ring.owners(UUIDS), before)
+
+
+def test_cluster_routes_devices_of_peers() -> None:
+    """Test that devices of peers are routed to them unless already forwarded."""
+    cluster = Cluster(MEMBERS[0] + "/", MEMBERS[1:], mode=REDIRECT, token=TOKEN)
+    peers = [uuid for uuid in UUIDS[:50] if cluster.ring.owner(uuid) != MEMBERS[0]]
+    owned = cluster.owned_by(UUIDS[:50], MEMBERS[0])
+    forwarded = {FORWARDED_HEADER: MEMBERS[1], TOKEN_HEADER: TOKEN}
+    spoofed = {FORWARDED_HEADER: MEMBERS[1], TOKEN_HEADER: "guess"}
+
+    assert cluster.url == MEMBERS[0]
+    assert cluster.route(peers[0], {}) == cluster.ring.owner(peers[0])
+    assert cluster.route(peers[0], forwarded) is None
+    assert cluster.route(peers[0], spoofed) == cluster.ring.owner(peers[0])
+    assert not Cluster(MEMBERS[0]).authenticated({TOKEN_HEADER: ""})
+    assert cluster.route(UUIDS[owned[0]], {}) is None
+    assert len(owned) + len(peers) == 50
+    with pytest.raises(ValueError):
+        cluster.leave(MEMBERS[0])
+    with pytest.raises(ValueError):
+        Cluster(MEMBERS[0], mode="broadcast")
+
+
+def test_unreachable_owner() -> None:
+    """Test that a request to an unreachable owner fails with ConnectionError."""
+    cluster = Cluster("http://127.0.0.1:1", ["http://127.0.0.1:2"], timeout=1.0)
+
+    with pytest.raises(ConnectionError):
+        cluster.forward("http://127.0.0.1:2", "GET", "/devices/a/latest", b"", {})
+    assert cluster.announce() == []
+
+
+class NoRedirect(HTTPRedirectHandler):
+    """Return redirects to the caller instead of following them."""
+
+    def redirect_request(self, *args: Any, **kwargs: Any) -> None:
+        """Do not follow the redirect."""
+        return None
+
+
+def call(
+    url: str,
+    method: str = "GET",
+    payload: Any = None,
+    headers: Optional[Dict[str, str]] = None,
+) -> Tuple[int, Dict[str, str], Any]:
+    """Send a request to an instance without following redirects.
+
+    :param url: url of the endpoint
+    :param method: HTTP method
+    :param payload: JSON body
+    :param headers: headers of the request
+    :return: status, headers and decoded JSON body of the response
+    """
+    body = None if payload is None else json.dumps(payload).encode()
+    request = Request(
+        url,
+        data=body,
+        method=method,
+        headers={"content-type": "application/json", **(headers or {})},
+    )
+    try:
+        with build_opener(NoRedirect).open(request, timeout=10) as response:
+            status, content = response.status, response.read()
+            response_headers = dict(response.headers)
+    except HTTPError as error:
+        status, content, response_headers = (
+            error.code,
+            error.read(),
+            dict(error.headers),
+        )
+    return status, response_headers, json.loads(content) if content else None
+
+
+def member(url: str, peers: List[str], mode: str = "forward") -> subprocess.Popen:  # type: ignore[type-arg]
+    """Start an instance of the api in its own process and wait until it is ready.
+
+    :param url: base url of the instance
+    :param peers: base urls of the other members
+    :param mode: sharding mode
+    :return: process of the instance
+    """
+    env = {
+        name: value
+        for name, value in os.environ.items()
+        if not name.startswith(("SHARD_", "REGISTRY_", "HISTORY_", "PREFETCH_"))
+    }
+    env.update(
+        SHARD_SELF=url,
+        SHARD_PEERS=",".join(peers),
+        SHARD_MODE=mode,
+        SHARD_TOKEN=TOKEN,
+        SHARD_TIMEOUT="2",
+    )
+    process = subprocess.Popen(  # noqa: S603
+        [sys.executable, "-m", "uvicorn", "helium_positioning_api.api:app"]
+        + ["--port", url.rsplit(":", 1)[1], "--log-level", "warning"],
+        env=env,
+    )
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        try:
+            if call(f"{url}/readyz")[0] == 200:
+                return process
+        except (URLError, ConnectionError):
+            pass
+        time.sleep(0.2)
+    process.kill()
+    raise TimeoutError(f"{url} did not start.")
+
+
+def free_url() -> str:
+    """Return the base url of a free local port."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return f"http://127.0.0.1:{sock.getsockname()[1]}"
+
+
+@pytest.fixture
+def processes() -> Iterator[List[subprocess.Popen]]:  # type: ignore[type-arg]
+    """Collect the started instances and stop them after the test.
+
+    :return: processes
+    """
+    started: List[subprocess.Popen] = []  # type: ignore[type-arg]
+    yield started
+    for process in started:
+        process.kill()
+        process.wait()
+
+
+def position(uuid: str, lat: float, timestamp: int) -> Dict[str, Any]:
+    """Return a position as handed over between members.
+
+    :param uuid: Device id
+    :param lat: latitude
+    :param timestamp: time of the position in milliseconds
+    :return: position
+    """
+    return {"uuid": uuid, "lat": lat, "lng": 12.0, "timestamp": timestamp}
+
+
+def test_cluster_of_processes(
+    processes: List[subprocess.Popen],  # type: ignore[type-arg]
+) -> None:
+    """Test forwarding, redirects, authentication and hand-over between instances.
+
+    :param processes: started instances
+    """
+    a, b, c = free_url(), free_url(), free_url()
+    token = {TOKEN_HEADER: TOKEN}
+    processes.append(member(a, [b]))
+    processes.append(member(b, [a]))
+
+    assert call(f"{a}/cluster/members")[0] == 403
+    assert call(f"{a}/cluster/members", headers=token)[2]["members"] == sorted([a, b])
+    uuids = UUIDS[:40]
+    owners = HashRing([a, b]).owners(uuids)
+    for owner in (a, b):
+        handed = [position(u, 47.0, 1) for u, o in zip(uuids, owners) if o == owner]
+        assert call(f"{owner}/cluster/handoff", "POST", handed)[0] == 403
+        assert call(f"{owner}/cluster/handoff", "POST", handed, token)[2] == {
+            "received": len(handed)
+        }
+
+    on_b = next(u for u, o in zip(uuids, owners) if o == b)
+    forwarded = call(f"{a}/devices/{on_b}/latest")
+    spoofed = call(f"{a}/devices/{on_b}/latest", headers={FORWARDED_HEADER: a})
+    trusted = call(f"{a}/devices/{on_b}/latest", headers={FORWARDED_HEADER: a, **token})
+    assert forwarded[0] == 200 and forwarded[2]["lat"] == 47.0
+    assert spoofed[0] == 200
+    assert trusted[0] == 404
+
+    # a third instance joins through a and redirects requests for other devices
+    processes.append(member(c, [a], mode=REDIRECT))
+    assert call(f"{b}/cluster/members", headers=token)[2]["members"] == sorted(
+        [a, b, c]
+    )
+    new_owners = HashRing([a, b, c]).owners(uuids)
+    on_c = [u for u, o in zip(uuids, new_owners) if o == c]
+    on_a = next(u for u, o in zip(uuids, new_owners) if o == a)
+    assert all(call(f"{c}/devices/{u}/latest")[0] == 200 for u in on_c)
+    redirect = call(f"{c}/devices/{on_a}/latest")
+    assert redirect[0] == 307
+    assert redirect[1]["location"] == f"{a}/devices/{on_a}/latest"
+
+    # positions updated on c are handed back when it leaves
+    call(f"{c}/cluster/handoff", "POST", [position(on_c[0], 48.0, 2)], token)
+    processes[-1].send_signal(signal.SIGTERM)
+    assert processes[-1].wait(timeout=30) == 0
+    assert call(f"{a}/cluster/members", headers=token)[2]["members"] == sorted([a, b])
+    assert call(f"{a}/devices/{on_c[0]}/latest")[2]["lat"] == 48.0
@@ -0,0 +1,85 @@
+"""Test cases for the spatial index module."""
+import random
+
+import pytest
+from haversine import Unit
+from haversine import haversine
+from pytest_mock import MockFixture
+
+from helium_positioning_api import spatial_index
+from helium_positioning_api.DataObjects import Prediction
+from helium_positioning_api.spatial_index import GridIndex
+
+
+def make_index(n: int = 500) -> GridIndex:
+    """Create an index of random points around Kufstein.
+
+    :param n: number of points
+    :return: GridIndex
+    """
+    rng = random.Random(0)
+    index = GridIndex(cell_size=0.01)
+    for i in range(n):
+        lat, lng = 47.58 + rng.uniform(-0.1, 0.1), 12.17 + rng.uniform(-0.1, 0.1)
+        index.update(str(i), lat, lng)
+    return index
+
+
+def test_queries_match_brute_force() -> None:
+    """Test radius, bounding box and k-nearest queries against a full scan."""
+    index = make_index()
+    points = {str(i): index.get(str(i)) for i in range(500)}
+    centre = (47.6, 12.15)
+    distances = {
+        key: haversine(centre, point, unit=Unit.METERS) for key, point in points.items()
+    }
+
+    nearby = [key for key, _, _, _ in index.within_radius(*centre, 3000)]
+    assert nearby == sorted(
+        (key for key, distance in distances.items() if distance <= 3000),
+        key=distances.__getitem__,
+    )
+
+    nearest = [key for key, _, _, _ in index.nearest(*centre, 7)]
+    assert nearest == sorted(distances, key=distances.__getitem__)[:7]
+
+    within = {key for key, _, _ in index.within_bbox(47.55, 12.1, 47.6, 12.2)}
+    assert within == {
+        key
+        for key, (lat, lng) in points.items()
+        if 47.55 <= lat <= 47.6 and 12.1 <= lng <= 12.2
+    }
+
+
+def test_update_prediction_moves_and_removes_devices() -> None:
+    """Test that new predictions move devices and failed ones remove them."""
+    index = GridIndex()
+    index.update_prediction(Prediction(uuid="a", lat=47.0, lng=12.0), "midpoint")
+    index.update_prediction(Prediction(uuid="a", lat=48.0, lng=13.0), "midpoint")
+
+    assert index.within_bbox(46.9, 11.9, 47.1, 12.1) == []
+    assert index.nearest(48.0, 13.0, 1)[0][0] == "a"
+
+    index.update_prediction(Prediction(uuid="a"), "midpoint")
+    assert len(index) == 0
+
+
+def test_nearest_far_away_scans_occupied_cells(mocker: MockFixture) -> None:
+    """Test that a query far from all points does not search ring after ring.
+
+    :param mocker: mocker
+    """
+    index = make_index()
+    rings = mocker.patch.object(spatial_index, "_ring", wraps=spatial_index._ring)
+    centre = (-33.9, 18.4)
+    distances = {
+        str(i): haversine(centre, index.get(str(i)), unit=Unit.METERS)
+        for i in range(500)
+    }
+
+    nearest = [key for key, _, _, _ in index.nearest(*centre, 3)]
+
+    assert nearest == sorted(distances, key=distances.__getitem__)[:3]
+    assert rings.call_count <= 12
+    with pytest.raises(ValueError):
+        index.nearest(*centre, 0)
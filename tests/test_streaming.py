@@ -0,0 +1,208 @@
+"""Test cases for the streaming module."""
+import asyncio
+from types import SimpleNamespace
+from typing import Any
+from typing import List
+
+import pytest
+from fastapi import HTTPException
+from pytest_mock import MockFixture
+
+from helium_positioning_api import api
+from helium_positioning_api import streaming
+from helium_positioning_api.DataObjects import Prediction
+from helium_positioning_api.streaming import PositionBroker
+from helium_positioning_api.streaming import event_stream
+
+
+def integration(reported_at: int, rssi: float = -100.0) -> Any:
+    """Return an integration with one hotspot.
+
+    :param reported_at: time of the integration
+    :param rssi: signal strength at the hotspot
+    :return: integration
+    """
+    hotspot = SimpleNamespace(lat=47.0, lng=12.0, rssi=rssi, snr=5.0)
+    return SimpleNamespace(reported_at=reported_at, hotspots=[hotspot])
+
+
+def drain(queue: "asyncio.Queue[Prediction]") -> List[Prediction]:
+    """Return the queued predictions.
+
+    :param queue: queue of a subscriber
+    :return: predictions in the order they were queued
+    """
+    predictions = []
+    while not queue.empty():
+        predictions.append(queue.get_nowait())
+    return predictions
+
+
+def test_one_poll_per_device(mocker: MockFixture) -> None:
+    """Test that a device is polled once per interval for all its subscribers.
+
+    :param mocker: mocker
+    """
+    load = mocker.patch.object(streaming, "get_last_integration")
+    load.return_value = integration(1)
+    predict = mocker.patch.object(streaming, "predict")
+    predict.side_effect = lambda uuid, model, hotspots: Prediction(
+        uuid=uuid, lat=47.0, lng=12.0, model=model
+    )
+
+    async def subscribe() -> List[Prediction]:
+        broker = PositionBroker(interval=60.0)
+        queues = [broker.subscribe(["a", "a"], "midpoint") for _ in range(3)]
+        received = [await queue.get() for queue in queues]
+        late = broker.subscribe(["a"], "midpoint")
+        broker.stop()
+        return received + drain(late)
+
+    received = asyncio.run(subscribe())
+
+    load.assert_called_once_with("a")
+    predict.assert_called_once()
+    assert len(received) == 4
+    assert all(prediction == received[0] for prediction in received)
+
+
+def test_only_changes_are_published(mocker: MockFixture) -> None:
+    """Test that only new integrations are predicted and only changes pushed.
+
+    :param mocker: mocker
+    """
+    load = mocker.patch.object(streaming, "get_last_integration")
+    predict = mocker.patch.object(streaming, "predict")
+    predict.return_value = Prediction(uuid="a", lat=47.0, lng=12.0)
+
+    async def poll() -> List[Prediction]:
+        broker = PositionBroker()
+        queue = broker.subscribe(["a"], "midpoint")
+        broker.stop()
+        for integrations in (integration(1), integration(1), integration(2)):
+            load.return_value = integrations
+            await broker.poll("a", ["midpoint"])
+        predict.return_value = Prediction(uuid="a", lat=47.1, lng=12.0)
+        load.return_value = integration(3)
+        await broker.poll("a", ["midpoint"])
+        return drain(queue)
+
+    received = asyncio.run(poll())
+
+    assert predict.call_count == 3
+    assert [prediction.lat for prediction in received] == [47.0, 47.1]
+
+
+def test_full_queue_drops_oldest(mocker: MockFixture) -> None:
+    """Test that a slow subscriber loses the oldest predictions.
+
+    :param mocker: mocker
+    """
+    mocker.patch.object(streaming, "QUEUE_SIZE", 2)
+
+    async def publish() -> List[Prediction]:
+        broker = PositionBroker()
+        queue = broker.subscribe(["a"], "midpoint")
+        broker.stop()
+        for lat in (1.0, 2.0, 3.0):
+            broker.publish("a", "midpoint", Prediction(uuid="a", lat=lat, lng=0.0))
+        return drain(queue)
+
+    assert [prediction.lat for prediction in asyncio.run(publish())] == [2.0, 3.0]
+
+
+def test_unsubscribe_forgets_devices(mocker: MockFixture) -> None:
+    """Test that devices without subscribers are forgotten and not polled.
+
+    :param mocker: mocker
+    """
+    load = mocker.patch.object(streaming, "get_last_integration")
+    load.return_value = integration(1)
+    mocker.patch.object(streaming, "predict").return_value = Prediction(uuid="a")
+
+    async def unsubscribe() -> PositionBroker:
+        broker = PositionBroker(interval=0.01)
+        first = broker.subscribe(["a", "b"], "midpoint")
+        second = broker.subscribe(["a"], "midpoint")
+        await first.get()
+        broker.unsubscribe(first)
+        assert set(broker._subscribers) == {("a", "midpoint")}
+        assert set(broker._integrations) == {"a"}
+        broker.unsubscribe(second)
+        await asyncio.wait_for(broker._task, timeout=1.0)  # type: ignore[arg-type]
+        return broker
+
+    broker = asyncio.run(unsubscribe())
+
+    assert not broker._subscribers
+    assert not broker._predictions
+    assert not broker._integrations
+
+
+def test_disconnect_unsubscribes(mocker: MockFixture) -> None:
+    """Test that closing the event stream of /subscribe/ unsubscribes the client.
+
+    :param mocker: mocker
+    """
+    broker = PositionBroker(interval=60.0)
+    mocker.patch.object(api, "broker", broker)
+    mocker.patch.object(streaming, "get_last_integration").return_value = integration(1)
+    mocker.patch.object(streaming, "predict").return_value = Prediction(
+        uuid="a", lat=47.0, lng=12.0
+    )
+
+    async def stream() -> List[str]:
+        response = await api.subscribe(uuids=["a"], model="midpoint")
+        events = response.body_iterator
+        received = [await events.__anext__()]  # type: ignore[union-attr]
+        await events.aclose()  # type: ignore[union-attr]
+        broker.stop()
+        return received
+
+    events = asyncio.run(stream())
+
+    assert events[0].startswith("event: prediction\ndata: ")
+    assert '"lat": 47.0' in events[0]
+    assert not broker._subscribers
+    with pytest.raises(HTTPException):
+        asyncio.run(api.subscribe(uuids=["a"], model="unknown"))
+
+
+def test_idle_stream_keeps_alive() -> None:
+    """Test that an idle stream sends keep-alive comments."""
+
+    async def idle() -> str:
+        broker = PositionBroker()
+        queue: "asyncio.Queue[Prediction]" = asyncio.Queue()
+        events = event_stream(broker, queue, keep_alive=0.01)
+        comment = await events.__anext__()
+        await events.aclose()
+        return comment
+
+    assert asyncio.run(idle()) == ": keep-alive\n\n"
+
+
+def test_failed_prediction_keeps_polling(mocker: MockFixture) -> None:
+    """Test that an error predicting one device does not stop the other pushes.
+
+    :param mocker: mocker
+    """
+    mocker.patch.object(streaming, "get_last_integration").return_value = integration(1)
+
+    def predict(uuid: str, model: str, hotspots: List[Any]) -> Prediction:
+        if uuid == "broken":
+            raise RuntimeError("model not loaded")
+        return Prediction(uuid=uuid, lat=47.0, lng=12.0, model=model)
+
+    mocker.patch.object(streaming, "predict").side_effect = predict
+
+    async def subscribe() -> Prediction:
+        broker = PositionBroker(interval=0.01)
+        broker.subscribe(["broken"], "midpoint")
+        queue = broker.subscribe(["a"], "midpoint")
+        prediction = await asyncio.wait_for(queue.get(), timeout=1.0)
+        assert broker._task is not None and not broker._task.done()
+        broker.stop()
+        return prediction
+
+    assert asyncio.run(subscribe()).uuid == "a"
@@ -0,0 +1,43 @@
+"""Test cases for the synthetic data module."""
+import numpy as np
+from haversine import Unit
+from haversine import haversine
+from helium_api_wrapper.DataObjects import IntegrationEvent
+
+from helium_positioning_api.synthetic import SENSITIVITY
+from helium_positioning_api.synthetic import SyntheticNetwork
+from helium_positioning_api.synthetic import generate_uplinks
+
+
+region = (47.0, 12.0, 47.1, 12.1)
+
+
+def test_generated_events_are_integration_events() -> None:
+    """Test that events parse, are received above sensitivity and sorted."""
+    rng = np.random.default_rng(0)
+    network = SyntheticNetwork.generate(50, region, rng)
+    events = list(generate_uplinks(network, 200, region, rng, max_witnesses=5))
+
+    assert 0 < len(events) <= 200
+    for event in events:
+        integration = IntegrationEvent(**event)
+        rssi = [hotspot.rssi for hotspot in integration.hotspots]
+        assert 0 < len(rssi) <= 5
+        assert rssi == sorted(rssi, reverse=True)
+        assert min(rssi) >= SENSITIVITY[integration.hotspots[0].datarate] - 0.05
+        assert region[0] <= event["lat"] <= region[2]
+
+
+def test_stronger_witnesses_are_closer() -> None:
+    """Test that the rssi decreases with the distance on average."""
+    rng = np.random.default_rng(1)
+    network = SyntheticNetwork.generate(100, region, rng)
+    distances, rssi = [], []
+    for event in generate_uplinks(network, 300, region, rng):
+        for hotspot in event["hotspots"]:
+            device = (event["lat"], event["lng"])
+            position = (hotspot["lat"], hotspot["lng"])
+            distances.append(haversine(device, position, unit=Unit.METERS))
+            rssi.append(hotspot["rssi"])
+
+    assert np.corrcoef(np.log(distances), rssi)[0, 1] < -0.5
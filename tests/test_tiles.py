@@ -0,0 +1,71 @@
+"""Test cases for the tiles module."""
+import numpy as np
+import pytest
+
+from helium_positioning_api.DataObjects import Prediction
+from helium_positioning_api.tiles import TileAggregates
+from helium_positioning_api.tiles import tile
+from helium_positioning_api.tiles import tiles
+
+
+def test_tile_matches_vectorized_tiles() -> None:
+    """Test the scalar and vectorized tile computation against known tiles."""
+    assert tile(48.1351, 11.582, 10) == (544, 355)
+    assert tile(90.0, 180.0, 4) == (15, 0)
+    rng = np.random.default_rng(0)
+    lat, lng = rng.uniform(-85, 85, 100), rng.uniform(-180, 180, 100)
+    x, y = tiles(lat, lng, 12)
+
+    assert list(zip(x, y)) == [tile(a, b, 12) for a, b in zip(lat, lng)]
+
+
+def test_moving_device_updates_counts() -> None:
+    """Test that a device is only counted in the tiles of its latest position."""
+    aggregates = TileAggregates(zooms=(4, 10))
+    aggregates.update("a", 47.26, 11.39, timestamp=1)
+    aggregates.update("b", 47.26, 11.39, timestamp=2)
+    aggregates.update_prediction(Prediction(uuid="a", lat=48.14, lng=11.58), "midpoint")
+    aggregates.update_prediction(Prediction(uuid="c"), "midpoint")
+
+    assert len(aggregates) == 2
+    europe = aggregates.viewport(4, 40.0, 0.0, 55.0, 20.0)
+    assert [(t["x"], t["y"], t["count"]) for t in europe] == [(8, 5, 2)]
+    assert europe[0]["last_seen"] > 2
+    alps = aggregates.viewport(10, 47.0, 11.0, 48.5, 12.0)
+    assert [(t["x"], t["y"], t["count"]) for t in alps] == [
+        (544, 355, 1),
+        (544, 359, 1),
+    ]
+    assert alps[1]["last_seen"] == 2
+
+
+def test_viewport_across_antimeridian() -> None:
+    """Test that a viewport with min_lng east of max_lng wraps around."""
+    aggregates = TileAggregates(zooms=(6,))
+    aggregates.update("east", -17.0, 179.0)
+    aggregates.update("west", -17.0, -179.0)
+    aggregates.update("far", -17.0, 0.0)
+
+    wrapped = aggregates.viewport(6, -20.0, 170.0, -10.0, -170.0)
+    assert sorted(t["x"] for t in wrapped) == [0, 63]
+    with pytest.raises(ValueError):
+        aggregates.viewport(5, -20.0, 170.0, -10.0, -170.0)
+
+
+def test_load_matches_updates() -> None:
+    """Test that loading positions in bulk gives the incremental aggregates."""
+    rng = np.random.default_rng(1)
+    uuids = [f"device-{i}" for i in range(500)]
+    lat, lng = rng.uniform(47.0, 48.0, 500), rng.uniform(11.0, 12.0, 500)
+    timestamps = rng.integers(0, 10**6, 500)
+    incremental, loaded = TileAggregates(), TileAggregates()
+    for uuid, a, b, t in zip(uuids, lat, lng, timestamps):
+        incremental.update(uuid, a, b, int(t))
+    loaded.load(uuids, lat, lng, timestamps)
+
+    assert len(loaded) == 500
+    for zoom in loaded.zooms:
+        viewport = (zoom, 46.0, 10.0, 49.0, 13.0)
+        assert loaded.viewport(*viewport) == incremental.viewport(*viewport)
+    loaded.update("device-0", 47.5, 11.5)
+    assert sum(t["count"] for t in loaded.viewport(14, 46.0, 10.0, 49.0, 13.0)) == 500
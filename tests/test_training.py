@@ -0,0 +1,104 @@
+"""Test cases for the training module."""
+import json
+from pathlib import Path
+
+import joblib
+import numpy as np
+import pandas as pd
+from pytest_mock import MockFixture
+
+from helium_positioning_api import training
+from helium_positioning_api.training import StreamingPreprocessor
+from helium_positioning_api.training import train
+
+
+def test_streaming_preprocessor_matches_full_fit() -> None:
+    """Test that fitting in chunks gives the statistics of the whole data."""
+    rng = np.random.default_rng(0)
+    data = pd.DataFrame(
+        {
+            "snr": rng.normal(0, 5, 1000),
+            "rssi": rng.normal(-100, 10, 1000),
+            "datarate": rng.choice(["SF7BW125", "SF12BW125"], 1000),
+            "frequency": rng.choice([868.1, 868.3], 1000),
+        }
+    )
+    preprocessor = StreamingPreprocessor()
+    for start in range(0, 1000, 300):
+        preprocessor.partial_fit(data.iloc[start : start + 300])
+
+    x = preprocessor.transform(data)
+
+    assert np.allclose(x[:, :3].mean(axis=0), 0)
+    assert np.allclose(x[:, :3].std(axis=0), 1)
+    assert set(x[:, 3]) == {0, 1}
+    unknown = data.iloc[:1].assign(datarate="SF8BW500")
+    assert preprocessor.transform(unknown)[0, 3] == -1
+
+
+def test_train_writes_loadable_models(tmp_path: Path) -> None:
+    """Test that training on labelled uplinks writes usable artifacts.
+
+    :param tmp_path: temporary directory
+    """
+    rng = np.random.default_rng(1)
+    with open(tmp_path / "uplinks.jsonl", "w") as file:
+        for _ in range(500):
+            hotspots = [
+                {
+                    "lat": 47.0 + rng.normal(0, 0.01),
+                    "lng": 12.0 + rng.normal(0, 0.01),
+                    "rssi": rng.uniform(-130, -60),
+                    "snr": rng.uniform(-10, 10),
+                    "datarate": "SF9BW125",
+                    "frequency": 868.1,
+                }
+                for _ in range(3)
+            ]
+            file.write(json.dumps({"lat": 47.0, "lng": 12.0, "hotspots": hotspots}))
+            file.write("\n")
+
+    report = train([str(tmp_path / "uplinks.jsonl")], str(tmp_path / "models"), 100)
+
+    assert report["rows"] == 1500
+    preprocessor = joblib.load(tmp_path / "models" / "preprocessor.joblib")
+    model = joblib.load(tmp_path / "models" / "gradient_boosting.joblib")
+    features = pd.DataFrame(
+        {"snr": [0.0], "rssi": [-100.0], "datarate": ["SF9BW125"], "frequency": [868.1]}
+    )
+    assert model.predict(preprocessor.transform(features)).shape == (1,)
+    assert (tmp_path / "models" / "training_report.json").exists()
+
+
+def test_holdout_rows_are_never_trained_on(tmp_path: Path, mocker: MockFixture) -> None:
+    """Test that every epoch holds out the same rows.
+
+    :param tmp_path: temporary directory
+    :param mocker: mocker
+    """
+    rng = np.random.default_rng(2)
+    with open(tmp_path / "uplinks.jsonl", "w") as file:
+        for i in range(400):
+            hotspot = {
+                "lat": 47.0 + rng.normal(0, 0.01),
+                "lng": 12.0,
+                "rssi": -60.0 - i / 10,
+                "snr": 0.0,
+                "datarate": "SF9BW125",
+                "frequency": 868.1,
+            }
+            file.write(json.dumps({"lat": 47.0, "lng": 12.0, "hotspots": [hotspot]}))
+            file.write("\n")
+    mocker.patch.object(training, "HOLDOUT_FRACTION", 0.2)
+    fitted = mocker.spy(training.SGDRegressor, "partial_fit")
+
+    report = train(
+        [str(tmp_path / "uplinks.jsonl")], str(tmp_path / "models"), 100, epochs=3
+    )
+
+    trained = {
+        float(row) for call in fitted.call_args_list for row in call.args[1][:, 1]
+    }
+    assert fitted.call_count == 12
+    assert 0 < report["holdout_rows"] < 400
+    assert len(trained) == 400 - report["holdout_rows"]
@@ -0,0 +1,65 @@
+"""Test cases for the triple selection of the trilateration model."""
+from haversine import Unit
+from haversine import haversine
+from pytest_mock import MockFixture
+
+from helium_positioning_api import trilateration
+from helium_positioning_api.trilateration import search_trilateration
+from helium_positioning_api.triple_selection import rank_triples
+
+
+device = (47.4800, 12.0500)
+latitudes = [47.4700, 47.4900, 47.4750, 47.4850, 47.4700]
+longitudes = [12.0400, 12.0450, 12.0650, 12.0600, 12.0550]
+
+
+def test_rank_triples_prunes_collinear_hotspots() -> None:
+    """Test that triples of collinear hotspots are not proposed."""
+    lat = [47.0, 47.0, 47.0, 47.01]
+    lng = [12.0, 12.01, 12.02, 12.01]
+    triples = rank_triples(lat, lng, [500.0, 500.0, 500.0, 500.0])
+
+    assert (0, 1, 2) not in triples
+    assert len(triples) == 3
+
+
+def test_search_trilateration_skips_inconsistent_triple() -> None:
+    """Test that a triple with a wrong distance is outranked by a consistent one."""
+    distances = [
+        haversine(device, (lat, lng), unit=Unit.METERS)
+        for lat, lng in zip(latitudes, longitudes)
+    ]
+    # the wrong, short distance ranks the first hotspot into the best triples
+    distances[0] = 100.0
+
+    position = search_trilateration(latitudes, longitudes, distances, "uuid")
+
+    assert position is not None
+    assert haversine(device, position, unit=Unit.METERS) < 50
+
+
+def test_search_trilateration_skips_degenerate_triple(mocker: MockFixture) -> None:
+    """Test that a best ranked triple without an estimate is skipped.
+
+    :param mocker: mocker
+    """
+    distances = [
+        haversine(device, (lat, lng), unit=Unit.METERS)
+        for lat, lng in zip(latitudes, longitudes)
+    ]
+    mocker.patch.object(trilateration, "rank_triples").return_value = [
+        (0, 1, 2),
+        (1, 2, 3),
+    ]
+    classify = trilateration.classify_intersects
+    # two tangent circle pairs touching far apart and no crossing pair
+    degenerate = ([], [], [[47.0, 12.0], [48.0, 12.0]])
+    results = iter([degenerate])
+    mocker.patch.object(
+        trilateration, "classify_intersects"
+    ).side_effect = lambda intersects: next(results, None) or classify(intersects)
+
+    position = search_trilateration(latitudes, longitudes, distances, "uuid")
+
+    assert position is not None
+    assert haversine(device, position, unit=Unit.METERS) < 50
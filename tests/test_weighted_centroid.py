@@ -0,0 +1,60 @@
+"""Test cases for the weighted centroid model."""
+import numpy as np
+import pytest
+from helium_api_wrapper.DataObjects import IntegrationHotspot
+
+from helium_positioning_api.weighted_centroid import centroid
+from helium_positioning_api.weighted_centroid import weighted_centroid
+
+
+def hotspot(lat: float, lng: float, rssi: float) -> IntegrationHotspot:
+    """Return a witness of an uplink.
+
+    :param lat: latitude
+    :param lng: longitude
+    :param rssi: received signal strength
+    :return: IntegrationHotspot
+    """
+    return IntegrationHotspot.construct(
+        lat=lat, lng=lng, rssi=rssi, snr=0.0, datarate="SF9BW125", frequency=868.1
+    )
+
+
+def test_weighted_centroid_uses_all_witnesses() -> None:
+    """Test that stronger witnesses pull the centroid towards them."""
+    hotspots = [
+        hotspot(47.0, 12.0, -90),
+        hotspot(47.1, 12.0, -100),
+        hotspot(47.0, 12.1, -100),
+        hotspot(None, None, -80),  # type: ignore[arg-type]
+    ]
+    prediction = weighted_centroid("device", hotspots)
+    assert prediction.model == "weighted_centroid"
+    # 10 dB stronger is 10 times the weight
+    assert prediction.lat == pytest.approx(47.0 + 0.1 / 12, abs=1e-3)
+    assert prediction.lng == pytest.approx(12.0 + 0.1 / 12, abs=1e-3)
+
+    offset = weighted_centroid("device", hotspots, weighting="offset")
+    assert offset.lat > prediction.lat
+
+    strongest = weighted_centroid("device", hotspots, top_k=1)
+    assert (strongest.lat, strongest.lng) == pytest.approx((47.0, 12.0))
+
+
+def test_centroid_across_antimeridian() -> None:
+    """Test that positions on both sides of the antimeridian are averaged."""
+    lat, lng = centroid(
+        np.array([0.0, 0.0]), np.array([179.0, -179.0]), np.array([-100.0, -100.0])
+    )
+    assert lat == pytest.approx(0.0, abs=1e-9)
+    assert abs(lng) == pytest.approx(180.0)
+
+
+def test_invalid_input() -> None:
+    """Test unknown weightings and missing locations."""
+    with pytest.raises(ValueError):
+        centroid(np.zeros(1), np.zeros(1), np.zeros(1), weighting="squared")
+    with pytest.raises(ValueError):
+        weighted_centroid("device", [hotspot(None, None, -80)])  # type: ignore[arg-type]
+    with pytest.raises(ValueError):
+        weighted_centroid("device", [hotspot(47.0, 12.0, -80)], top_k=0)
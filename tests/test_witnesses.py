@@ -0,0 +1,76 @@
+"""Test cases for the witnesses module."""
+from typing import Any
+from typing import Optional
+
+import numpy as np
+import pytest
+from helium_api_wrapper.DataObjects import IntegrationHotspot
+
+from helium_positioning_api.midpoint import midpoint
+from helium_positioning_api.nearest_neighbor import nearest_neighbor
+from helium_positioning_api.witnesses import select_witnesses
+
+
+def hotspot(
+    address: str, rssi: Optional[float], lat: Optional[float] = 47.0, **fields: Any
+) -> IntegrationHotspot:
+    """Return a hotspot of an integration.
+
+    :param address: address of the hotspot
+    :param rssi: rssi in dBm
+    :param lat: latitude
+    :param fields: other fields
+    :return: IntegrationHotspot
+    """
+    values = {"address": address, "lat": lat, "lng": 12.0, "rssi": rssi, "snr": 5.0}
+    return IntegrationHotspot.construct(**{**values, **fields})
+
+
+def test_select_witnesses_filters_and_orders() -> None:
+    """Test that invalid and duplicate witnesses are dropped, strongest first."""
+    hotspots = [
+        hotspot("a", -110.0),
+        hotspot("b", -90.0),
+        hotspot("a", -100.0),
+        hotspot("c", -80.0, lat=None),
+        hotspot("d", 20.0),
+        hotspot("e", -95.0, snr=80.0),
+        hotspot("f", None),
+        hotspot("g", -95.0, snr=None),
+    ]
+
+    witnesses = select_witnesses(hotspots)
+
+    assert [h.address for h in witnesses.hotspots] == ["b", "g", "a"]
+    assert witnesses.rssi.tolist() == [-90.0, -95.0, -100.0]
+    assert len(witnesses) == len(witnesses.lat) == len(witnesses.snr) == 3
+    unlocated = select_witnesses(hotspots, located=False)
+    assert [h.address for h in unlocated.hotspots] == ["c", "b", "g", "a"]
+
+
+def test_top_k_matches_full_sort() -> None:
+    """Test the partial selection against a stable sort, including ties."""
+    rng = np.random.default_rng(0)
+    rssi = rng.integers(-120, -100, 50).astype(float)
+    hotspots = [hotspot(str(i), value) for i, value in enumerate(rssi)]
+    expected = sorted(range(50), key=lambda i: -rssi[i])
+
+    for k in (1, 3, 10, 49, 50, 80):
+        witnesses = select_witnesses(hotspots, top_k=k)
+        assert [h.address for h in witnesses.hotspots] == [str(i) for i in expected[:k]]
+    for k in (0, -1):
+        with pytest.raises(ValueError):
+            select_witnesses(hotspots, top_k=k)
+
+
+def test_models_use_strongest_witnesses() -> None:
+    """Test that the models use the strongest witnesses with a location."""
+    hotspots = [
+        hotspot("weak", -120.0, lat=47.5),
+        hotspot("unlocated", -60.0, lat=None),
+        hotspot("strong", -70.0, lat=47.1),
+        hotspot("second", -80.0, lat=47.3),
+    ]
+
+    assert nearest_neighbor("uuid", hotspots).lat == 47.1
+    assert midpoint("uuid", hotspots).lat == pytest.approx(47.2, abs=1e-3)